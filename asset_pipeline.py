@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only keep a compressed variant when it saves at least this much
+MIN_COMPRESSION_GAIN = 0.9
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, no-cache"
+
+
+class StaticAsset:
+    """One file held in memory with its precompressed variants"""
+
+    def __init__(self, name: str, body: bytes, content_type: str):
+        self.name = name
+        if content_type.startswith(('text/', 'application/javascript')):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = {'identity': body}
+
+        if content_type.startswith(COMPRESSIBLE_TYPES):
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body) * MIN_COMPRESSION_GAIN:
+                self.variants['gzip'] = gz
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body) * MIN_COMPRESSION_GAIN:
+                    self.variants['br'] = br
+
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest}{ext}"
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}-{encoding}"'
+
+    def pick_encoding(self, accept_encoding: str) -> str:
+        accepted = {part.split(';')[0].strip() for part in (accept_encoding or "").lower().split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return 'identity'
+
+
+class AssetPipeline:
+    """Loads a static directory once and answers requests from memory.
+
+    Lookups are case-insensitive so the lowercase `/static/css/...` links in
+    the templates resolve against the `Static/` tree on disk.
+    """
+
+    def __init__(self, root: str, url_prefix: str = "/static"):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.assets = {}
+        self.by_hashed_name = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, self.root).replace(os.sep, '/').lower()
+                content_type = mimetypes.guess_type(filename)[0]
+                if content_type is None:
+                    continue  # placeholders like `Static/Static` and `*.raw`
+                with open(full_path, 'rb') as f:
+                    assets[name] = StaticAsset(name, f.read(), content_type)
+
+        self.assets = assets
+        self.by_hashed_name = {asset.hashed_name: asset for asset in assets.values()}
+
+    def lookup(self, path: str):
+        """Return (asset, is_hashed) for a request path, or (None, False)"""
+        path = path.lower()
+        if path in self.by_hashed_name:
+            return self.by_hashed_name[path], True
+        return self.assets.get(path), False
+
+    def url_for(self, name: str) -> str:
+        asset = self.assets.get(name.lower())
+        if asset is None:
+            return f"{self.url_prefix}/{name}"
+        return f"{self.url_prefix}/{asset.hashed_name}"
+
+    def rewrite_urls(self, html: str) -> str:
+        """Point every `/static/...` reference at its content-hashed URL"""
+        pattern = re.compile(re.escape(self.url_prefix) + r'/([\w./-]+)')
+        return pattern.sub(lambda m: self.url_for(m.group(1)), html)
+
+    def response_parts(self, asset: StaticAsset, accept_encoding: str, if_none_match: str, immutable: bool):
+        """Return (status, body, headers) for serving `asset`"""
+        encoding = asset.pick_encoding(accept_encoding)
+        etag = asset.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+            'Content-Type': asset.content_type,
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        if if_none_match and (if_none_match.strip() == '*' or etag in if_none_match):
+            return 304, b"", headers
+
+        body = asset.variants[encoding]
+        headers['Content-Length'] = str(len(body))
+        return 200, body, headers
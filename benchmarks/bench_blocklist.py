@@ -0,0 +1,85 @@
+"""Import and lookup cost of domain_blocklist at list sizes up to 1M domains.
+
+Writes a synthetic hosts-format list, imports it into an .rbl index and times
+lookups for unlisted domains (the common case, answered by the Bloom filter),
+listed domains and subdomains of listed domains. For comparison it also times
+the old per-URL scan over a Python list of blocked domains.
+
+    python benchmarks/bench_blocklist.py --domains 1000000
+"""
+import argparse
+import os
+import random
+import resource
+import string
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from domain_blocklist import DomainBlocklist, read_domains, write_blocklist
+
+TLDS = ['com', 'net', 'org', 'info', 'xyz', 'top', 'ru', 'io']
+
+
+def random_domain(rng) -> str:
+    name = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(6, 14)))
+    return f"{name}.{rng.choice(TLDS)}"
+
+
+def per_lookup_us(blocklist, domains) -> float:
+    start = time.perf_counter()
+    for domain in domains:
+        blocklist.match(domain)
+    return (time.perf_counter() - start) / len(domains) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    workdir = tempfile.mkdtemp(prefix="robo-blocklist-")
+    source = os.path.join(workdir, "hosts.txt")
+    listed = []
+    with open(source, 'w') as f:
+        f.write("# synthetic malware list\n")
+        for _ in range(args.domains):
+            domain = random_domain(rng)
+            listed.append(domain)
+            f.write(f"0.0.0.0 {domain}\n")
+
+    target = os.path.join(workdir, "blocklist.rbl")
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    write_blocklist(target, read_domains([source]))
+    import_s = time.perf_counter() - start
+    blocklist = DomainBlocklist(target)
+    bits = blocklist._bits if len(blocklist) else 0
+    print(f"import {len(blocklist):,} domains: {import_s:.1f}s, "
+          f"file {os.path.getsize(target) / 2**20:.1f} MB (Bloom {bits / 8 / 2**20:.2f} MB), "
+          f"peak RSS growth {(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f} MB")
+
+    misses = [f"cdn.{random_domain(rng)}" for _ in range(args.lookups)]
+    hits = rng.sample(listed, min(args.lookups, len(listed)))
+    subdomains = [f"login.{d}" for d in hits]
+    miss_us = per_lookup_us(blocklist, misses)
+    probes = blocklist.stats['index_probes']
+    print(f"unlisted:  {miss_us:.2f} µs/lookup, Bloom false positives needing the index: "
+          f"{probes / len(misses):.2%} of lookups")
+    print(f"listed:    {per_lookup_us(blocklist, hits):.2f} µs/lookup")
+    print(f"subdomain: {per_lookup_us(blocklist, subdomains):.2f} µs/lookup")
+
+    blocked_list = listed[:min(len(listed), 100_000)]
+    sample = misses[:50]
+    start = time.perf_counter()
+    for domain in sample:
+        any(blocked in domain for blocked in blocked_list)
+    scan_us = (time.perf_counter() - start) / len(sample) * 1e6
+    print(f"old list scan over {len(blocked_list):,} domains: {scan_us:,.0f} µs/lookup "
+          f"(grows linearly; ~{scan_us * len(listed) / len(blocked_list):,.0f} µs at {len(listed):,})")
+
+
+if __name__ == "__main__":
+    main()
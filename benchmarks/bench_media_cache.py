@@ -0,0 +1,91 @@
+"""Exercise media_cache.MediaCache against a local HTTP stand-in.
+
+Serves generated files from a temp dir with http.server and reports miss /
+hit latency, background revalidation, LRU eviction and peak RSS while a
+large file is streamed to disk.
+
+    python benchmarks/bench_media_cache.py --big-mb 50
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from media_cache import MediaCache
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(directory: str):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+async def run(args):
+    site = tempfile.mkdtemp(prefix="robo-site-")
+    for name, size in [('meme1.jpg', 200_000), ('meme2.jpg', 300_000), ('clip.mp4', args.big_mb * 1024 * 1024)]:
+        with open(os.path.join(site, name), 'wb') as f:
+            for offset in range(0, size, 1024 * 1024):
+                f.write(os.urandom(min(1024 * 1024, size - offset)))
+    with open(os.path.join(site, 'meme1.jpg'), 'rb') as src, open(os.path.join(site, 'copy.jpg'), 'wb') as dst:
+        dst.write(src.read())
+
+    server, base = serve(site)
+    cache = MediaCache(tempfile.mkdtemp(prefix="robo-cache-"), max_bytes=args.big_mb * 1024 * 1024 + 400_000)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    await cache.get(f"{base}/clip.mp4")
+    big_ms = (time.perf_counter() - start) * 1000
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+    print(f"miss {args.big_mb} MB video: {big_ms:.0f} ms, peak RSS growth {rss_growth:.1f} MB")
+
+    start = time.perf_counter()
+    await cache.get(f"{base}/meme1.jpg")
+    miss_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for _ in range(1000):
+        await cache.get(f"{base}/meme1.jpg")
+    hit_us = (time.perf_counter() - start) * 1000
+    print(f"miss meme: {miss_ms:.1f} ms, hit: {hit_us:.1f} µs")
+
+    await cache.get(f"{base}/copy.jpg")
+    blobs = {e['digest'] for e in cache.entries.values()}
+    print(f"identical content under two URLs -> {len(cache.entries)} entries, {len(blobs)} blobs")
+
+    cache.max_age = 0
+    await cache.get(f"{base}/meme1.jpg")
+    while cache._in_flight:
+        await asyncio.sleep(0.01)
+    print(f"stale entry revalidated in background (304 keeps digest): "
+          f"{cache.entries[f'{base}/meme1.jpg']['digest'][:12]}")
+
+    await cache.get(f"{base}/meme2.jpg")
+    print(f"after exceeding the {cache.max_bytes / 2**20:.1f} MB cap: cached {len(cache.entries)} urls, "
+          f"{cache.total_bytes / 2**20:.1f} MB, video evicted: {f'{base}/clip.mp4' not in cache.entries}")
+
+    os.remove(cache.blob_path(cache.entries[f"{base}/meme2.jpg"]['digest']))
+    with await cache.open(f"{base}/meme2.jpg") as f:
+        print(f"blob removed behind the cache's back: open() fetched it again ({len(f.read())} bytes)")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--big-mb", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
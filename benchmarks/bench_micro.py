@@ -0,0 +1,187 @@
+"""Micro-benchmarks for the pure functions on the per-message path, with a regression gate.
+
+Each case is timed with timeit (loops of at least MIN_ROUND_SECONDS,
+--repeat rounds) and reported as the best time per call. Every round also
+times a fixed pure-Python calibration loop right before the case. The gate
+compares best case time / best calibration time, not raw nanoseconds. That
+cancels out the CPU's speed, so a baseline saved on one machine gates runs
+on another. Noise only ever adds time, so the best of each is the steadiest
+figure; a ratio per round would let a slow calibration round pass for a
+fast case. Cases faster than SMALL_CASE_US still jitter by more than a real
+regression would, so they get SMALL_CASE_FACTOR times the tolerance. A case
+over the limit is measured again up to CONFIRM_RUNS times and keeps its
+best figure, so only a slowdown that shows up every time fails the check.
+
+    python benchmarks/bench_micro.py                 # print timings
+    python benchmarks/bench_micro.py --save          # write baseline.json
+    python benchmarks/bench_micro.py --check         # exit 1 if a case regressed
+    python benchmarks/bench_micro.py --check --tolerance 15 --filter leaderboard
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import date, timedelta
+
+from common import load_bot, sample_rank_user
+
+from rank_cards import RankCardGenerator
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 25  # percent slower than baseline before --check fails
+MIN_ROUND_SECONDS = 0.2  # per round; timeit's autorange stops at 0.2 s total, too short for µs cases
+SMALL_CASE_US = 10  # cases faster than this per call...
+SMALL_CASE_FACTOR = 2  # ...get this many times the tolerance
+CONFIRM_RUNS = 2  # extra measurements of a case over the limit before it counts as a regression
+
+MESSAGES = [
+    "hey everyone, check https://www.github.com/python/cpython/pull/1234 when you can",
+    "no links here, just a fairly ordinary message about lunch plans and the weekend match",
+    "free stuff at http://bit.ly/3xYz and https://d0wnl0ad-f1les.example.ru/get?id=42 hurry",
+    "lol " * 40,
+]
+DOMAINS = ["github.com", "bit.ly", "d0wnl0ad-f1les.example.ru", "docs.python.org", "t.co", "aaa-bbb.io"]
+
+
+def calibration_work():
+    total = 0
+    for i in range(1000):
+        total += i * i % 7
+    return total
+
+
+def loop_count(timer: timeit.Timer) -> int:
+    """Calls per round so that one round takes at least MIN_ROUND_SECONDS"""
+    number, elapsed = timer.autorange()
+    return max(number, int(number * MIN_ROUND_SECONDS / elapsed) + 1)
+
+
+def measure(fn, repeat: int) -> tuple:
+    """(best seconds per call, that as a multiple of calibration_work's best)"""
+    timer, unit_timer = timeit.Timer(fn), timeit.Timer(calibration_work)
+    number, unit_number = loop_count(timer), loop_count(unit_timer)
+    times, units = [], []
+    for _ in range(repeat):
+        units.append(unit_timer.timeit(unit_number) / unit_number)
+        times.append(timer.timeit(number) / number)
+    return min(times), min(times) / min(units)
+
+
+def build_cases(bot) -> dict:
+    """name -> zero-argument callable. Inputs are built here so only the function itself is timed"""
+    rules = bot.rule_store.rules
+    cases = {
+        'clean_domain': lambda: [bot.clean_domain(url) for url in ("https://www.GitHub.com/a/b", "http://bit.ly/x")],
+        'is_shortener': lambda: [bot.is_shortener(d) for d in DOMAINS],
+        'is_obfuscated': lambda: [bot.is_obfuscated(d) for d in DOMAINS],
+        'url_regex': lambda: [bot.URL_PATTERN.findall(text) for text in MESSAGES],
+        'banned_word_scan': lambda: [rules.banned_word(text) for text in MESSAGES],
+        'get_rank_title': lambda: [bot.get_rank_title(level) for level in (0, 1, 15, 30, 45)],
+        'generate_progress_bar': lambda: [bot.generate_progress_bar(p) for p in (0, 37, 100)],
+    }
+
+    user = sample_rank_user(bot)
+    generator = RankCardGenerator(bot.RANK_CARD_FORMAT, bot.RANK_CARD_QUALITY, bot.RANK_CARD_OPTIMIZE)
+    cases['create_rank_card'] = lambda: generator.create_rank_card(user)
+
+    rng = random.Random(7)
+    today = date.today()
+    for n in (100, 1000, 10000):
+        users = {
+            uid: {'name': f"user{uid}", 'username': f"u{uid}", 'xp': rng.randint(0, 50000),
+                  'level': rng.randint(1, 30), 'last_active': today - timedelta(days=rng.randint(0, 60))}
+            for uid in range(n)
+        }
+        shards = {1: {'users': users, 'leaderboard': bot.LeaderboardIndex(), 'exported_version': None, 'card': None}}
+
+        def rebuild(shards=shards):
+            bot.user_data['ranking']['chats'] = shards
+            bot.update_leaderboard()
+        cases[f'update_leaderboard[{n}]'] = rebuild
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--save", action="store_true", help=f"write results to {os.path.basename(BASELINE_PATH)}")
+    parser.add_argument("--check", action="store_true", help="compare with the baseline, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, help=f"percent; default from the baseline or {DEFAULT_TOLERANCE}")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    bot = load_bot()
+    saved_chats = bot.user_data['ranking']['chats']
+    cases = {name: fn for name, fn in build_cases(bot).items() if args.filter in name}
+    results = {}
+    try:
+        for name, fn in cases.items():
+            seconds, relative = measure(fn, args.repeat)
+            results[name] = {'us': seconds * 1e6, 'relative': relative}
+    finally:
+        bot.user_data['ranking']['chats'] = saved_chats
+
+    baseline = {}
+    if args.check or not args.save:
+        try:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            if args.check:
+                sys.exit(f"No baseline at {args.baseline}; run with --save first")
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get('tolerance_pct', DEFAULT_TOLERANCE)
+
+    def change_pct(name):
+        base = baseline.get('cases', {}).get(name)
+        return (results[name]['relative'] / base['relative'] - 1) * 100 if base else None
+
+    def over_limit(name):
+        pct = change_pct(name)
+        if pct is None:
+            return False
+        return pct > tolerance * (SMALL_CASE_FACTOR if baseline['cases'][name]['us'] < SMALL_CASE_US else 1)
+
+    if args.check:
+        try:
+            for name in cases:
+                for _ in range(CONFIRM_RUNS):
+                    if not over_limit(name):
+                        break
+                    seconds, relative = measure(cases[name], args.repeat)
+                    if relative < results[name]['relative']:
+                        results[name] = {'us': seconds * 1e6, 'relative': relative}
+        finally:
+            bot.user_data['ranking']['chats'] = saved_chats
+
+    print(f"{'case':<28}{'us/call':>12}{'x unit':>10}{'vs baseline':>14}")
+    regressions = []
+    for name, result in results.items():
+        pct = change_pct(name)
+        change = ""
+        if pct is not None:
+            change = f"{pct:+.1f}%"
+            if over_limit(name):
+                regressions.append((name, pct))
+                change += " !"
+        print(f"{name:<28}{result['us']:>12.2f}{result['relative']:>10.3f}{change:>14}")
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'tolerance_pct': tolerance, 'python': sys.version.split()[0], 'cases': results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+    if args.check:
+        if regressions:
+            print(f"\n{len(regressions)} case(s) more than {tolerance:g}% slower than baseline "
+                  f"({tolerance * SMALL_CASE_FACTOR:g}% under {SMALL_CASE_US} µs):")
+            for name, pct in regressions:
+                print(f"  {name}: {pct:+.1f}%")
+            sys.exit(1)
+        print(f"\nNo case more than {tolerance:g}% slower than baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Resident memory of one more bot when several run in one process with multi_bot.py.
+
+Each mode runs in a fresh child process that loads --bots bots with fake
+tokens (nothing connects to Telegram) and reports how much RSS every
+load added. The first bot also pays for importing telegram, PIL and the
+rest, so the per-extra-bot figure is the average over the others. The
+--fill option gives every bot that many ranked users and
+sends a rank card and leaderboard render through the bot's pool, so fonts
+and runtime state are part of the picture.
+
+    python benchmarks/bench_multibot.py [--bots 5] [--fill 2000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import date
+
+from common import ROOT, sample_rank_user
+
+
+def child(bots: int, share: bool, fill: int):
+    sys.path.insert(0, ROOT)
+    import multi_bot
+    from memory_budget import current_rss
+
+    state = tempfile.mkdtemp(prefix="robo-multibot-")
+    with open(os.path.join(state, "bots.json"), 'w', encoding='utf-8') as f:
+        json.dump({'state_dir': state, 'bots': [{'name': f"bot{i}", 'token': f"{i + 1}:fake"} for i in range(bots)]}, f)
+    config = multi_bot.load_config(os.path.join(state, "bots.json"))
+
+    growth = []
+    for bot, module, added in multi_bot.load_bots(config, share=share):
+        before = current_rss()
+        if fill:
+            shard = module.get_chat_ranking(1)
+            for uid in range(fill):
+                shard['users'][uid] = {'name': f"user{uid}", 'username': f"u{uid}", 'xp': uid * 7 % 5000,
+                                       'level': uid % 30 + 1, 'last_active': date.today(), 'daily_streak': 0,
+                                       'total_messages': uid, 'voice_messages': 0, 'photos_sent': 0}
+            module.update_leaderboard()
+            module.render_rank_card(module.RANK_CARD_SETTINGS, sample_rank_user(module))
+            entries = [{'rank': 1, 'name': "A", 'username': "a", 'level': 3}]
+            module.render_leaderboard_card(module.RANK_CARD_SETTINGS, entries, "Top")
+        growth.append(added + current_rss() - before)
+    print(json.dumps({'growth': growth, 'rss': current_rss()}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=5)
+    parser.add_argument("--fill", type=int, default=2000, help="ranked users per bot")
+    parser.add_argument("--child", choices=("shared", "separate"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.bots, args.child == "shared", args.fill)
+        return
+
+    print(f"{'mode':<10}{'first bot':>12}{'per extra bot':>16}{'total RSS':>12}")
+    for mode in ("separate", "shared"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--bots", str(args.bots), "--fill", str(args.fill)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        first, extra = result['growth'][0], result['growth'][1:]
+        per_extra = sum(extra) / len(extra) if extra else 0
+        print(f"{mode:<10}{first / 2**20:>10.1f}MB{per_extra / 2**20:>14.2f}MB{result['rss'] / 2**20:>10.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Encode time vs. upload size for rank card formats.
+
+    python benchmarks/bench_rank_card.py --repeat 20
+"""
+import argparse
+import time
+
+from common import load_bot, sample_rank_user
+
+from image_encoding import BUDGET_CANDIDATES, encode_image, encode_within_budget
+from rank_cards import RankCardGenerator
+
+CASES = [
+    ('png', 0, False), ('png', 0, True),
+    ('png8', 0, False), ('png8', 0, True),
+    ('webp', 90, False), ('webp', 75, False), ('webp', 75, True),
+    ('jpeg', 85, False), ('jpeg', 70, True),
+]
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=12000, help="bytes, for the size-budget row")
+    args = parser.parse_args()
+
+    bot = load_bot()
+    generator = RankCardGenerator()
+    user = sample_rank_user(bot)
+    draw_ms, image = timed(lambda: generator.draw_rank_card(user), args.repeat)
+    print(f"draw: {draw_ms:.1f} ms ({image.width}x{image.height})\n")
+
+    baseline = len(encode_image(image, 'png'))
+    print(f"{'format':<10}{'quality':>8}{'optimize':>10}{'encode ms':>11}{'bytes':>9}{'vs png':>8}")
+    for fmt, quality, optimize in CASES:
+        ms, data = timed(lambda: encode_image(image, fmt, quality, optimize), args.repeat)
+        print(f"{fmt:<10}{quality or '-':>8}{str(optimize):>10}{ms:>11.2f}{len(data):>9}{len(data) / baseline:>8.0%}")
+
+    ms, (fmt, quality, data) = timed(lambda: encode_within_budget(image, args.budget), args.repeat)
+    print(f"\nbudget {args.budget} B -> {fmt} q{quality}: {len(data)} B in {ms:.2f} ms "
+          f"(candidates: {', '.join(f'{f}/{q}' for f, q in BUDGET_CANDIDATES)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Precision / recall / throughput of the near-duplicate spam detector.
+
+Builds a synthetic chat stream: ordinary chatter drawn from a word list,
+interleaved with spam waves where one template is posted by many accounts
+with small edits (swapped characters, emoji, changed numbers and links).
+
+    python benchmarks/bench_spam.py --messages 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from spam_detector import NearDuplicateDetector
+
+WORDS = (
+    "the a to and is it you that of in for on this was with but have what are just not so "
+    "like be do can if get at my all we they one about out up me know no will think your "
+    "game bot rank level python code today tomorrow meeting lunch coffee weekend match team "
+    "really good bad nice cool thanks yes maybe later sure great lol okay hello anyone here "
+    "working problem error fixed update release server phone music movie book train rain"
+).split()
+
+SPAM_TEMPLATES = [
+    "🔥 Earn $500 daily from home with crypto trading! DM me now or visit {link} limited spots",
+    "Congratulations! You have been selected for a free iPhone 15, claim it here {link} before midnight",
+    "Join the best investment group, 300% profit guaranteed every week, contact {link} today",
+    "Hot singles in your area want to meet you tonight, click {link} and sign up for free",
+    "Airdrop live now! Connect your wallet at {link} to receive 1000 free tokens instantly",
+]
+
+EMOJI = ["🔥", "💰", "🚀", "✅", "💎", "👉"]
+
+
+def chatter(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+
+
+def mutate(rng: random.Random, template: str) -> str:
+    text = template.format(link=f"t.me/+{rng.randrange(10**6):06d}")
+    chars = list(text)
+    for _ in range(rng.randint(0, 2)):
+        i = rng.randrange(len(chars))
+        chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    text = "".join(chars)
+    if rng.random() < 0.5:
+        text = f"{rng.choice(EMOJI)} {text}"
+    if rng.random() < 0.3:
+        text = text.replace("500", str(rng.randint(300, 999)))
+    return text
+
+
+def build_stream(rng: random.Random, messages: int, spam_ratio: float, chats: int):
+    stream = []
+    now = 0.0
+    for _ in range(messages):
+        now += rng.expovariate(20)
+        chat_id = rng.randrange(chats)
+        if rng.random() < spam_ratio:
+            template = SPAM_TEMPLATES[chat_id % len(SPAM_TEMPLATES)]
+            stream.append((chat_id, 10**6 + rng.randrange(5000), mutate(rng, template), now, True))
+        else:
+            stream.append((chat_id, rng.randrange(2000), chatter(rng), now, False))
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--spam-ratio", type=float, default=0.1)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stream = build_stream(rng, args.messages, args.spam_ratio, args.chats)
+    detector = NearDuplicateDetector()
+
+    tp = fp = fn = 0
+    start = time.perf_counter()
+    for chat_id, user_id, text, now, is_spam in stream:
+        flagged = detector.check(chat_id, user_id, text, now)
+        if flagged and is_spam:
+            tp += 1
+        elif flagged:
+            fp += 1
+        elif is_spam:
+            fn += 1
+    elapsed = time.perf_counter() - start
+
+    avg_len = sum(len(m[2]) for m in stream) / len(stream)
+    print(f"messages:   {len(stream)} ({sum(m[4] for m in stream)} spam, avg {avg_len:.0f} chars)")
+    print(f"precision:  {tp / max(1, tp + fp):.3f}")
+    print(f"recall:     {tp / max(1, tp + fn):.3f}  (the first {detector.min_users - 1} copies per wave are let through by design)")
+    print(f"throughput: {len(stream) / elapsed:,.0f} msg/s ({elapsed / len(stream) * 1e6:.1f} µs/msg)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Requests-per-second benchmark for web_server.py.
+
+Compares the in-memory asset pipeline against the old per-request
+`render_template` / `send_from_directory` handlers on the same files.
+
+    python benchmarks/bench_static.py --seconds 5 --clients 8
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def extract_templates() -> str:
+    # `templates` ships as a zip archive in this repo
+    target = tempfile.mkdtemp(prefix="robo-templates-")
+    with zipfile.ZipFile(os.path.join(ROOT, "templates")) as archive:
+        archive.extractall(target)
+    return os.path.join(target, "templates")
+
+
+def legacy_app(template_dir: str):
+    from flask import Flask, render_template, send_from_directory
+
+    app = Flask("legacy", static_folder=None, template_folder=template_dir)
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    @app.route('/static/<path:path>')
+    def send_static(path):
+        # Old handler pointed at 'static'; use the real directory so both serve the same bytes
+        return send_from_directory(os.path.join(ROOT, 'Static'), path)
+
+    return app
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def hammer(base_url: str, path: str, headers: dict, seconds: float, clients: int):
+    counts = [0] * clients
+    sizes = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def worker(slot):
+        while time.perf_counter() < deadline:
+            req = urllib.request.Request(base_url + path, headers=headers)
+            try:
+                with urllib.request.urlopen(req) as resp:
+                    sizes[slot] += len(resp.read())
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+            counts[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = sum(counts)
+    return total / seconds, (sum(sizes) / total) if total else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    template_dir = extract_templates()
+    os.environ["TEMPLATE_DIR"] = template_dir
+    import web_server
+
+    legacy = serve(legacy_app(template_dir))
+    pipeline = serve(web_server.app)
+
+    css_hashed = web_server.assets.url_for('css/style.css')
+    logo_hashed = web_server.assets.url_for('images/robo-logo.jpg')
+    css_etag = web_server.assets.lookup('css/style.css')[0].etag('gzip')
+
+    cases = [
+        ("landing page", '/', '/', {}),
+        ("style.css", '/static/css/style.css', css_hashed, {}),
+        ("style.css gzip", '/static/css/style.css', css_hashed, {'Accept-Encoding': 'gzip'}),
+        ("style.css br", '/static/css/style.css', css_hashed, {'Accept-Encoding': 'br'}),
+        ("style.css 304", '/static/css/style.css', css_hashed,
+         {'Accept-Encoding': 'gzip', 'If-None-Match': css_etag}),
+        ("robo-logo.jpg", '/static/Images/robo-logo.jpg', logo_hashed, {}),
+    ]
+
+    print(f"{'case':<18}{'legacy rps':>12}{'pipeline rps':>14}{'speedup':>9}{'bytes/resp':>12}")
+    for label, legacy_path, pipeline_path, headers in cases:
+        base = f"http://127.0.0.1:{legacy.server_port}"
+        legacy_rps, _ = hammer(base, legacy_path, headers, args.seconds, args.clients)
+        base = f"http://127.0.0.1:{pipeline.server_port}"
+        pipeline_rps, size = hammer(base, pipeline_path, headers, args.seconds, args.clients)
+        print(f"{label:<18}{legacy_rps:>12.0f}{pipeline_rps:>14.0f}"
+              f"{pipeline_rps / legacy_rps:>8.1f}x{size:>12.0f}")
+
+    legacy.shutdown()
+    pipeline.shutdown()
+
+
+if __name__ == "__main__":
+    main()
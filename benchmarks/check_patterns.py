@@ -0,0 +1,85 @@
+"""Regression gate for safe_patterns.check_pattern.
+
+Every pattern in ACCEPT must pass the check and every pattern in REJECT
+must raise UnsafePattern. Accepted patterns are also timed with search()
+against adversarial messages of Telegram's maximum length. Exits 1 on any
+wrong verdict and on an accepted pattern slower than --limit ms.
+
+    python benchmarks/check_patterns.py [--limit 20]
+"""
+import argparse
+import re
+import sys
+import time
+
+from common import ROOT
+
+sys.path.insert(0, ROOT)
+from safe_patterns import UnsafePattern, check_pattern  # noqa: E402
+
+MESSAGE_LENGTH = 4096
+ACCEPT = [
+    r'(?i)how are you', r'(?i)thank you', r'hello|hi|hey', r'\bgood (morning|night)\b', r'colou?r',
+    r'^price: \$\d{1,6}$', r'(?i)^(hi|hello)[!.]*$', r'https?://[$-_a-zA-Z@.&+!*\\(),]+',
+    # Class ranges under IGNORECASE: 'ß'.upper() is two characters
+    r'[a-z]', r'[0-9]', r'order #[0-9]', r'(?i)[a-zß]x',
+    r'hello\s+world', r'order #\d+ shipped', r'^a\w*z', r'(?i)i love [^i]* pizza',
+    # Repeats over the same characters with something between that the first cannot consume
+    r'hello\s+world\s+again', r'x\d+\.\d+', r'^\d{1,3}(,\d{3})*$', r'[a-z]{2,10}@[a-z]{2,10}',
+]
+REJECT = [
+    r'(a+)+$', r'(a*)*b', r'(a|aa)+$', r'(a{1,3})+x', r'(\w+\s?)+$', r'(x|xy|z)+q',
+    r'\d+\d+x', r'.*.*=.*', r'\w+\s*\w+!', r'(\w|\d)+$', r'\d+\.\d+', r'\s*$',
+    r'(a)\1', r'(?=x)', 'x' * 300,
+    # Overlapping quantifiers with literals between them are polynomial: n^k for k of them
+    r'a.*b.*c', r'x.*a.*a.*a.*a.*z', r'x\w+ ?\w+!',
+    # Counted repeats multiply too: 101^3 ways to split a run of a's
+    r'a{0,100}a{0,100}a{0,100}x', r'[a-z]{1,100}[a-z]{1,100}[a-z]{1,100}!',
+    # One quantifier over the first character is retried from every position
+    r'a\w*z', r'(?i)hi.*there',
+]
+ADVERSARIAL = [
+    'a' * MESSAGE_LENGTH, 'a ' * (MESSAGE_LENGTH // 2), '1' * MESSAGE_LENGTH, ' ' * (MESSAGE_LENGTH - 1) + 'x',
+    'ab' * (MESSAGE_LENGTH // 2), 'x@' * (MESSAGE_LENGTH // 2), 'hhttp://' * (MESSAGE_LENGTH // 8),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=float, default=20, help="ms per search allowed for accepted patterns")
+    args = parser.parse_args()
+
+    failures = []
+    for pattern in ACCEPT:
+        try:
+            check_pattern(pattern, re.IGNORECASE)
+        except UnsafePattern as e:
+            failures.append(f"rejected {pattern!r}: {e}")
+            continue
+        compiled = re.compile(pattern, re.IGNORECASE)
+        worst = 0.0
+        for text in ADVERSARIAL:
+            started = time.perf_counter()
+            compiled.search(text)
+            worst = max(worst, (time.perf_counter() - started) * 1000)
+        print(f"ok      {pattern[:40]:<42}{worst:8.2f} ms")
+        if worst > args.limit:
+            failures.append(f"accepted {pattern!r} but it took {worst:.1f} ms")
+    for pattern in REJECT:
+        try:
+            check_pattern(pattern, re.IGNORECASE)
+        except UnsafePattern as e:
+            print(f"reject  {pattern[:40]:<42}{e}")
+            continue
+        failures.append(f"accepted {pattern!r}")
+
+    if failures:
+        print(f"\n{len(failures)} failure(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll verdicts as expected")
+
+
+if __name__ == "__main__":
+    main()
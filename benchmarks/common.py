@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def load_bot():
+    """Import `main (2).py`, whose file name is not a valid module name.
+    Files the bot creates on import go to a temporary directory unless set in the environment"""
+    if 'robo_bot' in sys.modules:
+        return sys.modules['robo_bot']
+    os.environ.setdefault("RANKING_SPILL_PATH", os.path.join(tempfile.mkdtemp(prefix="robo-bench-"), "ranking_spill.db"))
+    spec = importlib.util.spec_from_file_location('robo_bot', os.path.join(ROOT, 'main (2).py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['robo_bot'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def sample_rank_user(bot, level: int = 7, xp: int = 2650) -> dict:
+    return {
+        'name': "Benchmark User", 'username': "bench_user", 'level': level, 'xp': xp, 'rank': 42,
+        'daily_streak': 3, 'settings': bot.user_data['ranking']['settings'], 'user_id': 1
+    }
@@ -0,0 +1,147 @@
+"""Replay a join/message timeline through the bot's handlers on a simulated clock.
+
+Without --events, a synthetic raid is generated: a trickle of normal joins,
+then a burst of raid accounts that join and post links or flood messages,
+then quiet. Each event is passed to welcome_new_member, anti_link and
+flood_control, and check_raids runs every RAID_CHECK_INTERVAL simulated
+seconds. The script prints every Telegram API call the bot makes, stamped
+with simulated time, so you can read off when the lockdown starts and
+lifts, which welcomes are suppressed, and what happens to new accounts.
+
+Recorded timelines are JSON lines:
+    {"t": 12.5, "type": "join", "chat": 1, "user": 42, "name": "Ann"}
+    {"t": 13.0, "type": "message", "chat": 1, "user": 42, "name": "Ann", "text": "hi"}
+
+    python benchmarks/replay_raid.py [--events timeline.jsonl] [--quiet]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+from common import load_bot
+
+SIM = SimpleNamespace(now=0.0)
+
+
+class RecordingBot:
+    """Stands in for telegram.Bot: every call is logged with the simulated time"""
+
+    def __init__(self, quiet: bool):
+        self.calls = []
+        self.quiet = quiet
+
+    def __getattr__(self, method):
+        async def call(*args, **kwargs):
+            self.calls.append((SIM.now, method, kwargs))
+            if not self.quiet:
+                detail = kwargs.get('text') or kwargs.get('permissions') or kwargs.get('user_id', '')
+                print(f"[{SIM.now:7.1f}s] {method}: {str(detail)[:110]}")
+            if method == 'get_chat':
+                return SimpleNamespace(permissions=None)
+            return SimpleNamespace(message_id=len(self.calls), chat_id=kwargs.get('chat_id'))
+        return call
+
+
+def make_update(event: dict, bot: RecordingBot):
+    async def no_admins():
+        return []
+
+    async def delete():
+        await getattr(bot, 'delete_message')(chat_id=event['chat'], user_id=event['user'])
+
+    user = SimpleNamespace(id=event['user'], first_name=event['name'], username=event['name'].lower())
+    chat = SimpleNamespace(id=event['chat'], title="Replay chat", get_administrators=no_admins)
+    message = SimpleNamespace(
+        text=event.get('text'), date=datetime.fromtimestamp(1_700_000_000 + event['t']), delete=delete,
+        new_chat_members=[user] if event['type'] == 'join' else [], message_id=0
+    )
+    return SimpleNamespace(message=message, effective_message=message, effective_user=user, effective_chat=chat)
+
+
+def synthetic_timeline(seed: int = 1) -> list:
+    rng = random.Random(seed)
+    events = []
+    for i in range(10):  # ordinary growth: one join every ~30s
+        t = i * 30 + rng.random() * 5
+        events.append({'t': t, 'type': 'join', 'chat': 1, 'user': 1000 + i, 'name': f"Member{i}"})
+        events.append({'t': t + 10, 'type': 'message', 'chat': 1, 'user': 1000 + i, 'name': f"Member{i}",
+                       'text': "hello everyone"})
+    for i in range(120):  # raid: 120 accounts in ~40s
+        t = 320 + i / 3
+        events.append({'t': t, 'type': 'join', 'chat': 1, 'user': 5000 + i, 'name': f"Raider{i}"})
+    for i in range(120):  # after the lockdown lifts raiders try links and floods
+        t = 460 + i / 2
+        text = "free crypto at https://example-giveaway.com" if i % 2 else f"spam wave {i}"
+        events.append({'t': t, 'type': 'message', 'chat': 1, 'user': 5000 + i % 40, 'name': f"Raider{i % 40}",
+                       'text': text})
+    for i in range(5):  # a regular member keeps chatting, links included
+        events.append({'t': 480 + i * 7, 'type': 'message', 'chat': 1, 'user': 1003, 'name': "Member3",
+                       'text': "docs are at https://github.com/python"})
+    events.append({'t': 1200, 'type': 'join', 'chat': 1, 'user': 9000, 'name': "Latecomer"})
+    return sorted(events, key=lambda e: e['t'])
+
+
+async def replay(bot_module, events: list, quiet: bool):
+    bot = RecordingBot(quiet)
+    context = SimpleNamespace(bot=bot, args=[])
+    bot_module.raid_detector = bot_module.RaidDetector(
+        threshold=bot_module.RAID_JOIN_THRESHOLD, window=bot_module.RAID_WINDOW,
+        cooldown=bot_module.RAID_COOLDOWN, probation=bot_module.NEW_MEMBER_PROBATION, clock=lambda: SIM.now
+    )
+    bot_module.user_data['link_protection']['mode'] = "blacklist"
+    bot_module.CATCHUP_STALE_AGE = float('inf')  # simulated message dates are in the past; still answer them
+
+    next_check = bot_module.RAID_CHECK_INTERVAL
+    end = events[-1]['t'] + bot_module.RAID_COOLDOWN + 2 * bot_module.RAID_CHECK_INTERVAL
+    for event in events + [{'t': end, 'type': 'end'}]:
+        while next_check <= event['t']:
+            SIM.now = next_check
+            await bot_module.check_raids(context)
+            next_check += bot_module.RAID_CHECK_INTERVAL
+        SIM.now = event['t']
+        if event['type'] == 'join':
+            await bot_module.welcome_new_member(make_update(event, bot), context)
+        elif event['type'] == 'message':
+            update = make_update(event, bot)
+            await bot_module.anti_link(update, context)
+            await bot_module.flood_control(update, context)
+    await asyncio.sleep(bot_module.GREETING_BATCH_WINDOW + 0.5)  # flush pending welcome batches
+    return bot.calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", help="JSON-lines timeline; default is a synthetic raid")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    state = tempfile.mkdtemp(prefix="robo-replay-")
+    os.environ.setdefault("PUNISHMENTS_PATH", os.path.join(state, "punishments.json"))
+    os.environ.setdefault("MODERATION_RULES_PATH", os.path.join(state, "rules.json"))
+    bot_module = load_bot()
+    if args.events:
+        with open(args.events, encoding='utf-8') as f:
+            events = sorted((json.loads(line) for line in f if line.strip()), key=lambda e: e['t'])
+    else:
+        events = synthetic_timeline()
+
+    calls = asyncio.run(replay(bot_module, events, args.quiet))
+    kinds = Counter(method for _, method, _ in calls)
+    joins = sum(1 for e in events if e['type'] == 'join')
+    locks = [t for t, method, kw in calls if method == 'set_chat_permissions']
+    print(f"\n{len(events)} events, {joins} joins -> {dict(kinds)}")
+    if locks:
+        print(f"lockdown at {locks[0]:.0f}s, permissions restored at {locks[1]:.0f}s" if len(locks) > 1
+              else f"lockdown at {locks[0]:.0f}s, never lifted")
+    else:
+        print("no lockdown")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import time
+
+DELETE_BATCH = 100  # message ids per deleteMessages call, the Bot API maximum
+
+
+class CatchUp:
+    """Backlog mode for the updates that piled up while the bot was down.
+
+    The first update older than `enter_age` seconds turns it on. It turns
+    off at the first update younger than `exit_age`, or after `idle`
+    seconds with no updates at all. While it is on, callers queue message
+    deletes per chat so they can go out through deleteMessages, and fold
+    XP per user so it can be applied once, without a notice per message.
+    """
+
+    def __init__(self, enter_age: float = 60, exit_age: float = 10, idle: float = 5, clock=time.monotonic):
+        self.enter_age = enter_age
+        self.exit_age = exit_age
+        self.idle = idle
+        self.clock = clock
+        self.active = False
+        self.started = None
+        self.last_update = None
+        self.deletes = {}  # chat_id -> [message_id, ...]
+        self.xp = {}  # (chat_id, user_id) -> [messages, xp, name, username]
+        self.run = None  # counters for the backlog being processed
+        self.last_run = None
+        self.stats = {'runs': 0, 'dropped_replies': 0}
+
+    def observe(self, age: float) -> bool:
+        """Note one update's age. True when it ends catch-up and the caller should finish()"""
+        now = self.last_update = self.clock()
+        if self.active:
+            self.run['updates'] += 1
+            return age < self.exit_age
+        if age > self.enter_age:
+            self.active, self.started = True, now
+            self.run = {'updates': 1, 'backlog': age, 'deletes': 0, 'delete_calls': 0, 'folded': 0, 'dropped': 0}
+        return False
+
+    def stalled(self) -> bool:
+        """Catch-up is on but updates stopped coming, so the backlog is drained"""
+        return self.active and self.clock() - self.last_update > self.idle
+
+    def queue_delete(self, chat_id: int, message_id: int):
+        """Queue a delete; returns a full batch of ids the caller should send now, else None"""
+        batch = self.deletes.setdefault(chat_id, [])
+        batch.append(message_id)
+        self.run['deletes'] += 1
+        if len(batch) < DELETE_BATCH:
+            return None
+        del self.deletes[chat_id]
+        self.run['delete_calls'] += 1
+        return batch
+
+    def fold_xp(self, chat_id: int, user_id: int, name: str, username: str, xp: int):
+        entry = self.xp.get((chat_id, user_id))
+        if entry is None:
+            self.xp[(chat_id, user_id)] = [1, xp, name, username]
+        else:
+            entry[0] += 1
+            entry[1] += xp
+        self.run['folded'] += 1
+
+    def drop(self):
+        """Count a fun reply skipped because its message was stale"""
+        self.stats['dropped_replies'] += 1
+        if self.active:
+            self.run['dropped'] += 1
+
+    def finish(self) -> tuple:
+        """Leave catch-up: returns (pending deletes, folded XP, run report)"""
+        deletes, xp = self.deletes, self.xp
+        self.deletes, self.xp = {}, {}
+        self.run['delete_calls'] += len(deletes)
+        self.run['seconds'] = self.clock() - self.started
+        self.run['users'] = len(xp)
+        self.active, self.last_run = False, self.run
+        self.stats['runs'] += 1
+        return deletes, xp, self.run
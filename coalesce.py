@@ -0,0 +1,61 @@
+import asyncio
+import hashlib
+
+from session_store import SessionStore
+
+
+class CallbackCoalescer:
+    """Collapses repeated button taps into one unit of work.
+
+    Taps that share a key (user + message) while that key's work is running
+    wait for the same task instead of starting their own. Taps that arrive
+    within `debounce` seconds of it finishing are dropped. `unchanged()`
+    remembers a digest of the last content sent to each message, so callers
+    can skip re-rendering and an edit Telegram would reject as "message is
+    not modified".
+    """
+
+    def __init__(self, debounce: float = 2.0, content_ttl: float = 3600):
+        self._in_flight = {}
+        self._recent = SessionStore(ttl=debounce, resolution=0.25)
+        self._content = SessionStore(ttl=content_ttl)
+        self.stats = {'runs': 0, 'coalesced': 0, 'debounced': 0, 'unchanged': 0}
+
+    async def run(self, key, work) -> bool:
+        """Await `work()` unless an identical tap is running or just ran.
+        Returns True when this call did the work"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+            # The owner reports failures; waiters only need it to be over
+            await asyncio.wait([task])
+            return False
+        if key in self._recent:
+            self.stats['debounced'] += 1
+            return False
+
+        task = self._in_flight[key] = asyncio.ensure_future(work())
+        self.stats['runs'] += 1
+        try:
+            await task
+        finally:
+            del self._in_flight[key]
+            self._recent.set(key, True)
+        return True
+
+    def unchanged(self, message_key, *content) -> bool:
+        """True if `content` matches what was last sent to `message_key`; records it otherwise"""
+        digest = hashlib.blake2b(repr(content).encode('utf-8'), digest_size=16).digest()
+        if self._content.get(message_key) == digest:
+            self.stats['unchanged'] += 1
+            self._content.touch(message_key)
+            return True
+        self._content.set(message_key, digest)
+        return False
+
+    def forget(self, message_key):
+        self._content.pop(message_key)
+
+    def expire(self):
+        self._recent.expire()
+        self._content.expire()
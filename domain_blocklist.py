@@ -0,0 +1,205 @@
+"""Bulk domain blocklist: Bloom filter in front of a sorted on-disk index.
+
+Layout (little-endian):
+
+    b'RBL1' | u32 domains | u32 bloom bits | u32 bloom hashes | u32 index_offset | u32 data_offset
+    bloom:  bloom bits / 8 bytes
+    index:  u32 offset into data per domain, plus one end offset
+    data:   the sorted domains, UTF-8, back to back
+
+A lookup checks the domain and each parent domain (so evil.com also blocks
+cdn.evil.com). Most links are not blocked, and for those the Bloom filter
+answers without touching the index; the rest are a binary search over the
+memory-mapped index.
+
+Import public lists (plain, hosts-file or Adblock "||domain^" lines):
+
+    python domain_blocklist.py build urlhaus.txt phishing.txt blocklist.rbl
+"""
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from hashlib import blake2b
+
+MAGIC = b'RBL1'
+HEADER = struct.Struct('<4sIIIII')
+U32 = struct.Struct('<I')
+FALSE_POSITIVE_RATE = 0.01
+HOSTS_PREFIXES = ('0.0.0.0', '127.0.0.1', '::1', '::')
+
+
+def _hashes(domain: bytes):
+    digest = int.from_bytes(blake2b(domain, digest_size=16).digest(), 'little')
+    return digest & 0xFFFFFFFFFFFFFFFF, (digest >> 64) | 1
+
+
+def bloom_size(count: int, rate: float = FALSE_POSITIVE_RATE):
+    """(bits, hashes) for `count` items at false-positive `rate`"""
+    bits = max(64, math.ceil(-count * math.log(rate) / math.log(2) ** 2))
+    bits = (bits + 7) // 8 * 8
+    return bits, max(1, round(bits / max(1, count) * math.log(2)))
+
+
+def parse_line(line: str):
+    """Domain from one blocklist line, or None for comments and junk"""
+    line = line.split('#', 1)[0].strip().lower()
+    if not line or line.startswith('!'):
+        return None
+    if line.startswith('||'):
+        line = line[2:].split('^', 1)[0]
+    else:
+        parts = line.split()
+        if len(parts) > 1 and parts[0] in HOSTS_PREFIXES:
+            line = parts[1]
+        elif len(parts) > 1:
+            return None
+    line = line.strip('.')
+    if line.startswith('www.'):
+        line = line[4:]
+    if '.' not in line or '/' in line or line == 'localhost':
+        return None
+    return line
+
+
+def read_domains(paths):
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                domain = parse_line(line)
+                if domain:
+                    yield domain
+
+
+def build_bytes(domains) -> bytes:
+    encoded = sorted({d.encode('utf-8') for d in domains})
+    bits, hashes = bloom_size(len(encoded))
+    bloom = bytearray(bits // 8)
+    for domain in encoded:
+        h1, h2 = _hashes(domain)
+        for i in range(hashes):
+            pos = (h1 + i * h2) % bits
+            bloom[pos >> 3] |= 1 << (pos & 7)
+
+    # Native u32 like the reader's memoryview cast; every supported host is little-endian
+    offsets = array('I', [0])
+    end = 0
+    for domain in encoded:
+        end += len(domain)
+        offsets.append(end)
+    index_offset = HEADER.size + len(bloom)
+    data_offset = index_offset + U32.size * len(offsets)
+    header = HEADER.pack(MAGIC, len(encoded), bits, hashes, index_offset, data_offset)
+    return b''.join([header, bytes(bloom), offsets.tobytes()] + encoded)
+
+
+def write_blocklist(path: str, domains):
+    """Build atomically: readers keep the old map until the new file is in place"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(build_bytes(domains))
+    os.replace(tmp_path, path)
+
+
+class DomainBlocklist:
+    """Read-only blocklist backed by a memory map (or bytes for small lists)"""
+
+    def __init__(self, path: str = None, data: bytes = None):
+        self.path = path
+        self._buf = data
+        self._count = None
+        self.stats = {'lookups': 0, 'bloom_rejects': 0, 'index_probes': 0, 'hits': 0}
+
+    @classmethod
+    def from_domains(cls, domains):
+        return cls(data=build_bytes(domains))
+
+    def _load(self):
+        if self._count is not None:
+            return
+        if self._buf is None:
+            if not self.path or not os.path.exists(self.path):
+                self._buf, self._count = b'', 0
+                return
+            with open(self.path, 'rb') as f:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, self._bits, self._hash_count, index_offset, self._data_offset = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a blocklist file")
+        self._bloom = memoryview(self._buf)[HEADER.size:index_offset]
+        self._index = memoryview(self._buf)[index_offset:self._data_offset].cast('I')
+        self._count = count
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._bloom.release()
+            self._index.release()
+            self._buf.close()
+        self._buf, self._count = None, None
+
+    def __len__(self):
+        self._load()
+        return self._count
+
+    def _domain(self, i: int) -> bytes:
+        start = self._data_offset + self._index[i]
+        return self._buf[start:self._data_offset + self._index[i + 1]]
+
+    def _maybe(self, domain: bytes) -> bool:
+        h1, h2 = _hashes(domain)
+        bloom, bits = self._bloom, self._bits
+        for i in range(self._hash_count):
+            pos = (h1 + i * h2) % bits
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _find(self, domain: bytes) -> bool:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._domain(mid) < domain:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self._count and self._domain(lo) == domain
+
+    def __contains__(self, domain: str) -> bool:
+        return self.match(domain) is not None
+
+    def match(self, domain: str):
+        """The listed domain that blocks `domain` (itself or a parent), or None"""
+        self._load()
+        self.stats['lookups'] += 1
+        if not self._count:
+            return None
+        labels = domain.lower().strip('.').split('.')
+        probed = False
+        for i in range(len(labels) - 1):
+            candidate = '.'.join(labels[i:]).encode('utf-8')
+            if not self._maybe(candidate):
+                continue
+            probed = True
+            self.stats['index_probes'] += 1
+            if self._find(candidate):
+                self.stats['hits'] += 1
+                return candidate.decode('utf-8')
+        if not probed:
+            self.stats['bloom_rejects'] += 1
+        return None
+
+    def __iter__(self):
+        self._load()
+        for i in range(self._count):
+            yield self._domain(i).decode('utf-8')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] != 'build':
+        sys.exit("Usage: python domain_blocklist.py build <list.txt> [more.txt ...] <output.rbl>")
+    write_blocklist(sys.argv[-1], read_domains(sys.argv[2:-1]))
+    blocklist = DomainBlocklist(sys.argv[-1])
+    print(f"Wrote {len(blocklist)} domains to {sys.argv[-1]}")
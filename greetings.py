@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import string
+from functools import lru_cache
+
+from session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FIELDS = ('name', 'username', 'chat')
+
+
+class CompiledTemplate:
+    """A str.format template split into literals and fields once.
+
+    Rendering just joins the parts. Unknown fields are rejected when the
+    template is compiled, not when the first member joins.
+    """
+
+    def __init__(self, template: str, fields=TEMPLATE_FIELDS):
+        self.template = template
+        self.parts = []  # (literal, field name or None, format spec)
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if field is not None and field not in fields:
+                raise ValueError(f"Unknown variable {{{field}}}; use {', '.join('{%s}' % f for f in fields)}")
+            if conversion:
+                raise ValueError(f"Conversions like !{conversion} are not supported")
+            self.parts.append((literal, field, spec or ''))
+
+    def render(self, **values) -> str:
+        out = []
+        for literal, field, spec in self.parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                out.append(format(value, spec) if spec else str(value))
+        return ''.join(out)
+
+
+@lru_cache(maxsize=32)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
+class GreetingBatcher:
+    """Coalesces join/leave greetings per chat during bursts.
+
+    A greeting is sent on its own unless another one for the same chat and
+    kind was sent in the last `window` seconds. Then a batch starts, and
+    every greeting in the next `window` seconds goes into one combined
+    message that lists at most `max_names` names. Quiet chats still get
+    personal greetings, and a mass join costs one message per window.
+    """
+
+    def __init__(self, window: float = 3.0, max_names: int = 20):
+        self.window = window
+        self.max_names = max_names
+        self._last_sent = SessionStore(ttl=window, resolution=0.25)
+        self._pending = {}  # (chat_id, kind) -> {'names': [], 'extra': int, 'chat': str}
+        self._flushing = set()  # the loop only holds weak references to tasks
+        self.stats = {'single': 0, 'batches': 0, 'batched_members': 0}
+
+    async def add(self, bot, chat_id: int, kind: str, name: str, chat_title: str, render_single,
+                  batch_template: CompiledTemplate):
+        """Greet `name`; `render_single()` builds the personal text and is only called when it is sent"""
+        key = (chat_id, kind)
+        batch = self._pending.get(key)
+        if batch is not None:
+            if len(batch['names']) < self.max_names:
+                batch['names'].append(name)
+            else:
+                batch['extra'] += 1
+            return
+
+        if key not in self._last_sent:
+            self._last_sent.set(key, True)
+            self.stats['single'] += 1
+            await bot.send_message(chat_id=chat_id, text=render_single())
+            return
+
+        self._pending[key] = {'names': [name], 'extra': 0, 'chat': chat_title}
+        asyncio.get_running_loop().call_later(self.window, self._start_flush, bot, key, batch_template)
+
+    def _start_flush(self, bot, key: tuple, batch_template: CompiledTemplate):
+        task = asyncio.ensure_future(self._flush(bot, key, batch_template))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, bot, key: tuple, batch_template: CompiledTemplate):
+        batch = self._pending.pop(key)
+        names = ", ".join(batch['names'])
+        if batch['extra']:
+            names += f" and {batch['extra']} more"
+        count = len(batch['names']) + batch['extra']
+        self._last_sent.set(key, True)
+        self.stats['batches'] += 1
+        self.stats['batched_members'] += count
+        try:
+            await bot.send_message(chat_id=key[0], text=batch_template.render(name=names, username="", chat=batch['chat']))
+        except Exception as e:
+            logger.error(f"Batched greeting for {count} members failed: {e}")
+
+    def expire(self):
+        self._last_sent.expire()
@@ -0,0 +1,106 @@
+class SpaceSaving:
+    """Space-Saving top-k counter with fixed memory.
+
+    At most `capacity` items are monitored. Each monitored count overestimates
+    the true count by at most its recorded error, and that error is never more
+    than `total / capacity`. Updates are O(1) through count buckets, and the
+    `top_n` leaders are kept sorted as counts change, so reading them needs no
+    sort. Users who ask for their own number get an exact counter from then on.
+    """
+
+    def __init__(self, capacity: int = 200, top_n: int = 5):
+        if capacity < top_n:
+            raise ValueError("capacity must be at least top_n")
+        self.capacity = capacity
+        self.top_n = top_n
+        self.total = 0
+        self.counts = {}  # item -> [count, error]
+        self.exact = {}  # item -> [count, seeded_from_estimate]
+        self._buckets = {}  # count -> {item: None}, insertion-ordered set
+        self._min = 0
+        self.top = []
+
+    @classmethod
+    def from_counts(cls, counts: dict, capacity: int = 200, top_n: int = 5):
+        """Seed from exact counts by keeping the `capacity` largest.
+        Every dropped count is <= the smallest kept one, so the usual bounds hold"""
+        sketch = cls(capacity, top_n)
+        sketch.total = sum(counts.values())
+        kept = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:capacity]
+        for item, count in kept:
+            sketch.counts[item] = [count, 0]
+            sketch._buckets.setdefault(count, {})[item] = None
+        sketch._min = kept[-1][1] if kept else 0
+        sketch._refill_top()
+        return sketch
+
+    @property
+    def error_bound(self) -> int:
+        return self.total // self.capacity
+
+    def add(self, item):
+        self.total += 1
+        if item in self.exact:
+            self.exact[item][0] += 1
+
+        entry = self.counts.get(item)
+        if entry is not None:
+            self._unbucket(item, entry[0])
+            entry[0] += 1
+        elif len(self.counts) < self.capacity:
+            entry = self.counts[item] = [1, 0]
+            self._min = 1
+        else:
+            victim = next(iter(self._buckets[self._min]))
+            self._unbucket(victim, self._min)
+            del self.counts[victim]
+            entry = self.counts[item] = [self._min + 1, self._min]
+            if victim in self.top:
+                self.top.remove(victim)
+                self._refill_top()
+
+        self._buckets.setdefault(entry[0], {})[item] = None
+        if self._min not in self._buckets:
+            self._min = entry[0]
+        self._promote(item)
+
+    def _unbucket(self, item, count: int):
+        bucket = self._buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[count]
+
+    def _promote(self, item):
+        count = self.counts[item][0]
+        if item not in self.top:
+            if len(self.top) >= self.top_n and count <= self.counts[self.top[-1]][0]:
+                return
+            self.top.append(item)
+        i = self.top.index(item)
+        while i > 0 and self.counts[self.top[i - 1]][0] < count:
+            self.top[i - 1], self.top[i] = self.top[i], self.top[i - 1]
+            i -= 1
+        del self.top[self.top_n:]
+
+    def _refill_top(self):
+        self.top = sorted(self.counts, key=lambda k: -self.counts[k][0])[:self.top_n]
+
+    def estimate(self, item):
+        """(upper bound, max overcount) for `item`"""
+        entry = self.counts.get(item)
+        if entry is not None:
+            return entry[0], entry[1]
+        upper = self._min if len(self.counts) >= self.capacity else 0
+        return upper, upper
+
+    def track_exact(self, item):
+        """Start exact counting for `item`; returns (count, is_lower_bound)"""
+        if item not in self.exact:
+            upper, error = self.estimate(item)
+            self.exact[item] = [upper - error, error > 0]
+        count, seeded = self.exact[item]
+        return count, seeded
+
+    def top_k(self) -> list:
+        """[(item, count, error), ...] for the current leaders, highest first"""
+        return [(item, *self.counts[item]) for item in self.top]
@@ -0,0 +1,40 @@
+import io
+
+from PIL import Image
+
+# Tried in order when a size budget is set: the first one that fits wins
+BUDGET_CANDIDATES = [
+    ('png8', 85), ('webp', 90), ('jpeg', 85), ('webp', 70), ('jpeg', 60), ('webp', 50)
+]
+
+
+def encode_image(image: Image.Image, fmt: str = "png", quality: int = 85, optimize: bool = False,
+                 colors: int = 64) -> bytes:
+    """Encode `image` as png, png8 (palette-quantised PNG), webp or jpeg"""
+    buf = io.BytesIO()
+    if fmt == "png":
+        image.save(buf, format='PNG', optimize=optimize)
+    elif fmt == "png8":
+        # Flat-colour art survives a small adaptive palette with no visible loss
+        paletted = image.convert('RGB').quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+        paletted.save(buf, format='PNG', optimize=optimize)
+    elif fmt == "webp":
+        image.save(buf, format='WEBP', quality=quality, method=6 if optimize else 4)
+    elif fmt == "jpeg":
+        image.convert('RGB').save(buf, format='JPEG', quality=quality, optimize=optimize, progressive=optimize)
+    else:
+        raise ValueError(f"Unknown image format: {fmt}")
+    return buf.getvalue()
+
+
+def encode_within_budget(image: Image.Image, budget: int, optimize: bool = False):
+    """Return (fmt, quality, data) for the first candidate under `budget` bytes,
+    or the smallest candidate when none fits"""
+    smallest = None
+    for fmt, quality in BUDGET_CANDIDATES:
+        data = encode_image(image, fmt, quality, optimize)
+        if len(data) <= budget:
+            return fmt, quality, data
+        if smallest is None or len(data) < len(smallest[2]):
+            smallest = (fmt, quality, data)
+    return smallest
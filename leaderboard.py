@@ -0,0 +1,132 @@
+import json
+import os
+from bisect import bisect_left, insort
+from datetime import date
+
+
+def sort_key(user_id: int, user: dict) -> tuple:
+    """Same order as the old full sort: level, then XP, then earliest activity"""
+    last_active = user['last_active']
+    if isinstance(last_active, str):
+        last_active = date.fromisoformat(last_active)
+    return (-user['level'], -user['xp'], last_active.toordinal(), user_id)
+
+
+class LeaderboardIndex:
+    """Sorted rank index updated incrementally as users gain XP.
+
+    Rank lookups are a bisect and pages are slices, so any page (or the page
+    around a given user) costs O(log n + page size). `version` moves on every
+    order change and clears the response cache.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._key_of = {}
+        self._cache = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._key_of
+
+    def update(self, user_id: int, user: dict):
+        key = sort_key(user_id, user)
+        old_key = self._key_of.get(user_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            del self._keys[bisect_left(self._keys, old_key)]
+        insort(self._keys, key)
+        self._key_of[user_id] = key
+        self._bump()
+
+    def remove(self, user_id: int):
+        old_key = self._key_of.pop(user_id, None)
+        if old_key is not None:
+            del self._keys[bisect_left(self._keys, old_key)]
+            self._bump()
+
+    def rebuild(self, users: dict, keep_missing: bool = False):
+        """Re-key every user from `users`. With `keep_missing`, users the index has
+        but `users` lacks keep their place, as records spilled to disk do"""
+        key_of = {uid: sort_key(uid, u) for uid, u in users.items()}
+        self._key_of = {**self._key_of, **key_of} if keep_missing else key_of
+        self._keys = sorted(self._key_of.values())
+        self._bump()
+
+    def rank(self, user_id: int):
+        """1-based rank, or None for unknown users"""
+        key = self._key_of.get(user_id)
+        if key is None:
+            return None
+        return bisect_left(self._keys, key) + 1
+
+    def page(self, offset: int, limit: int) -> list:
+        """[(rank, user_id), ...] starting at 0-based `offset`"""
+        offset = max(0, offset)
+        return [(offset + i + 1, key[-1]) for i, key in enumerate(self._keys[offset:offset + limit])]
+
+    def offset_around(self, user_id: int, limit: int) -> int:
+        """Page offset that puts `user_id` in the middle of a page"""
+        rank = self.rank(user_id)
+        if rank is None:
+            return 0
+        return max(0, min(rank - 1 - limit // 2, len(self._keys) - limit))
+
+    def cached(self, cache_key, build):
+        """Memoise a rendered page until the leaderboard version moves"""
+        if cache_key not in self._cache:
+            self._cache[cache_key] = build()
+        return self._cache[cache_key]
+
+    def _bump(self):
+        self.version += 1
+        self._cache.clear()
+
+
+def snapshot(index: LeaderboardIndex, users: dict) -> tuple:
+    """What write_snapshot needs, taken on the event loop: the version and a copy of the
+    ranking order, which a list copy makes cheap even for 100k users"""
+    return index.version, list(index._keys), users
+
+
+def write_snapshot(path: str, snapshot: tuple, lookup=None):
+    """Dump a snapshot() for web_server.py, which runs in its own process. Meant for a worker
+    thread: records are fetched with single users.get() calls and read field by field, so a
+    handler changing one meanwhile makes that row a moment newer at worst. `lookup(user_ids)`
+    returns {user_id: record} for ranked users not in `users`, in one call"""
+    version, keys, users = snapshot
+    user_ids = [key[-1] for key in keys]
+    records = list(map(users.get, user_ids))
+    missing = [user_id for user_id, u in zip(user_ids, records) if u is None]
+    found = lookup(missing) if missing and lookup is not None else {}
+    entries = []
+    for user_id, u in zip(user_ids, records):
+        if u is None:
+            u = found.get(user_id)
+            if u is None:
+                continue
+        entries.append({
+            'user_id': user_id, 'name': u['name'], 'username': u['username'],
+            'level': u['level'], 'xp': u['xp'], 'last_active': u['last_active'].isoformat()
+        })
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'users': entries}, f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str):
+    """Return (index, users) rebuilt from a snapshot file"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    users = {entry['user_id']: entry for entry in data['users']}
+    index = LeaderboardIndex()
+    index.rebuild(users)
+    index.version = data['version']
+    return index, users
@@ -0,0 +1,79 @@
+import time
+from collections import Counter
+
+
+class LoadGovernor:
+    """Turns optional features off in stages while updates are processed late.
+
+    Lag (how old a message is when its handlers start) is smoothed with an
+    exponential moving average and checked together with the update queue
+    depth. While either is over its shed threshold, one more stage is shed
+    every `step` seconds. Once both have stayed under the lower restore
+    thresholds for `hold` seconds, one stage comes back. Each later stage
+    takes another `hold` seconds. The gap between the two thresholds and the
+    slow restore keep features from flapping at the edge of overload.
+    """
+
+    def __init__(self, stages: list, shed_lag: float = 5.0, restore_lag: float = 1.0, shed_depth: int = 100,
+                 restore_depth: int = 10, step: float = 5.0, hold: float = 30.0, smoothing: float = 0.2,
+                 clock=time.monotonic):
+        self.stages = [tuple(stage) for stage in stages]
+        self.shed_lag = shed_lag
+        self.restore_lag = restore_lag
+        self.shed_depth = shed_depth
+        self.restore_depth = restore_depth
+        self.step = step
+        self.hold = hold
+        self.smoothing = smoothing
+        self.clock = clock
+        self.level = 0
+        self.shed = frozenset()
+        self.lag = 0.0
+        self.depth = 0
+        self.changed_at = clock()
+        self.calm_since = None
+        self.last_sample = clock()
+        self.stats = {'shed': 0, 'restored': 0, 'max_lag': 0.0, 'max_depth': 0, 'skipped': Counter()}
+
+    def observe(self, lag: float, depth: int):
+        """Feed one update's lag and the queue depth. Returns (old level, new level) on a change"""
+        self.lag += self.smoothing * (max(0.0, lag) - self.lag)
+        self.last_sample = self.clock()
+        self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+        return self._update_depth(depth)
+
+    def tick(self, depth: int):
+        """Periodic check so features also come back when no messages arrive"""
+        if self.clock() - self.last_sample > self.step:
+            self.lag -= self.smoothing * self.lag
+        return self._update_depth(depth)
+
+    def _update_depth(self, depth: int):
+        self.depth = depth
+        self.stats['max_depth'] = max(self.stats['max_depth'], depth)
+        now = self.clock()
+        if self.lag > self.shed_lag or depth > self.shed_depth:
+            self.calm_since = None
+            if self.level < len(self.stages) and now - self.changed_at >= self.step:
+                return self._set_level(self.level + 1, now)
+        elif self.lag < self.restore_lag and depth < self.restore_depth:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif self.level > 0 and now - max(self.calm_since, self.changed_at) >= self.hold:
+                return self._set_level(self.level - 1, now)
+        else:
+            self.calm_since = None
+        return None
+
+    def _set_level(self, level: int, now: float) -> tuple:
+        old, self.level = self.level, level
+        self.shed = frozenset(feature for stage in self.stages[:level] for feature in stage)
+        self.changed_at = now
+        self.stats['shed' if level > old else 'restored'] += 1
+        return old, level
+
+    def allows(self, feature: str) -> bool:
+        if feature in self.shed:
+            self.stats['skipped'][feature] += 1
+            return False
+        return True
@@ -0,0 +1,116 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_listener = None  # set by the first setup_logging call
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through `burst` WARNING+ records per call site every `window`
+    seconds and drops the rest.
+
+    Call sites are (logger, function, line), so a 429 storm hitting one
+    handler is thinned out without hiding errors from other handlers. The
+    first record after a quiet window reports how many were dropped.
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.clock = clock
+        self.sites = {}  # (name, func, line) -> [window start, passed, dropped]
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        now = self.clock()
+        site = self.sites.get((record.name, record.funcName, record.lineno))
+        if site is None or now - site[0] >= self.window:
+            dropped = site[2] if site else 0
+            self.sites[(record.name, record.funcName, record.lineno)] = [now, 1, 0]
+            if dropped:
+                record.msg = f"{record.msg} [{dropped} similar messages suppressed]"
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks or formats on the caller's thread.
+
+    Only the message text is merged here. Tracebacks and formatting happen
+    in the listener thread. When the queue is full, records are counted and
+    dropped, so the event loop is never stalled.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.overflow = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflow += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+            'func': record.funcName, 'line': record.lineno, 'msg': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _stop_listener(listener: QueueListener):
+    # Flush whatever is still queued at exit; harmless if already stopped
+    if listener._thread is not None:
+        listener.stop()
+
+
+def setup_logging(level=logging.INFO, json_format: bool = False, burst: int = 5, window: float = 60,
+                  max_queue: int = 10000) -> QueueListener:
+    """Route the root logger through a bounded queue drained by a listener thread.
+    Logging is process-wide, so when several bots share a process the first call wins"""
+    global _listener
+    if _listener is not None:
+        return _listener
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.Queue(max_queue)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(burst, window))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    _listener = listener
+    return listener
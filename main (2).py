@@ -1,119 +1,166 @@
+import asyncio
+import heapq
 import re
 import random
 import json
 import logging
 import os
+import sqlite3
 import io
+import tempfile
+import threading
+import time
+from itertools import chain
+from collections import deque
 import requests
-from datetime import datetime, timedelta
-from PIL import Image, ImageDraw, ImageFont
-from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from datetime import date, datetime, timedelta
+from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputFile
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
+    TypeHandler,
     CommandHandler,
     MessageHandler,
     ContextTypes,
     filters,
     CallbackQueryHandler
 )
-from apscheduler.schedulers.background import BackgroundScheduler
-
-# Setup logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from leaderboard import LeaderboardIndex, snapshot, write_snapshot
+from spam_detector import NearDuplicateDetector
+from word_bank import WordBank
+from session_store import SessionStore
+from heavy_hitters import SpaceSaving
+from render_pool import RenderPool, RenderQueueFull
+from rank_cards import render_leaderboard_card, render_rank_card
+from media_cache import MediaCache, MediaFetchError
+from moderation_rules import RuleStore, LINK_MODES
+from domain_blocklist import DomainBlocklist, read_domains, write_blocklist
+from log_setup import setup_logging
+from profiling import SamplingProfiler, HeapTracker
+from warning_system import WarningLedger, PunishmentQueue
+from coalesce import CallbackCoalescer
+from greetings import GreetingBatcher, compile_template
+from raid_guard import RaidDetector
+from load_governor import LoadGovernor
+from catch_up import CatchUp
+from memory_budget import MemoryBudget, SpillStore, current_rss, estimate_size
+from safe_patterns import PatternBudget, UnsafePattern, check_pattern, compile_safe
+
+# Setup logging: records go through a queue to a listener thread, repeated errors are sampled
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")  # "text" or "json"
+LOG_SAMPLE_BURST = 5  # identical-site warnings/errors let through per window
+LOG_SAMPLE_WINDOW = 60  # seconds
+setup_logging(logging.INFO, json_format=LOG_FORMAT == "json", burst=LOG_SAMPLE_BURST, window=LOG_SAMPLE_WINDOW)
 logger = logging.getLogger(__name__)
 
 # Bot configuration
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 WARN_LIMIT = 3
+WARN_DECAY = 24 * 3600  # seconds a warning counts toward WARN_LIMIT
+WARN_ESCALATION = [("mute", 3600), ("mute", 24 * 3600), ("ban", 7 * 24 * 3600)]  # (action, seconds) per strike
+PUNISHMENTS_PATH = os.environ.get("PUNISHMENTS_PATH", "punishments.json")
+PUNISHMENT_SWEEP_INTERVAL = 30  # seconds between checks for mutes/bans to lift
+# Restored when a chat reports no permissions of its own: what members of a new group may do.
+# Telegram reads fields left out as False, so a partial set would take media, polls and more away
+MEMBER_PERMISSIONS = ChatPermissions(
+    can_send_messages=True, can_send_audios=True, can_send_documents=True, can_send_photos=True,
+    can_send_videos=True, can_send_video_notes=True, can_send_voice_notes=True, can_send_polls=True,
+    can_send_other_messages=True, can_add_web_page_previews=True, can_react_to_messages=True,
+    can_invite_users=True, can_change_info=False, can_pin_messages=False, can_manage_topics=False
+)
 FLOOD_LIMIT = 5
 FLOOD_WINDOW = 10
+SPAM_WAVE_MIN_USERS = 3  # distinct senders of near-identical text
+SPAM_WAVE_WINDOW = 600  # seconds
+WORD_BANK_PATH = os.environ.get("WORD_BANK_PATH", "word_bank.wbk")
+WORD_GAME_TIMEOUT = 300  # seconds from /wordgame until the round is dropped
+TOD_IDLE_TIMEOUT = 1800  # seconds without a /truth, /dare or /tod_join
+SESSION_SWEEP_INTERVAL = 5  # seconds between expire_sessions runs
+MESSAGE_COUNT_MODE = os.environ.get("MESSAGE_COUNT_MODE", "exact")  # "exact" or "approx"
+HEAVY_HITTER_CAPACITY = 200  # users tracked per chat in approx mode; error <= messages / capacity
+RENDER_WORKERS = 2
+RENDER_QUEUE_LIMIT = 8  # queued rank cards before /rank falls back to text
+RANK_CARD_FORMAT = os.environ.get("RANK_CARD_FORMAT", "png8")  # png, png8, webp or jpeg
+RANK_CARD_QUALITY = 85  # webp/jpeg only
+RANK_CARD_OPTIMIZE = False  # extra encoder passes: smaller files, slower encode
+RANK_CARD_SIZE_BUDGET = None  # bytes; when set, overrides the format with the first candidate that fits
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_CARD_SIZE = 10  # users on the rendered leaderboard image
+CALLBACK_DEBOUNCE = 2  # seconds a repeated tap on the same button and message is ignored
+GREETING_BATCH_WINDOW = 3  # seconds; a second join/leave within this window starts a combined message
+GREETING_BATCH_MAX_NAMES = 20
+WELCOME_BATCH_MESSAGE = "👋 Welcome {name} to {chat}!"
+GOODBYE_BATCH_MESSAGE = "👋 Goodbye {name}! We'll miss you!"
+RAID_JOIN_THRESHOLD = 15  # joins within RAID_WINDOW that count as a raid
+RAID_WINDOW = 60  # seconds
+RAID_LOCKDOWN = 120  # seconds the chat is read-only after a raid starts
+RAID_COOLDOWN = 300  # seconds of normal join rates before the raid is over
+NEW_MEMBER_PROBATION = 600  # seconds after joining that a member counts as new
+RAID_FLOOD_LIMIT = 2  # messages per FLOOD_WINDOW for new members during a raid
+RAID_CHECK_INTERVAL = 10  # seconds between lockdown/raid-end checks
+LEADERBOARD_SNAPSHOT_DIR = os.environ.get("LEADERBOARD_SNAPSHOT_DIR", "leaderboards")
+LEADERBOARD_REBUILD_INTERVAL = 3600  # seconds between full re-sorts of every chat leaderboard
+LEADERBOARD_EXPORT_INTERVAL = 30  # seconds between snapshot writes for web_server.py
+MEDIA_CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR", "media_cache")
+MEDIA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MEDIA_CACHE_MAX_AGE = 24 * 3600  # seconds before a cached meme/video is revalidated
+MODERATION_RULES_PATH = os.environ.get("MODERATION_RULES_PATH", "moderation_rules.json")
+RULES_POLL_INTERVAL = 2  # seconds between checks of the rules file
+BLOCKLIST_PATH = os.environ.get("BLOCKLIST_PATH", "blocklist.rbl")
+BLOCKLIST_IMPORT_DIR = os.environ.get("BLOCKLIST_IMPORT_DIR", "blocklists")  # local files /importblocklist may read
+AUTO_RESPONSE_BUDGET = 0.005  # seconds of auto-response matching per message
+AUTO_RESPONSE_STRIKES = 3  # searches over the budget before a pattern is disabled
+MEMORY_CHECK_INTERVAL = 300  # seconds between size estimates and budget enforcement
+MEMORY_BUDGETS = {  # estimated bytes per user_data subsystem before its eviction policy runs
+    'ranking': 64 * 1024 * 1024, 'message_counts': 16 * 1024 * 1024,
+    'flood': 8 * 1024 * 1024, 'warnings': 4 * 1024 * 1024
+}
+RANKING_SPILL_PATH = os.environ.get("RANKING_SPILL_PATH", "ranking_spill.db")  # SQLite file for evicted cold records
+MEMORY_REPORT_PATH = os.environ.get("MEMORY_REPORT_PATH", "memory_report.json")  # read by web_server.py
+LOAD_SHED_STAGES = [  # enabled_features turned off in this order while updates lag, restored in reverse
+    ('random_emoji', 'greet_users', 'custom_responses'),  # chit-chat replies
+    ('ranking_system', 'meme', 'video'),  # level-up notices (XP still counts) and media uploads
+    ('welcome_message', 'goodbye_message')
+]
+LOAD_SHED_LAG = 5  # seconds of smoothed message lag before the next stage is shed
+LOAD_RESTORE_LAG = 1  # seconds; lag must stay below this for LOAD_RESTORE_HOLD to restore a stage
+LOAD_SHED_QUEUE = 100  # pending updates before the next stage is shed
+LOAD_RESTORE_QUEUE = 10
+LOAD_SHED_STEP = 5  # seconds between successive shed stages
+LOAD_RESTORE_HOLD = 30  # seconds of calm before each stage comes back
+LOAD_CHECK_INTERVAL = 5  # seconds between queue-depth checks when no messages arrive
+CATCHUP_ENTER_AGE = 60  # seconds; an update this old means a backlog, e.g. after a restart
+CATCHUP_EXIT_AGE = 10  # seconds; the first update younger than this ends catch-up
+CATCHUP_IDLE = 5  # seconds without updates that also end catch-up
+CATCHUP_STALE_AGE = 120  # seconds after which greetings, auto-responses and fun commands go unanswered
+LOAD_BUSY_REPLY = "⏳ Busy catching up on messages, try again in a minute."
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 60
 
 # ========== RANK CARD IMAGE GENERATOR ========== #
-class RankCardGenerator:
-    def create_rank_card(self, user_data: dict) -> io.BytesIO:
-        """Create rank card image"""
-        width, height = 600, 300
-        image = Image.new('RGB', (width, height), color='#2C2F33')
-        draw = ImageDraw.Draw(image)
-        
-        try:
-            title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 24)
-            normal_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 18)
-            small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
-        except:
-            title_font = ImageFont.load_default()
-            normal_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-        
-        level = user_data['level']
-        rank = user_data['rank']
-        username = user_data['username']
-        display_name = user_data['name']
-        current_xp = user_data['xp']
-        xp_needed = level * user_data['settings']['xp_per_level']
-        
-        # Draw background
-        draw.rectangle([0, 0, width, height], fill='#2C2F33')
-        
-        # Progress bar
-        progress_bg = [50, 180, width - 50, 200]
-        draw.rectangle(progress_bg, fill='#40444B')
-        
-        progress_width = int((current_xp / xp_needed) * (width - 100))
-        if progress_width > 0:
-            progress_fill = [50, 180, 50 + progress_width, 200]
-            draw.rectangle(progress_fill, fill='#43B581')
-        
-        # Level circle
-        level_circle_pos = (width - 80, 60)
-        level_circle_radius = 30
-        draw.ellipse([
-            level_circle_pos[0] - level_circle_radius,
-            level_circle_pos[1] - level_circle_radius,
-            level_circle_pos[0] + level_circle_radius,
-            level_circle_pos[1] + level_circle_radius
-        ], fill='#7289DA')
-        
-        # User avatar
-        avatar_size = 80
-        avatar_pos = (50, 50)
-        draw.ellipse([
-            avatar_pos[0], avatar_pos[1],
-            avatar_pos[0] + avatar_size, avatar_pos[1] + avatar_size
-        ], fill='#7289DA')
-        
-        # User initial
-        initial = display_name[0].upper() if display_name else "U"
-        try:
-            bbox = draw.textbbox((0, 0), initial, font=title_font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            x = avatar_pos[0] + (avatar_size - text_width) // 2
-            y = avatar_pos[1] + (avatar_size - text_height) // 2
-            draw.text((x, y), initial, fill='#FFFFFF', font=title_font)
-        except:
-            pass
-        
-        # Text elements
-        draw.text((150, 40), display_name, fill='#FFFFFF', font=title_font)
-        draw.text((150, 75), f"@{username}", fill='#99AAB5', font=small_font)
-        draw.text((level_circle_pos[0] - 25, level_circle_pos[1] - 45), "LEVEL", fill='#99AAB5', font=small_font)
-        draw.text((level_circle_pos[0] - 10, level_circle_pos[1] - 15), str(level), fill='#FFFFFF', font=title_font)
-        draw.text((50, 150), f"RANK #{rank}", fill='#99AAB5', font=small_font)
-        draw.text((width - 200, 150), f"{current_xp} / {xp_needed} XP", fill='#FFFFFF', font=normal_font)
-        
-        progress_percent = int((current_xp / xp_needed) * 100)
-        draw.text((width - 80, 210), f"{progress_percent}%", fill='#99AAB5', font=small_font)
-        
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        return img_byte_arr
-
-rank_generator = RankCardGenerator()
+# Drawing lives in rank_cards.py, which render_pool's worker processes import by name
+RANK_CARD_SETTINGS = (RANK_CARD_FORMAT, RANK_CARD_QUALITY, RANK_CARD_OPTIMIZE, RANK_CARD_SIZE_BUDGET)
+
+render_pool = RenderPool(render_rank_card, max_workers=RENDER_WORKERS, max_queue=RENDER_QUEUE_LIMIT,
+                         preload=['rank_cards'])
+spam_detector = NearDuplicateDetector(window_seconds=SPAM_WAVE_WINDOW, min_users=SPAM_WAVE_MIN_USERS)
+media_cache = MediaCache(MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES, max_age=MEDIA_CACHE_MAX_AGE)
+# Idle until an admin runs /profile or /heap
+profiler = SamplingProfiler(__file__)
+heap_tracker = HeapTracker(__file__)
+callback_coalescer = CallbackCoalescer(debounce=CALLBACK_DEBOUNCE)
+greeting_batcher = GreetingBatcher(window=GREETING_BATCH_WINDOW, max_names=GREETING_BATCH_MAX_NAMES)
+raid_detector = RaidDetector(
+    threshold=RAID_JOIN_THRESHOLD, window=RAID_WINDOW, cooldown=RAID_COOLDOWN, probation=NEW_MEMBER_PROBATION
+)
+ranking_spill = SpillStore(RANKING_SPILL_PATH)
+catch_up = CatchUp(enter_age=CATCHUP_ENTER_AGE, exit_age=CATCHUP_EXIT_AGE, idle=CATCHUP_IDLE)
+load_governor = LoadGovernor(
+    LOAD_SHED_STAGES, shed_lag=LOAD_SHED_LAG, restore_lag=LOAD_RESTORE_LAG, shed_depth=LOAD_SHED_QUEUE,
+    restore_depth=LOAD_RESTORE_QUEUE, step=LOAD_SHED_STEP, hold=LOAD_RESTORE_HOLD
+)
+memory_budget = MemoryBudget()
+pattern_budget = PatternBudget(budget=AUTO_RESPONSE_BUDGET, strikes=AUTO_RESPONSE_STRIKES)
 
 # ========== RANK TITLES SYSTEM ========== #
 RANK_TITLES = {
@@ -136,8 +183,12 @@ def generate_progress_bar(percentage: int, length: int = 15) -> str:
 
 # ========== COMPLETE DATA STORAGE ========== #
 user_data = {
-    'warnings': {},
-    'flood': {},
+    # (chat_id, user_id) -> warning times, decayed on read
+    'warnings': WarningLedger(decay=WARN_DECAY),
+    # Timed mutes/bans from WARN_LIMIT escalation, persisted across restarts
+    'punishments': PunishmentQueue(PUNISHMENTS_PATH),
+    # (chat_id, user_id) -> deque of message times, dropped FLOOD_WINDOW after the last message
+    'flood': SessionStore(ttl=FLOOD_WINDOW),
     'message_counts': {},
     'welcome_message': "Welcome {name} (@{username}) to {chat}!",
     'goodbye_message': "Goodbye {name}! We'll miss you!",
@@ -152,10 +203,12 @@ user_data = {
         'welcome_message': True, 'goodbye_message': True, 'custom_responses': True,
         'meme': True, 'video': True, 'greet_users': True, 'anti_link': True,
         'report_system': True, 'message_counter': True, 'random_emoji': True,
-        'ranking_system': True, 'truth_or_dare': True, 'word_games': True, 'meme_categories': True
+        'ranking_system': True, 'truth_or_dare': True, 'word_games': True, 'meme_categories': True,
+        'anti_raid': True
     },
     'meme_categories': {
         'enabled': ['funny', 'programming', 'animals', 'gaming'],
+        # user_id -> favourites, least recently used first so idle users are evicted first
         'user_favorites': {}
     },
     'truth_or_dare': {
@@ -170,17 +223,72 @@ user_data = {
             "Text your crush right now and screenshot it", "Do 10 pushups right now",
             "Speak in an accent for the next 5 messages", "Tell a funny joke to the group"
         ],
-        'active_players': {}
+        # chat_id -> set of user_ids
+        'active_players': SessionStore(ttl=TOD_IDLE_TIMEOUT)
     },
     'word_games': {
-        'active_games': {},
-        'word_bank': [
-            {'word': 'algorithm', 'hint': 'Step-by-step procedure', 'category': 'tech'},
-            {'word': 'blockchain', 'hint': 'Decentralized digital ledger', 'category': 'tech'},
-            {'word': 'nebulous', 'hint': 'Vague or ill-defined', 'category': 'general'},
-            {'word': 'quantum', 'hint': 'Relating to quantum mechanics', 'category': 'science'},
-            {'word': 'syntax', 'hint': 'Arrangement in programming', 'category': 'tech'}
-            MEME_URLS = [
+        'active_games': SessionStore(ttl=WORD_GAME_TIMEOUT),
+        # Loaded lazily from WORD_BANK_PATH, see load_word_bank()
+        'word_bank': None
+    },
+    'ranking': {
+        # Per-chat shards: {chat_id: {'users': {}, 'leaderboard': LeaderboardIndex(), 'exported_version': None,
+        #                             'card': rendered top-k image, see leaderboard_card()}}
+        'chats': {},
+        'global': {'users': {}, 'leaderboard': LeaderboardIndex(), 'exported_version': None, 'card': None},
+        'settings': {
+            'xp_per_level': 400, 'daily_bonus': 50, 'streak_bonus': {3: 100, 7: 300},
+            'message_xp_range': [1, 5], 'voice_message_xp': 10, 'photo_message_xp': 8,
+            'global_leaderboard': True
+        },
+        'last_update': None
+    },
+    'link_protection': {
+        'allowed_domains': ["youtube.com", "telegram.org", "github.com", "wikipedia.org"],
+        'blocked_domains': ["download.com", "malware.site", "virus.com"],
+        'mode': "whitelist",
+        'advanced': {'block_shorteners': True, 'block_obfuscated': True, 'allow_subdomains': False},
+        # Bulk-imported malware/phishing domains, see /importblocklist; checked in every link mode
+        'bulk_blocklist': DomainBlocklist(BLOCKLIST_PATH)
+    },
+    'auto_responses': {
+        'patterns': {
+            r'(?i)how are you': ["I'm doing great! 😊", "Feeling awesome! 👍"],
+            r'(?i)thank you': ["You're welcome! 😊", "No problem! 👍"],
+            r'(?i)good night': ["Good night! 🌙", "Sleep well! 😴"],
+            r'(?i)good morning': ["Good morning! ☀️", "Morning! 😊"]
+        }
+    }
+}
+
+# ========== EXPANDED DATABASES ========== #
+MEME_DATABASE = {
+    'funny': ["https://i.imgflip.com/30b1gx.jpg", "https://i.imgflip.com/1bij.jpg", "https://i.imgflip.com/1g8my4.jpg"],
+    'programming': ["https://i.imgflip.com/2h6y5t.jpg", "https://i.imgflip.com/2/1hl0b5.jpg"],
+    'animals': ["https://i.imgflip.com/1o3j1p.jpg", "https://i.imgflip.com/1o3j2q.jpg"],
+    'gaming': ["https://i.imgflip.com/1o3k1p.jpg", "https://i.imgflip.com/1o3k2q.jpg"],
+    'reaction': ["https://i.imgflip.com/1o3l1p.jpg", "https://i.imgflip.com/1o3l2q.jpg"]
+}
+
+SHORT_VIDEOS = {
+    'funny': [
+        {"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "😂 Funny Moment"},
+        {"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "😆 Hilarious Clip"}
+    ],
+    'gaming': [
+        {"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "🎮 Gaming Moment"},
+        {"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "⚡ Gaming Fail"}
+    ]
+}
+
+VIDEO_DATABASE = {
+    "360": [{"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "360p Sample"}],
+    "720": [{"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "720p HD"}],
+    "1080": [{"url": "https://sample-videos.com/video123/mp4/1080/big_buck_bunny_1080p_50mb.mp4", "caption": "1080p Full HD"}],
+    "4k": [{"url": "https://example.com/4k-sample.mp4", "caption": "4K Ultra HD"}]
+}
+
+MEME_URLS = [
     "https://i.imgflip.com/30b1gx.jpg",
     "https://i.imgflip.com/1bij.jpg",
     "https://i.imgflip.com/1g8my4.jpg",
@@ -212,7 +320,8 @@ user_data = {
     "https://i.imgflip.com/1bhb.jpg",
     "https://i.imgflip.com/1bhc.jpg"
 ]
-                     GIF_MEMES = [
+
+GIF_MEMES = [
     # Popular GIF Memes
     "https://media.giphy.com/media/l0MYt5jPR6QX5pnqM/giphy.gif",  # Michael Jackson eating popcorn
     "https://media.giphy.com/media/3o7aCTPPm4OHfRLSH6/giphy.gif",  # Success kid
@@ -254,60 +363,14 @@ user_data = {
     "https://media.giphy.com/media/3o7TKsQ7X1Pm5mQvWM/giphy.gif",  # Ryan Reynolds laughing
     "https://media.giphy.com/media/l0HlTYWKW2j0pw5bi/giphy.gif"    # The Rock eyebrow
 ]
-        ],
-        'categories': ['tech', 'science', 'general']
-    },
-    'ranking': {
-        'users': {},
-        'settings': {
-            'xp_per_level': 400, 'daily_bonus': 50, 'streak_bonus': {3: 100, 7: 300},
-            'message_xp_range': [1, 5], 'voice_message_xp': 10, 'photo_message_xp': 8
-        },
-        'leaderboard_cache': [],
-        'last_update': None
-    },
-    'link_protection': {
-        'allowed_domains': ["youtube.com", "telegram.org", "github.com", "wikipedia.org"],
-        'blocked_domains': ["download.com", "malware.site", "virus.com"],
-        'mode': "whitelist",
-        'advanced': {'block_shorteners': True, 'block_obfuscated': True, 'allow_subdomains': False}
-    },
-    'auto_responses': {
-        'patterns': {
-            r'(?i)how are you': ["I'm doing great! 😊", "Feeling awesome! 👍"],
-            r'(?i)thank you': ["You're welcome! 😊", "No problem! 👍"],
-            r'(?i)good night': ["Good night! 🌙", "Sleep well! 😴"],
-            r'(?i)good morning': ["Good morning! ☀️", "Morning! 😊"]
-        }
-    }
-}
-
-# ========== EXPANDED DATABASES ========== #
-MEME_DATABASE = {
-    'funny': ["https://i.imgflip.com/30b1gx.jpg", "https://i.imgflip.com/1bij.jpg", "https://i.imgflip.com/1g8my4.jpg"],
-    'programming': ["https://i.imgflip.com/2h6y5t.jpg", "https://i.imgflip.com/2/1hl0b5.jpg"],
-    'animals': ["https://i.imgflip.com/1o3j1p.jpg", "https://i.imgflip.com/1o3j2q.jpg"],
-    'gaming': ["https://i.imgflip.com/1o3k1p.jpg", "https://i.imgflip.com/1o3k2q.jpg"],
-    'reaction': ["https://i.imgflip.com/1o3l1p.jpg", "https://i.imgflip.com/1o3l2q.jpg"]
-}
-
-SHORT_VIDEOS = {
-    'funny': [
-        {"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "😂 Funny Moment"},
-        {"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "😆 Hilarious Clip"}
-    ],
-    'gaming': [
-        {"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "🎮 Gaming Moment"},
-        {"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "⚡ Gaming Fail"}
-    ]
-}
 
-VIDEO_DATABASE = {
-    "360": [{"url": "https://sample-videos.com/video123/mp4/360/big_buck_bunny_360p_5mb.mp4", "caption": "360p Sample"}],
-    "720": [{"url": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_10mb.mp4", "caption": "720p HD"}],
-    "1080": [{"url": "https://sample-videos.com/video123/mp4/1080/big_buck_bunny_1080p_50mb.mp4", "caption": "1080p Full HD"}],
-    "4k": [{"url": "https://example.com/4k-sample.mp4", "caption": "4K Ultra HD"}]
-}
+DEFAULT_WORD_BANK = [
+    {'word': 'algorithm', 'hint': 'Step-by-step procedure', 'category': 'tech'},
+    {'word': 'blockchain', 'hint': 'Decentralized digital ledger', 'category': 'tech'},
+    {'word': 'nebulous', 'hint': 'Vague or ill-defined', 'category': 'general'},
+    {'word': 'quantum', 'hint': 'Relating to quantum mechanics', 'category': 'science'},
+    {'word': 'syntax', 'hint': 'Arrangement in programming', 'category': 'tech'}
+]
 
 # ========== UTILITY FUNCTIONS ========== #
 async def is_admin(update: Update) -> bool:
@@ -315,16 +378,112 @@ async def is_admin(update: Update) -> bool:
         admin.user.id for admin in await update.effective_chat.get_administrators()
     ]
 
+URL_PATTERN = compile_safe(r'https?://[$-_a-zA-Z@.&+!*\\(),]+')  # $-_ covers digits, A-Z and %XX escapes
+
 def clean_domain(url: str) -> str:
-    return re.sub(r'^https?://|www\.', '', url.split('/')[0].lower())
+    host = re.sub(r'^https?://', '', url.lower()).split('/')[0].split(':')[0]  # evil.com:8080 is evil.com
+    return re.sub(r'^www\.', '', host)
+
+def current_rules() -> dict:
+    link_config = user_data['link_protection']
+    return {
+        'banned_words': user_data['banned_words'], 'allowed_domains': link_config['allowed_domains'],
+        'blocked_domains': link_config['blocked_domains'], 'link_mode': link_config['mode'],
+        'auto_responses': user_data['auto_responses']['patterns']
+    }
+
+def apply_rules(raw: dict):
+    """Mirror the live rules into user_data (copies, so admin edits never touch the compiled snapshot)"""
+    user_data['banned_words'] = list(raw['banned_words'])
+    user_data['link_protection']['allowed_domains'] = list(raw['allowed_domains'])
+    user_data['link_protection']['blocked_domains'] = list(raw['blocked_domains'])
+    user_data['link_protection']['mode'] = raw['link_mode']
+    user_data['auto_responses']['patterns'] = {p: list(r) for p, r in raw['auto_responses'].items()}
+
+def save_rules(done: str) -> str:
+    """Persist admin edits to MODERATION_RULES_PATH and make them live.
+    Returns the reply for the admin: `done`, or what went wrong, plus any
+    auto-response patterns the rules skipped as unsafe"""
+    reply = done
+    try:
+        rule_store.save(current_rules())
+    except OSError as e:
+        logger.error(f"Saving moderation rules failed: {e}")
+        reply = f"⚠️ Applied, but saving {MODERATION_RULES_PATH} failed, so a restart undoes it: {e}"
+    except (ValueError, re.error) as e:
+        logger.error(f"Moderation rules rejected: {e}")
+        reply = f"❌ Not applied: {e}"
+    apply_rules(rule_store.rules.raw)
+    skipped = [f"⚠️ Skipped auto-response {pattern!r}: {reason}" for pattern, reason in rule_store.rules.rejected.items()]
+    return "\n".join([reply, *skipped])
+
+rule_store = RuleStore(MODERATION_RULES_PATH, current_rules())
+
+def get_chat_ranking(chat_id: int) -> dict:
+    return user_data['ranking']['chats'].setdefault(chat_id, {
+        'users': {}, 'leaderboard': LeaderboardIndex(), 'exported_version': None, 'card': None
+    })
+
+def ranking_user(shard_key, shard: dict, user_id: int):
+    """A user's record in `shard`, read back from RANKING_SPILL_PATH if it was evicted as cold"""
+    user = shard['users'].get(user_id)
+    if user is None:
+        user = ranking_spill.take(f"{shard_key}:{user_id}")
+        if user is not None:
+            user['last_active'] = date.fromisoformat(user['last_active'])
+            shard['users'][user_id] = user
+            shard['leaderboard'].update(user_id, user)
+    return user
+
+def spilled_users(shard_key, user_ids) -> dict:
+    """{user_id: record} for cold records read from RANKING_SPILL_PATH and left there.
+    Runs on export_leaderboard's worker thread"""
+    records = ranking_spill.read_many([f"{shard_key}:{user_id}" for user_id in user_ids])
+    found = {}
+    for user_id in user_ids:
+        user = records.get(f"{shard_key}:{user_id}")
+        if user is not None:
+            user['last_active'] = date.fromisoformat(user['last_active'])
+            found[user_id] = user
+    return found
+
+def level_for(xp: int) -> int:
+    return xp // user_data['ranking']['settings']['xp_per_level'] + 1
+
+def update_global_ranking(user_id: int, user: dict, xp_gained: int):
+    """Fold one chat's XP change into the global view without touching other chats"""
+    shard = user_data['ranking']['global']
+    record = ranking_user('global', shard, user_id)
+    if record is None:
+        record = shard['users'][user_id] = {'xp': 0, 'level': 1}
+    record.update(name=user['name'], username=user['username'], last_active=user['last_active'])
+    record['xp'] += xp_gained
+    # From the summed XP: the highest chat level says nothing about XP earned across chats
+    record['level'] = level_for(record['xp'])
+    shard['leaderboard'].update(user_id, record)
 
 def update_leaderboard():
-    users = user_data['ranking']['users']
-    user_data['ranking']['leaderboard_cache'] = sorted(
-        users.keys(), key=lambda uid: (-users[uid]['level'], -users[uid]['xp'], users[uid]['last_active'])
-    )
+    for shard in list(user_data['ranking']['chats'].values()):
+        shard['leaderboard'].rebuild(shard['users'], keep_missing=True)
     user_data['ranking']['last_update'] = datetime.now()
 
+async def export_leaderboard():
+    os.makedirs(LEADERBOARD_SNAPSHOT_DIR, exist_ok=True)
+    shards = [('global', user_data['ranking']['global'])] + list(user_data['ranking']['chats'].items())
+    for name, shard in shards:
+        version = shard['leaderboard'].version
+        if shard['exported_version'] == version:
+            continue
+        # Only the ranking order is copied on the loop. Reading records, spilled ones in one
+        # batch, and serializing them, about a second for 100k users, happen on a thread
+        data = snapshot(shard['leaderboard'], shard['users'])
+        try:
+            await asyncio.to_thread(write_snapshot, os.path.join(LEADERBOARD_SNAPSHOT_DIR, f"{name}.json"), data,
+                                    lambda user_ids, name=name: spilled_users(name, user_ids))
+            shard['exported_version'] = version
+        except OSError as e:
+            logger.error(f"Leaderboard export failed for {name}: {e}")
+
 def is_shortener(domain: str) -> bool:
     shorteners = ['bit.ly', 'goo.gl', 't.co', 'tinyurl.com']
     return any(s in domain for s in shorteners)
@@ -334,16 +493,19 @@ def is_obfuscated(domain: str) -> bool:
     return any(re.search(p, domain) for p in patterns)
 
 # ========== RANKING SYSTEM ========== #
-async def handle_ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not user_data['enabled_features']['ranking_system']:
-        return
-
-    user_id = update.effective_user.id
-    user = user_data['ranking']['users'].setdefault(user_id, {
-        'name': update.effective_user.first_name, 'username': update.effective_user.username or "",
-        'xp': 0, 'level': 1, 'daily_streak': 0, 'last_active': datetime.now().date(),
-        'total_messages': 0, 'voice_messages': 0, 'photos_sent': 0
-    })
+def award_xp(chat_id: int, user_id: int, name: str, username: str, messages: int, xp: int):
+    """Credit `messages` messages worth `xp` in a chat's and the global ranking.
+    Returns the user's record if this took them to a new level, else None"""
+    shard = get_chat_ranking(chat_id)
+    user = ranking_user(chat_id, shard, user_id)
+    if user is None:
+        user = shard['users'][user_id] = {
+            'name': name, 'username': username, 'xp': 0, 'level': 1, 'daily_streak': 0,
+            'last_active': datetime.now().date(), 'total_messages': 0, 'voice_messages': 0, 'photos_sent': 0
+        }
+    # Follow renames, so the leaderboard and its card show the current name
+    user['name'], user['username'] = name, username
+    xp_before = user['xp']
     
     today = datetime.now().date()
     if user['last_active'] != today:
@@ -355,19 +517,37 @@ async def handle_ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if user['daily_streak'] >= days:
                 user['xp'] += bonus
     
-    user['total_messages'] += 1
-    user['xp'] += min(3, max(1, len((update.message.text or "").split())))
+    user['total_messages'] += messages
+    user['xp'] += xp
+    
+    # From XP, not one step per call: finish_catch_up() awards a whole backlog at once
+    level = level_for(user['xp'])
+    leveled_up = level > user['level']
+    user['level'] = max(level, user['level'])
+    
+    shard['leaderboard'].update(user_id, user)
+    if user_data['ranking']['settings']['global_leaderboard']:
+        update_global_ranking(user_id, user, user['xp'] - xp_before)
+    return user if leveled_up else None
+
+async def handle_ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not user_data['enabled_features']['ranking_system']:
+        return
+
+    sender = update.effective_user
+    xp = min(3, max(1, len((update.message.text or "").split())))
+    if catch_up.active:
+        # Backlog: fold per user and apply once in finish_catch_up(), without level-up notices
+        catch_up.fold_xp(update.effective_chat.id, sender.id, sender.first_name, sender.username or "", xp)
+        return
     
-    xp_needed = user['level'] * user_data['ranking']['settings']['xp_per_level']
-    if user['xp'] >= xp_needed:
-        user['level'] += 1
+    user = award_xp(update.effective_chat.id, sender.id, sender.first_name, sender.username or "", 1, xp)
+    if user is not None and load_governor.allows('ranking_system'):
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=f"🎉 {user['name']} leveled up to Level {user['level']}!",
             reply_to_message_id=update.message.message_id
         )
-    
-    update_leaderboard()
 
 async def rank_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['ranking_system']:
@@ -375,87 +555,108 @@ async def rank_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = update.effective_user.id
-    if user_id not in user_data['ranking']['users']:
+    shard = get_chat_ranking(update.effective_chat.id)
+    user = ranking_user(update.effective_chat.id, shard, user_id)
+    if user is None:
         await update.message.reply_text("You haven't earned any XP yet! Start chatting to level up! 🚀")
         return
     
-    user = user_data['ranking']['users'][user_id].copy()
+    user = user.copy()
     user.update({
-        'rank': user_data['ranking']['leaderboard_cache'].index(user_id) + 1,
+        'rank': shard['leaderboard'].rank(user_id),
         'settings': user_data['ranking']['settings'],
         'user_id': user_id
     })
     
     try:
-        rank_image = rank_generator.create_rank_card(user)
-        rank_title = get_rank_title(user['level'])
-        next_level = user['level'] + 1 if user['level'] < len(RANK_TITLES) else user['level']
-        xp_needed_next = next_level * user_data['ranking']['settings']['xp_per_level']
-        xp_to_next = xp_needed_next - user['xp']
-        
-        caption = (
-            f"🏆 {rank_title}\n📊 Level {user['level']} • Rank #{user['rank']}\n"
-            f"💫 {user['xp']:,} / {xp_needed_next:,} XP\n"
-            f"🎯 {xp_to_next:,} XP to next level\n🔥 {user.get('daily_streak', 0)} day streak"
-        )
-        
-        await update.message.reply_photo(
-            photo=rank_image, caption=caption,
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📈 Stats", callback_data="show_stats"), 
-                 InlineKeyboardButton("🏆 Leaderboard", callback_data="show_leaderboard")],
-                [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_rank")]
-            ])
-        )
+        rank_image = io.BytesIO(await render_pool.submit(RANK_CARD_SETTINGS, user))
+        caption = rank_caption(user)
+        sent = await update.message.reply_photo(photo=rank_image, caption=caption, reply_markup=rank_keyboard())
+        callback_coalescer.unchanged((sent.chat_id, sent.message_id), 'rank', rank_render_inputs(user), caption)
         
+    except RenderQueueFull:
+        await send_text_rank(update, user)
     except Exception as e:
         logger.error(f"Rank card failed: {e}")
         await send_text_rank(update, user)
 
+def rank_caption(user: dict) -> str:
+    next_level = user['level'] + 1 if user['level'] < len(RANK_TITLES) else user['level']
+    xp_needed_next = next_level * user_data['ranking']['settings']['xp_per_level']
+    return (
+        f"🏆 {get_rank_title(user['level'])}\n📊 Level {user['level']} • Rank #{user['rank']}\n"
+        f"💫 {user['xp']:,} / {xp_needed_next:,} XP\n"
+        f"🎯 {xp_needed_next - user['xp']:,} XP to next level\n🔥 {user.get('daily_streak', 0)} day streak"
+    )
+
+def rank_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("📈 Stats", callback_data="show_stats"), 
+         InlineKeyboardButton("🏆 Leaderboard", callback_data="show_leaderboard")],
+        [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_rank")]
+    ])
+
+def rank_render_inputs(user: dict) -> tuple:
+    """Everything the rank card image depends on; equal inputs give an identical card"""
+    return (user['name'], user['username'], user['level'], user['xp'], user['rank'], user.get('daily_streak', 0))
+
+async def edit_text_or_caption(query, text: str, reply_markup=None):
+    """Rank card views share one photo message, whose text lives in the caption"""
+    if query.message and query.message.photo:
+        await query.edit_message_caption(caption=text, parse_mode='HTML', reply_markup=reply_markup)
+    else:
+        await query.edit_message_text(text=text, parse_mode='HTML', reply_markup=reply_markup)
+
+def callback_key(query) -> tuple:
+    return (query.from_user.id, query.message.chat_id, query.message.message_id, query.data)
+
 async def refresh_rank_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """🔄 Refresh and 🔙 My Rank: concurrent or rapid repeat taps share one render and edit"""
     query = update.callback_query
     await query.answer()
+    await callback_coalescer.run(callback_key(query), lambda: refresh_rank(query, update.effective_chat.id))
+
+async def refresh_rank(query, chat_id: int):
     user_id = query.from_user.id
-    
-    if user_id not in user_data['ranking']['users']:
-        await query.edit_message_text("No rank data!")
+    shard = get_chat_ranking(chat_id)
+    user = ranking_user(chat_id, shard, user_id)
+    if user is None:
+        await edit_text_or_caption(query, "No rank data!")
         return
     
-    user = user_data['ranking']['users'][user_id].copy()
+    user = user.copy()
     user.update({
-        'rank': user_data['ranking']['leaderboard_cache'].index(user_id) + 1,
+        'rank': shard['leaderboard'].rank(user_id),
         'settings': user_data['ranking']['settings'],
         'user_id': user_id
     })
     
+    caption = rank_caption(user)
+    message_key = (query.message.chat_id, query.message.message_id)
+    if callback_coalescer.unchanged(message_key, 'rank', rank_render_inputs(user), caption):
+        return
+    
     try:
-        rank_image = rank_generator.create_rank_card(user)
-        rank_title = get_rank_title(user['level'])
-        next_level = user['level'] + 1 if user['level'] < len(RANK_TITLES) else user['level']
-        xp_needed_next = next_level * user_data['ranking']['settings']['xp_per_level']
-        xp_to_next = xp_needed_next - user['xp']
-        
-        caption = f"🏆 {rank_title}\n📊 Level {user['level']} • Rank #{user['rank']}\n💫 {user['xp']:,} / {xp_needed_next:,} XP"
-        
+        rank_image = io.BytesIO(await render_pool.submit(RANK_CARD_SETTINGS, user))
         await query.edit_message_media(
-            media=InputMediaPhoto(media=rank_image, caption=caption),
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("📈 Stats", callback_data="show_stats"), 
-                 InlineKeyboardButton("🏆 Leaderboard", callback_data="show_leaderboard")],
-                [InlineKeyboardButton("🔄 Refresh", callback_data="refresh_rank")]
-            ])
+            media=InputMediaPhoto(media=rank_image, caption=caption), reply_markup=rank_keyboard()
         )
+    except RenderQueueFull:
+        callback_coalescer.forget(message_key)
+        await send_text_rank(query, user)
     except Exception as e:
-        await query.edit_message_text("Error refreshing rank!")
+        callback_coalescer.forget(message_key)
+        logger.error(f"Rank refresh failed: {e}")
+        await edit_text_or_caption(query, "Error refreshing rank!")
 
 async def send_text_rank(update: Update, user_data: dict):
     user = user_data
     rank_title = get_rank_title(user['level'])
     next_level = user['level'] + 1 if user['level'] < len(RANK_TITLES) else user['level']
-    xp_needed_next = next_level * user_data['ranking']['settings']['xp_per_level']
+    xp_needed_next = next_level * user['settings']['xp_per_level']
     xp_to_next = xp_needed_next - user['xp']
-    progress = min(100, int((user['xp'] % user_data['ranking']['settings']['xp_per_level']) / 
-               user_data['ranking']['settings']['xp_per_level'] * 100))
+    progress = min(100, int((user['xp'] % user['settings']['xp_per_level']) / 
+               user['settings']['xp_per_level'] * 100))
     
     text_response = (
         f"🏆 <b>{user['name']}</b> (@{user['username']})\n\n{rank_title}\n"
@@ -466,35 +667,230 @@ async def send_text_rank(update: Update, user_data: dict):
     
     if isinstance(update, Update):
         await update.message.reply_html(text_response)
+    elif update.message and update.message.photo:
+        await update.edit_message_caption(caption=text_response, parse_mode='HTML')
     else:
         await update.edit_message_text(text_response, parse_mode='HTML')
 
+async def render_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    stats = render_pool.stats()
+    taps = callback_coalescer.stats
+    await update.message.reply_text(
+        f"🖼️ Rank card rendering ({stats['kind']} pool)\n"
+        f"• Rendered: {stats['renders']} • Errors: {stats['errors']}\n"
+        f"• Text fallbacks (queue full): {stats['fallbacks']}\n"
+        f"• In flight: {stats['in_flight']}/{RENDER_WORKERS + RENDER_QUEUE_LIMIT}\n"
+        f"• Render: {stats['render_ms_avg']:.0f} ms avg, {stats['render_ms_max']:.0f} ms max\n"
+        f"• Queue wait: {stats['queue_wait_ms_avg']:.0f} ms avg, {stats['queue_wait_ms_max']:.0f} ms max\n"
+        f"• Button taps: {taps['runs']} handled, {taps['coalesced']} coalesced, {taps['debounced']} debounced, "
+        f"{taps['unchanged']} unchanged edits skipped"
+        f"\n• Leaderboard cards: {leaderboard_card_stats['renders']} rendered, {leaderboard_card_stats['cached']} "
+        f"served from cache ({leaderboard_card_stats['file_id_hits']} by file_id)"
+    )
+
+async def rule_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    stats = rule_store.stats
+    counts = rule_store.rules.counts()
+    last_reload = datetime.fromtimestamp(stats['last_reload']).strftime('%H:%M:%S') if stats['last_reload'] else "never"
+    lines = [
+        f"📜 Moderation rules ({MODERATION_RULES_PATH})",
+        f"• Banned words: {counts['banned_words']} • Auto-responses: {counts['auto_responses']}",
+        f"• Allowed domains: {counts['allowed_domains']} • Blocked domains: {counts['blocked_domains']}",
+        f"• Link mode: {rule_store.rules.link_mode}",
+        f"• Reloads: {stats['reloads']} (last {last_reload}, {stats['last_reload_ms']:.1f} ms)",
+        f"• Failed reloads: {stats['errors']}" + (f" — {stats['last_error']}" if stats['last_error'] else "")
+    ]
+    for key, (added, removed) in stats['last_diff'].items():
+        lines.append(f"• {key}: +{len(added)} / -{len(removed)}")
+    for pattern, reason in rule_store.rules.rejected.items():
+        lines.append(f"• Skipped pattern {pattern!r}: {reason}")
+    for pattern, seconds in pattern_budget.disabled.items():
+        lines.append(f"• Disabled pattern {pattern!r}: took {seconds * 1000:.0f} ms (re-add it to enable)")
+    if pattern_budget.stats['slowest']:
+        lines.append(f"• Slowest auto-response search: {pattern_budget.stats['slowest_ms']:.2f} ms "
+                     f"({pattern_budget.stats['slowest']!r}), {pattern_budget.stats['cut_short']} messages over budget")
+    await update.message.reply_text("\n".join(lines))
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    try:
+        seconds = min(max(int(context.args[0]), 1), PROFILE_MAX_SECONDS) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text(f"Usage: /profile [seconds, max {PROFILE_MAX_SECONDS}]")
+        return
+    if profiler.running:
+        await update.message.reply_text("⏱️ A profile is already running")
+        return
+    
+    # Handlers run on the event loop thread, so that is the thread to sample
+    profiler.start(threading.get_ident(), seconds)
+    await update.message.reply_text(f"⏱️ Profiling the event loop for {seconds}s...")
+    # Updates are handled one at a time, so waiting here would leave nothing to profile
+    context.application.create_task(send_profile(update, seconds), update=update)
+
+async def send_profile(update: Update, seconds: int):
+    await asyncio.sleep(seconds)
+    await asyncio.get_running_loop().run_in_executor(None, profiler.join)
+    
+    summary = profiler.summary()
+    busy = summary['samples'] - summary['idle']
+    lines = [f"⏱️ CPU profile: {summary['samples']} samples over {seconds}s, event loop busy {busy / max(1, summary['samples']):.0%}"]
+    lines.append("\nBy handler:")
+    lines += [f"• {name}: {count / max(1, busy):.0%}" for name, count in summary['handlers']]
+    lines.append("\nTop functions (own time):")
+    lines += [f"• {label}: {count / max(1, busy):.0%}" for label, count in summary['own']]
+    await update.message.reply_text("\n".join(lines))
+    
+    if busy:
+        stamp = datetime.fromtimestamp(profiler.started).strftime('%Y%m%d-%H%M%S')
+        await update.message.reply_document(
+            document=io.BytesIO(profiler.folded().encode('utf-8')), filename=f"profile-{stamp}.folded",
+            caption="Collapsed stacks: open in speedscope.app or flamegraph.pl"
+        )
+
+async def heap_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    action = context.args[0].lower() if context.args else "diff"
+    if action == "start":
+        heap_tracker.start()
+        await update.message.reply_text("🧠 Allocation tracing on, baseline taken.\n/heap shows growth since then, /heap stop ends tracing")
+        return
+    if action == "stop":
+        heap_tracker.stop()
+        await update.message.reply_text("🧠 Allocation tracing off")
+        return
+    if not heap_tracker.running:
+        await update.message.reply_text("🧠 Not tracing. Start with /heap start")
+        return
+    
+    rows = await asyncio.get_running_loop().run_in_executor(None, heap_tracker.diff)
+    current, peak = heap_tracker.current()
+    lines = [f"🧠 Traced memory: {current / 2**20:.1f} MB (peak {peak / 2**20:.1f} MB)\nGrowth since baseline:"]
+    for site, handler, size_diff, count_diff in rows:
+        lines.append(f"• {site} [{handler or '-'}]: {size_diff / 1024:+.1f} KB, {count_diff:+d} blocks")
+    await update.message.reply_text("\n".join(lines))
+
+def render_leaderboard_page(shard_key, shard: dict, offset: int, title: str) -> str:
+    lines = []
+    for rank, user_id in shard['leaderboard'].page(offset, LEADERBOARD_PAGE_SIZE):
+        u = ranking_user(shard_key, shard, user_id)
+        lines.append(f"{rank}. {u['name']} (@{u['username']}) - Level {u['level']} ({u['xp']} XP)")
+    return f"🏆 <b>{title} #{offset + 1}-{offset + len(lines)}</b> 🏆\n\n" + "\n".join(lines)
+
+leaderboard_card_stats = {'renders': 0, 'cached': 0, 'file_id_hits': 0}
+
+async def leaderboard_card(shard_key, shard: dict, title: str) -> dict:
+    """The shard's top-LEADERBOARD_CARD_SIZE image: {'epoch', 'task', 'file_id'}.
+    It is rendered again only when the top order or anything drawn for them (name, username,
+    level) changes. Taps that arrive while it renders wait for the same render"""
+    entries = [
+        {'rank': rank, **{k: ranking_user(shard_key, shard, uid)[k] for k in ('name', 'username', 'level')}}
+        for rank, uid in shard['leaderboard'].page(0, LEADERBOARD_CARD_SIZE)
+    ]
+    epoch = tuple((e['rank'], e['name'], e['username'], e['level']) for e in entries)
+    card = shard['card']
+    if card is not None and card['epoch'] == epoch:
+        leaderboard_card_stats['cached'] += 1
+    else:
+        task = asyncio.ensure_future(
+            render_pool.submit_call(render_leaderboard_card, RANK_CARD_SETTINGS, entries, title)
+        )
+        card = shard['card'] = {'epoch': epoch, 'task': task, 'file_id': None}
+        leaderboard_card_stats['renders'] += 1
+    try:
+        await card['task']
+    except Exception:
+        if shard['card'] is card:
+            shard['card'] = None
+        raise
+    return card
+
 async def leaderboard_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    leaderboard = []
-    for idx, user_id in enumerate(user_data['ranking']['leaderboard_cache'][:10], 1):
-        u = user_data['ranking']['users'][user_id]
-        leaderboard.append(f"{idx}. {u['name']} (@{u['username']}) - Level {u['level']} ({u['xp']} XP)")
+    # callback_data: "show_leaderboard" or "show_leaderboard:<chat|global>:<offset|me>"
+    parts = query.data.split(':')
+    scope, arg = (parts[1], parts[2]) if len(parts) == 3 else ("chat", "0")
+    if scope == "global" and user_data['ranking']['settings']['global_leaderboard']:
+        shard_key, title = "global", "GLOBAL LEADERBOARD"
+        shard = user_data['ranking']['global']
+    else:
+        scope, shard_key, title = "chat", update.effective_chat.id, "LEADERBOARD"
+        shard = get_chat_ranking(shard_key)
+    leaderboard = shard['leaderboard']
     
-    await query.edit_message_text(
-        text="🏆 <b>TOP 10 USERS</b> 🏆\n\n" + "\n".join(leaderboard),
-        parse_mode='HTML', reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔙 My Rank", callback_data="show_my_rank")]
-        ])
-    )
+    if arg == "me":
+        offset = leaderboard.offset_around(query.from_user.id, LEADERBOARD_PAGE_SIZE)
+    else:
+        offset = int(arg) if arg.isdigit() else 0
+    offset = min(offset, max(0, len(leaderboard) - 1))
+    
+    text = leaderboard.cached(('page', offset), lambda: render_leaderboard_page(shard_key, shard, offset, title))
+    
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"show_leaderboard:{scope}:{max(0, offset - LEADERBOARD_PAGE_SIZE)}"))
+    if offset + LEADERBOARD_PAGE_SIZE < len(leaderboard):
+        nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"show_leaderboard:{scope}:{offset + LEADERBOARD_PAGE_SIZE}"))
+    
+    other_scope = []
+    if user_data['ranking']['settings']['global_leaderboard']:
+        other_scope = [InlineKeyboardButton("🏠 This Chat", callback_data="show_leaderboard:chat:0") if scope == "global"
+                       else InlineKeyboardButton("🌍 Global", callback_data="show_leaderboard:global:0")]
+    
+    markup = InlineKeyboardMarkup([
+        nav,
+        [InlineKeyboardButton("📍 Around Me", callback_data=f"show_leaderboard:{scope}:me")] + other_scope,
+        [InlineKeyboardButton("🔙 My Rank", callback_data="show_my_rank")]
+    ])
+    callback_coalescer.forget((query.message.chat_id, query.message.message_id))
+    if query.message.photo:
+        # Rank card messages swap to the rendered top-k card, with this page as the caption
+        try:
+            card = await leaderboard_card(shard_key, shard, title)
+            if card['file_id']:
+                leaderboard_card_stats['file_id_hits'] += 1
+            media = card['file_id'] or card['task'].result()
+            edited = await query.edit_message_media(
+                media=InputMediaPhoto(media=media, caption=text, parse_mode='HTML'), reply_markup=markup
+            )
+            if card['file_id'] is None and getattr(edited, 'photo', None):
+                card['file_id'] = edited.photo[-1].file_id
+            return
+        except RenderQueueFull:
+            pass
+        except Exception as e:
+            logger.error("Leaderboard card failed: %s", e)
+    await edit_text_or_caption(query, text, markup)
 
 async def show_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+    await callback_coalescer.run(callback_key(query), lambda: send_user_stats(query, update.effective_chat.id))
+
+async def send_user_stats(query, chat_id: int):
     user_id = query.from_user.id
-    
-    if user_id not in user_data['ranking']['users']:
-        await query.edit_message_text("No stats available!")
+    shard = get_chat_ranking(chat_id)
+    user = ranking_user(chat_id, shard, user_id)
+    if user is None:
+        await edit_text_or_caption(query, "No stats available!")
         return
     
-    user = user_data['ranking']['users'][user_id]
     total_xp = user['xp']
     level = user['level']
     messages = user.get('total_messages', 0)
@@ -508,15 +904,22 @@ async def show_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• To Next: {level * user_data['ranking']['settings']['xp_per_level'] - total_xp}\n\n"
         f"💬 <b>Activity</b>\n• Messages: {messages:,}\n• Voice: {voice_messages}\n"
         f"• Photos: {photos}\n• Streak: {streak} days 🔥\n\n"
-        f"📈 <b>Ranking</b>\n• Global: #{user_data['ranking']['leaderboard_cache'].index(user_id) + 1}"
+        f"📈 <b>Ranking</b>\n• Chat: #{shard['leaderboard'].rank(user_id)}"
     )
+    global_rank = user_data['ranking']['global']['leaderboard'].rank(user_id)
+    if user_data['ranking']['settings']['global_leaderboard'] and global_rank:
+        stats_text += f"\n• Global: #{global_rank}"
     
-    await query.edit_message_text(
-        text=stats_text, parse_mode='HTML',
-        reply_markup=InlineKeyboardMarkup([
+    message_key = (query.message.chat_id, query.message.message_id)
+    if callback_coalescer.unchanged(message_key, 'stats', stats_text):
+        return
+    try:
+        await edit_text_or_caption(query, stats_text, InlineKeyboardMarkup([
             [InlineKeyboardButton("🔙 Back", callback_data="show_my_rank")]
-        ])
-    )
+        ]))
+    except Exception:
+        callback_coalescer.forget(message_key)
+        raise
 
 # ========== MESSAGE COUNTING ========== #
 async def count_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -529,17 +932,28 @@ async def count_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.text and update.message.text.startswith('/'):
         return
     
-    if chat_id not in user_data['message_counts']:
-        user_data['message_counts'][chat_id] = {}
+    counts = user_data['message_counts'].get(chat_id)
+    if counts is None:
+        counts = SpaceSaving(HEAVY_HITTER_CAPACITY) if MESSAGE_COUNT_MODE == "approx" else {}
+        user_data['message_counts'][chat_id] = counts
     
-    user_data['message_counts'][chat_id][user_id] = user_data['message_counts'][chat_id].get(user_id, 0) + 1
+    if isinstance(counts, SpaceSaving):
+        counts.add(user_id)
+    else:
+        counts[user_id] = counts.get(user_id, 0) + 1
 
 async def message_count_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     counts = user_data['message_counts'].get(chat_id, {})
-    user_count = counts.get(user_id, 0)
-    top_users = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:5]
+    
+    if isinstance(counts, SpaceSaving):
+        user_count, lower_bound = counts.track_exact(user_id)
+        user_count = f"{user_count}+" if lower_bound else user_count
+        top_users = [(uid, f"~{count}") for uid, count, _ in counts.top_k()]
+    else:
+        user_count = counts.get(user_id, 0)
+        top_users = sorted(counts.items(), key=lambda x: x[1], reverse=True)[:5]
     
     response = [f"📊 Your messages: {user_count}", "\n🏆 Top chatters:"]
     for idx, (uid, count) in enumerate(top_users, 1):
@@ -548,6 +962,8 @@ async def message_count_command(update: Update, context: ContextTypes.DEFAULT_TY
             response.append(f"{idx}. {user.user.first_name}: {count}")
         except: continue
     
+    if isinstance(counts, SpaceSaving):
+        response.append(f"\n(approximate, within ±{counts.error_bound})")
     await update.message.reply_text("\n".join(response))
 
 # ========== TRUTH OR DARE ========== #
@@ -557,19 +973,21 @@ async def truth_or_dare_start(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     chat_id = update.effective_chat.id
-    user_data['truth_or_dare']['active_players'][chat_id] = []
+    user_data['truth_or_dare']['active_players'][chat_id] = set()
     await update.message.reply_text("🎮 Truth or Dare started! Use /tod_join to join!")
 
 async def join_tod(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
-    if chat_id not in user_data['truth_or_dare']['active_players']:
+    players = user_data['truth_or_dare']['active_players'].get(chat_id)
+    if players is None:
         await update.message.reply_text("❌ No active game. Start with /truthordare")
         return
     
-    if user_id not in user_data['truth_or_dare']['active_players'][chat_id]:
-        user_data['truth_or_dare']['active_players'][chat_id].append(user_id)
+    user_data['truth_or_dare']['active_players'].touch(chat_id)
+    if user_id not in players:
+        players.add(user_id)
         await update.message.reply_text(f"✅ {update.effective_user.first_name} joined!")
     else:
         await update.message.reply_text("⚠️ Already in game")
@@ -584,16 +1002,27 @@ async def _get_tod_item(update: Update, context: ContextTypes.DEFAULT_TYPE, item
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
-    if (chat_id not in user_data['truth_or_dare']['active_players'] or 
-        user_id not in user_data['truth_or_dare']['active_players'][chat_id]):
+    players = user_data['truth_or_dare']['active_players'].get(chat_id)
+    if players is None or user_id not in players:
         await update.message.reply_text("❌ Join first with /tod_join")
         return
     
+    user_data['truth_or_dare']['active_players'].touch(chat_id)
     items = user_data['truth_or_dare'][f"{item_type}s"]
     selected = random.choice(items)
     await update.message.reply_text(f"🔮 {update.effective_user.first_name}, your {item_type}:\n\n{selected}")
 
 # ========== WORD GAME ========== #
+def load_word_bank() -> WordBank:
+    bank = user_data['word_games']['word_bank']
+    if bank is None:
+        if os.path.exists(WORD_BANK_PATH):
+            bank = WordBank(WORD_BANK_PATH)
+        else:
+            bank = WordBank.from_entries(DEFAULT_WORD_BANK)
+        user_data['word_games']['word_bank'] = bank
+    return bank
+
 async def start_word_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['word_games']:
         await update.message.reply_text("Word games disabled!")
@@ -601,18 +1030,16 @@ async def start_word_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     chat_id = update.effective_chat.id
     category_filter = context.args[0].lower() if context.args else None
-    available_words = user_data['word_games']['word_bank']
+    bank = load_word_bank()
     
-    if category_filter:
-        available_words = [w for w in available_words if w['category'] == category_filter]
-        if not available_words:
-            categories = ", ".join(user_data['word_games']['categories'])
-            await update.message.reply_text(f"❌ No words in '{category_filter}'\nAvailable: {categories}")
-            return
+    word_data = bank.random_entry(category_filter)
+    if word_data is None:
+        categories = ", ".join(bank.categories)
+        await update.message.reply_text(f"❌ No words in '{category_filter}'\nAvailable: {categories}")
+        return
     
-    word_data = random.choice(available_words)
     user_data['word_games']['active_games'][chat_id] = {
-        'word': word_data['word'].lower(), 'hint': word_data['hint'],
+        'word': word_data['word'], 'hint': word_data['hint'], 'hints': word_data['hints'],
         'category': word_data['category'], 'attempts': 0, 'hints_used': 0, 'max_hints': 3
     }
     
@@ -636,13 +1063,7 @@ async def word_game_hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     game['hints_used'] += 1
-    word = game['word']
-    hints = [
-        f"📏 Word has {len(word)} letters", f"🔤 Starts with '{word[0]}'",
-        f"🏷️ Category: {game['category']}", f"🎯 Letters: {', '.join(sorted(set(word)))}"
-    ]
-    
-    hint = hints[game['hints_used'] - 1] if game['hints_used'] <= len(hints) else f"🔍 Try: {word[0]}{'_' * (len(word)-2)}{word[-1]}"
+    hint = game['hints'][min(game['hints_used'], len(game['hints'])) - 1]
     await update.message.reply_text(f"💡 Hint #{game['hints_used']}: {hint}")
 
 async def handle_word_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -723,7 +1144,7 @@ async def block_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"ℹ️ {domain} already blocked")
     else:
         user_data['link_protection']['blocked_domains'].append(domain)
-        await update.message.reply_text(f"✅ Added {domain} to blocked list")
+        await update.message.reply_text(save_rules(f"✅ Added {domain} to blocked list"))
 
 async def unblock_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(update):
@@ -737,7 +1158,7 @@ async def unblock_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
     domain = clean_domain(context.args[0])
     if domain in user_data['link_protection']['blocked_domains']:
         user_data['link_protection']['blocked_domains'].remove(domain)
-        await update.message.reply_text(f"✅ Removed {domain} from blocked list")
+        await update.message.reply_text(save_rules(f"✅ Removed {domain} from blocked list"))
     else:
         await update.message.reply_text(f"ℹ️ {domain} wasn't blocked")
 
@@ -747,14 +1168,14 @@ async def set_link_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if not context.args:
-        modes = "\n".join(["strict", "whitelist", "blacklist"])
+        modes = "\n".join(LINK_MODES)
         await update.message.reply_text(f"Current: {user_data['link_protection']['mode']}\nModes: {modes}")
         return
     
     mode = context.args[0].lower()
-    if mode in ["strict", "whitelist", "blacklist"]:
+    if mode in LINK_MODES:
         user_data['link_protection']['mode'] = mode
-        await update.message.reply_text(f"✅ Link mode: {mode}")
+        await update.message.reply_text(save_rules(f"✅ Link mode: {mode}"))
     else:
         await update.message.reply_text("❌ Invalid mode")
 
@@ -768,9 +1189,73 @@ async def list_domains(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(
         f"🛡️ Domains:\n=== Allowed ===\n{allowed}\n\n=== Blocked ===\n{blocked}\n\n"
+        f"Bulk blocklist: {len(user_data['link_protection']['bulk_blocklist'])} domains\n"
         f"Mode: {user_data['link_protection']['mode'].upper()}"
     )
 
+blocklist_import_lock = asyncio.Lock()  # one import at a time: they share BLOCKLIST_PATH's temp file
+
+def import_blocklist(paths: list) -> tuple:
+    """Merge blocklist files into BLOCKLIST_PATH; runs in a worker thread. Returns (new blocklist, seconds)"""
+    started = time.perf_counter()
+    current = user_data['link_protection']['bulk_blocklist']
+    write_blocklist(BLOCKLIST_PATH, chain(current, read_domains(paths)))
+    return DomainBlocklist(BLOCKLIST_PATH), time.perf_counter() - started
+
+async def import_blocklist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    replied = update.message.reply_to_message
+    document = replied.document if replied else None
+    if not document and not context.args:
+        await update.message.reply_text(
+            "Usage: reply to a blocklist file with /importblocklist\n"
+            f"or /importblocklist <file> for a file in {BLOCKLIST_IMPORT_DIR}/\n"
+            "Formats: one domain per line, hosts file or ||domain^"
+        )
+        return
+    
+    if document:
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            await (await context.bot.get_file(document.file_id)).download_to_drive(path)
+        except Exception as e:
+            os.remove(path)
+            logger.error(f"Blocklist download failed: {e}")
+            await update.message.reply_text("❌ Couldn't download that file")
+            return
+    else:
+        # Basename only: admins can import prepared lists, not read arbitrary server files
+        path = os.path.join(BLOCKLIST_IMPORT_DIR, os.path.basename(context.args[0]))
+        if not os.path.isfile(path):
+            await update.message.reply_text(f"❌ No such file in {BLOCKLIST_IMPORT_DIR}/")
+            return
+    
+    if blocklist_import_lock.locked():
+        await update.message.reply_text("⏳ Another import is running, this one starts when it is done")
+    try:
+        async with blocklist_import_lock:
+            await update.message.reply_text("⏳ Importing blocklist...")
+            old = user_data['link_protection']['bulk_blocklist']
+            before = len(old)
+            blocklist, seconds = await asyncio.to_thread(import_blocklist, [path])
+            user_data['link_protection']['bulk_blocklist'] = blocklist
+            old.close()
+    except (OSError, ValueError) as e:
+        logger.error(f"Blocklist import failed: {e}")
+        await update.message.reply_text(f"❌ Import failed: {e}")
+        return
+    finally:
+        if document:
+            os.remove(path)
+    
+    await update.message.reply_text(
+        f"✅ Blocklist imported in {seconds:.1f}s: {len(blocklist) - before} new domains, {len(blocklist)} total"
+    )
+
 async def add_allowed_domain(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(update):
         await update.message.reply_text("❌ Admins only")
@@ -786,19 +1271,97 @@ async def add_allowed_domain(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(f"ℹ️ {domain} already allowed")
     else:
         user_data['link_protection']['allowed_domains'].append(domain)
-        await update.message.reply_text(f"✅ Added {domain} to allowed list")
+        await update.message.reply_text(save_rules(f"✅ Added {domain} to allowed list"))
 
 # ========== WARNING SYSTEM ========== #
-async def warnings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    chat_id = update.effective_chat.id
-    key = f"{chat_id}_{user_id}"
-    warnings = user_data['warnings'].get(key, 0)
+def format_duration(seconds: float) -> str:
+    if seconds >= 86400:
+        return f"{seconds / 86400:.0f}d"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.0f}h"
+    return f"{max(1, seconds // 60):.0f}m"
+
+async def issue_warning(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user, reason: str) -> int:
+    """Record a warning for `user`; at WARN_LIMIT escalate to the next mute/ban step.
+    Returns the active warning count (0 after an escalation)"""
+    key = (chat_id, user.id)
+    count = user_data['warnings'].add(key)
+    if count < WARN_LIMIT or not user_data['enabled_features']['auto_mute']:
+        return count
+    
+    punishments = user_data['punishments']
+    action, duration = WARN_ESCALATION[min(punishments.strikes.get(key, 0), len(WARN_ESCALATION) - 1)]
+    until = datetime.now() + timedelta(seconds=duration)
+    try:
+        if action == "ban":
+            await context.bot.ban_chat_member(chat_id=chat_id, user_id=user.id, until_date=until)
+        else:
+            await context.bot.restrict_chat_member(
+                chat_id=chat_id, user_id=user.id, permissions=ChatPermissions(can_send_messages=False), until_date=until
+            )
+    except Exception as e:
+        logger.error("Warning escalation failed: %s", e)
+        return count
     
-    await update.message.reply_text(
-        f"⚠️ You have {warnings}/{WARN_LIMIT} warnings\n"
-        f"{'You will be banned on the next warning!' if warnings >= WARN_LIMIT - 1 else ''}"
+    punishments.schedule(chat_id, user.id, action, until.timestamp())
+    user_data['warnings'].clear(key)
+    verb = "banned" if action == "ban" else "muted"
+    await context.bot.send_message(
+        chat_id=chat_id, text=f"🔨 {user.first_name} {verb} for {format_duration(duration)} ({WARN_LIMIT} warnings: {reason})"
     )
+    return 0
+
+async def lift_punishments(context: ContextTypes.DEFAULT_TYPE):
+    """Undo escalation mutes/bans whose time is up, including ones from before a restart,
+    and raid lockdowns that no running raid will lift"""
+    punishments = user_data['punishments']
+    for chat_id, permissions in list(punishments.lockdowns.items()):
+        if raid_detector.in_raid(chat_id):
+            continue  # check_raids() lifts it
+        try:
+            await context.bot.set_chat_permissions(chat_id=chat_id, permissions=ChatPermissions.de_json(permissions))
+            punishments.unlock(chat_id)
+            await context.bot.send_message(chat_id=chat_id, text="🔓 Chat unlocked: its raid lockdown outlived a restart.")
+        except Exception as e:
+            logger.error(f"Lifting raid lockdown in {chat_id} failed: {e}")
+    for chat_id, user_id, action in punishments.due():
+        try:
+            if action == "ban":
+                await context.bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
+            else:
+                chat = await context.bot.get_chat(chat_id)
+                await context.bot.restrict_chat_member(
+                    chat_id=chat_id, user_id=user_id, permissions=chat.permissions or MEMBER_PERMISSIONS
+                )
+        except Exception as e:
+            logger.error(f"Lifting {action} for {user_id} in {chat_id} failed: {e}")
+
+async def warn_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    target = update.message.reply_to_message
+    if not target:
+        await update.message.reply_text("Usage: reply to a message with /warn [reason]")
+        return
+    
+    reason = " ".join(context.args) or "warned by an admin"
+    count = await issue_warning(context, update.effective_chat.id, target.from_user, reason)
+    if count:
+        await update.message.reply_text(f"⚠️ {target.from_user.first_name} warned ({count}/{WARN_LIMIT}): {reason}")
+
+async def warnings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    key = (update.effective_chat.id, update.effective_user.id)
+    warnings = user_data['warnings'].count(key)
+    next_expiry = user_data['warnings'].next_expiry(key)
+    
+    lines = [f"⚠️ You have {warnings}/{WARN_LIMIT} warnings"]
+    if warnings >= WARN_LIMIT - 1:
+        lines.append("You will be muted on the next warning!")
+    if next_expiry:
+        lines.append(f"Oldest warning expires in {format_duration(next_expiry)}")
+    await update.message.reply_text("\n".join(lines))
 
 async def report_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['report_system']:
@@ -829,6 +1392,12 @@ async def set_welcome(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /setwelcome <message>\nVariables: {name}, {username}, {chat}")
         return
     
+    try:
+        compile_template(" ".join(context.args))
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    
     user_data['welcome_message'] = " ".join(context.args)
     await update.message.reply_text("✅ Welcome message updated!")
 
@@ -841,34 +1410,132 @@ async def set_goodbye(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /setgoodbye <message>\nVariables: {name}, {username}, {chat}")
         return
     
+    try:
+        compile_template(" ".join(context.args))
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    
     user_data['goodbye_message'] = " ".join(context.args)
     await update.message.reply_text("✅ Goodbye message updated!")
 
 async def welcome_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not user_data['enabled_features']['welcome_message']:
+    chat = update.effective_chat
+    if user_data['enabled_features']['anti_raid']:
+        if raid_detector.record_joins(chat.id, [member.id for member in update.message.new_chat_members]):
+            await start_lockdown(context, chat.id)
+        if raid_detector.in_raid(chat.id):
+            return
+    
+    if not feature_active('welcome_message'):
+        return
+    if stale_reply(update):
         return
     
+    template = compile_template(user_data['welcome_message'])
     for member in update.message.new_chat_members:
-        welcome_text = user_data['welcome_message'].format(
-            name=member.first_name, username=member.username or "user", chat=update.effective_chat.title
+        await greeting_batcher.add(
+            context.bot, chat.id, "welcome", member.first_name, chat.title,
+            lambda m=member: template.render(name=m.first_name, username=m.username or "user", chat=chat.title),
+            compile_template(WELCOME_BATCH_MESSAGE)
         )
-        await update.message.reply_text(welcome_text)
 
 async def goodbye_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not user_data['enabled_features']['goodbye_message']:
+    if not feature_active('goodbye_message'):
+        return
+    if stale_reply(update):
         return
     
-    for member in update.message.left_chat_members:
-        goodbye_text = user_data['goodbye_message'].format(
-            name=member.first_name, username=member.username or "user", chat=update.effective_chat.title
+    template = compile_template(user_data['goodbye_message'])
+    chat = update.effective_chat
+    for member in [update.message.left_chat_member]:
+        await greeting_batcher.add(
+            context.bot, chat.id, "goodbye", member.first_name, chat.title,
+            lambda m=member: template.render(name=m.first_name, username=m.username or "user", chat=chat.title),
+            compile_template(GOODBYE_BATCH_MESSAGE)
         )
-        await update.message.reply_text(goodbye_text)
+
+# ========== ANTI-RAID ========== #
+def raid_probation(chat_id: int, user_id: int) -> bool:
+    """New members get stricter link and flood rules while their chat is being raided"""
+    return (user_data['enabled_features']['anti_raid'] and raid_detector.in_raid(chat_id)
+            and raid_detector.is_newcomer(chat_id, user_id))
+
+async def start_lockdown(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    raid = raid_detector.raids[chat_id]
+    try:
+        chat = await context.bot.get_chat(chat_id)
+        raid['saved_permissions'] = chat.permissions or MEMBER_PERMISSIONS
+        # Saved before locking: after a restart, lift_punishments() finds what to restore
+        user_data['punishments'].lock(chat_id, raid['saved_permissions'].to_dict())
+        await context.bot.set_chat_permissions(chat_id=chat_id, permissions=ChatPermissions(can_send_messages=False))
+        raid['locked'] = True
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"🚨 Raid detected: {raid['joins']} joins in {RAID_WINDOW}s. Chat locked for "
+                 f"{format_duration(RAID_LOCKDOWN)}; new members stay restricted until it calms down."
+        )
+    except Exception as e:
+        logger.error(f"Raid lockdown failed in {chat_id}: {e}")
+        if not raid['locked']:
+            user_data['punishments'].unlock(chat_id)
+
+async def unlock_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int, raid: dict):
+    raid['locked'] = False
+    await context.bot.set_chat_permissions(chat_id=chat_id, permissions=raid['saved_permissions'])
+    # Kept when that failed: lift_punishments() retries once the raid is over
+    user_data['punishments'].unlock(chat_id)
+
+async def check_raids(context: ContextTypes.DEFAULT_TYPE):
+    """Lift lockdowns after RAID_LOCKDOWN and close raids that have calmed down"""
+    now = raid_detector.clock()
+    for chat_id, raid in list(raid_detector.raids.items()):
+        if raid['locked'] and now - raid['started'] >= RAID_LOCKDOWN:
+            try:
+                await unlock_chat(context, chat_id, raid)
+                await context.bot.send_message(chat_id=chat_id, text="🔓 Chat unlocked. New members are still on probation.")
+            except Exception as e:
+                logger.error(f"Raid unlock failed in {chat_id}: {e}")
+    
+    for chat_id, raid in raid_detector.ended():
+        try:
+            if raid['locked']:
+                await unlock_chat(context, chat_id, raid)
+            await context.bot.send_message(chat_id=chat_id, text=f"✅ Raid over ({raid['joins']} joins). Welcomes are back on.")
+        except Exception as e:
+            logger.error(f"Raid end notice failed in {chat_id}: {e}")
+
+# ========== MEDIA CACHE ========== #
+async def send_cached_media(message, kind: str, url: str, caption: str, **kwargs):
+    """Send a remote photo/video through media_cache: reuse the Telegram file_id
+    when we have one, otherwise stream the cached file from disk"""
+    reply = message.reply_video if kind == "video" else message.reply_photo
+    file_id = media_cache.file_id(url)
+    if file_id:
+        return await reply(file_id, caption=caption, **kwargs)
+
+    try:
+        f = await media_cache.open(url)
+    except MediaFetchError as e:
+        logger.error("Media cache miss, sending URL: %s", e)
+        return await reply(url, caption=caption, **kwargs)
+
+    with f:
+        media = InputFile(f, filename=os.path.basename(url.split('?')[0]) or kind, read_file_handle=False)
+        sent = await reply(media, caption=caption, **kwargs)
+    media_cache.remember_file_id(url, sent.video.file_id if kind == "video" else sent.photo[-1].file_id)
+    return sent
 
 # ========== MEME SYSTEM ========== #
 async def meme_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['meme']:
         await update.message.reply_text("❌ Memes disabled!")
         return
+    if not load_governor.allows('meme'):
+        await update.message.reply_text(LOAD_BUSY_REPLY)
+        return
+    if stale_reply(update):
+        return
     
     enabled_categories = user_data['meme_categories']['enabled']
     if not enabled_categories:
@@ -878,7 +1545,7 @@ async def meme_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     category = random.choice(enabled_categories)
     if category in MEME_DATABASE and MEME_DATABASE[category]:
         meme_url = random.choice(MEME_DATABASE[category])
-        await update.message.reply_photo(photo=meme_url, caption=f"Here's your {category} meme! 😄")
+        await send_cached_media(update.message, "photo", meme_url, f"Here's your {category} meme! 😄")
     else:
         await update.message.reply_text("❌ No memes available!")
 
@@ -886,6 +1553,11 @@ async def meme_category_command(update: Update, context: ContextTypes.DEFAULT_TY
     if not user_data['enabled_features']['meme']:
         await update.message.reply_text("❌ Memes disabled!")
         return
+    if not load_governor.allows('meme'):
+        await update.message.reply_text(LOAD_BUSY_REPLY)
+        return
+    if stale_reply(update):
+        return
     
     if not context.args:
         categories = ", ".join(user_data['meme_categories']['enabled'])
@@ -903,7 +1575,7 @@ async def meme_category_command(update: Update, context: ContextTypes.DEFAULT_TY
     
     if MEME_DATABASE[category]:
         meme_url = random.choice(MEME_DATABASE[category])
-        await update.message.reply_photo(photo=meme_url, caption=f"Here's your {category} meme! 🎭")
+        await send_cached_media(update.message, "photo", meme_url, f"Here's your {category} meme! 🎭")
     else:
         await update.message.reply_text("❌ No memes in this category!")
 
@@ -927,6 +1599,11 @@ async def video_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['video']:
         await update.message.reply_text("❌ Videos disabled!")
         return
+    if not load_governor.allows('video'):
+        await update.message.reply_text(LOAD_BUSY_REPLY)
+        return
+    if stale_reply(update):
+        return
     
     if not context.args:
         await update.message.reply_text("Usage: /video [360|720|1080|4k]\nExample: /video 720")
@@ -940,16 +1617,26 @@ async def video_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if quality in VIDEO_DATABASE:
         selected = random.choice(VIDEO_DATABASE[quality])
         try:
-            await update.message.reply_video(
-                video=selected["url"], caption=f"{selected['caption']} (Quality: {quality})", supports_streaming=True
+            await send_cached_media(
+                update.message, "video", selected["url"], f"{selected['caption']} (Quality: {quality})",
+                supports_streaming=True
             )
         except Exception as e:
-            logger.error(f"Video failed: {str(e)}")
+            logger.error("Video failed: %s", e)
             await update.message.reply_text(f"❌ Couldn't send {quality} video.")
     else:
         await update.message.reply_text("❌ Video not available")
 
 async def short_video_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not user_data['enabled_features']['video']:
+        await update.message.reply_text("❌ Videos disabled!")
+        return
+    if not load_governor.allows('video'):
+        await update.message.reply_text(LOAD_BUSY_REPLY)
+        return
+    if stale_reply(update):
+        return
+    
     if not context.args:
         categories = ", ".join(SHORT_VIDEOS.keys())
         await update.message.reply_text(f"🎬 Categories: {categories}\nUsage: /shortvideo <category>")
@@ -962,10 +1649,12 @@ async def short_video_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     video_data = random.choice(SHORT_VIDEOS[category])
     try:
-        await update.message.reply_video(
-            video=video_data["url"], caption=f"🎬 {video_data['caption']} | {category}", supports_streaming=True
+        await send_cached_media(
+            update.message, "video", video_data["url"], f"🎬 {video_data['caption']} | {category}",
+            supports_streaming=True
         )
     except Exception as e:
+        logger.error("Short video failed: %s", e)
         await update.message.reply_text("❌ Couldn't send short video.")
 
 # ========== CUSTOM RESPONSES ========== #
@@ -987,22 +1676,34 @@ async def add_custom_response(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     pattern = parts[0]
     responses = parts[1:]
+    try:
+        check_pattern(pattern, re.IGNORECASE)
+    except re.error as e:
+        await update.message.reply_text(f"❌ Invalid pattern: {e}")
+        return
+    except UnsafePattern as e:
+        await update.message.reply_text(f"❌ Pattern could match too slowly: {e}")
+        return
+    
     user_data['auto_responses']['patterns'][pattern] = responses
-    await update.message.reply_text(f"✅ Added response for: {pattern}")
+    pattern_budget.enable(pattern)
+    await update.message.reply_text(save_rules(f"✅ Added response for: {pattern}"))
 
 async def handle_auto_responses(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not user_data['enabled_features']['custom_responses']:
+    if not feature_active('custom_responses'):
+        return
+    if stale_reply(update):
         return
     
     message = update.message.text
     if not message: return
     
     user_name = update.effective_user.first_name
-    for pattern, responses in user_data['auto_responses']['patterns'].items():
-        if re.search(pattern, message, re.IGNORECASE):
-            response = random.choice(responses).format(name=user_name)
-            await update.message.reply_text(response)
-            return
+    responses = rule_store.rules.responses_for(message, pattern_budget)
+    if responses:
+        response = random.choice(responses).format(name=user_name)
+        await update.message.reply_text(response)
+        return
     
     greetings = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]
     if any(greet in message.lower() for greet in greetings):
@@ -1023,18 +1724,37 @@ async def handle_auto_responses(update: Update, context: ContextTypes.DEFAULT_TY
             await update.message.reply_text(response)
 
 # ========== MODERATION ========== #
+async def remove_message(context: ContextTypes.DEFAULT_TYPE, message):
+    """Delete now, or queue it for a bulk deleteMessages call while catching up"""
+    if not catch_up.active:
+        await message.delete()
+        return
+    batch = catch_up.queue_delete(message.chat_id, message.message_id)
+    if batch:
+        await context.bot.delete_messages(chat_id=message.chat_id, message_ids=batch)
+
 async def anti_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['anti_spam']: return
     message = update.message
     if not message.text: return
     if await is_admin(update): return
     
-    if re.search(r'(.)\1{10,}', message.text):
+    is_repeat = re.search(r'(.)\1{10,}', message.text)
+    is_wave = spam_detector.check(
+        update.effective_chat.id, update.effective_user.id, message.text, message.date.timestamp()
+    )
+    if is_repeat or is_wave:
         try:
-            await message.delete()
-            await update.message.reply_text(f"⚠️ {update.effective_user.first_name}, no spam!")
+            await remove_message(context, message)
+            count = await issue_warning(context, update.effective_chat.id, update.effective_user, "spam")
+            if count and not catch_up.active:
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=f"⚠️ {update.effective_user.first_name}, no spam! ({count}/{WARN_LIMIT} warnings)"
+                )
         except Exception as e:
-            logger.error(f"Anti-spam failed: {e}")
+            logger.error("Anti-spam failed: %s", e)
+        raise ApplicationHandlerStop
 
 async def keyword_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['keyword_filter']: return
@@ -1042,18 +1762,18 @@ async def keyword_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message.text: return
     if await is_admin(update): return
     
-    text_lower = message.text.lower()
-    for banned_word in user_data['banned_words']:
-        if banned_word.lower() in text_lower:
-            try:
-                await message.delete()
+    if rule_store.rules.banned_word(message.text):
+        try:
+            await remove_message(context, message)
+            count = await issue_warning(context, update.effective_chat.id, update.effective_user, "inappropriate content")
+            if count and not catch_up.active:
                 await context.bot.send_message(
                     chat_id=update.effective_chat.id,
-                    text=f"⚠️ {update.effective_user.first_name}: inappropriate content"
+                    text=f"⚠️ {update.effective_user.first_name}: inappropriate content ({count}/{WARN_LIMIT} warnings)"
                 )
-                return
-            except Exception as e:
-                logger.error(f"Keyword filter failed: {e}")
+        except Exception as e:
+            logger.error("Keyword filter failed: %s", e)
+        raise ApplicationHandlerStop
 
 async def flood_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['flood_control']: return
@@ -1061,32 +1781,30 @@ async def flood_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
+    key = (chat_id, user_id)
     
-    if chat_id not in user_data['flood']:
-        user_data['flood'][chat_id] = {}
+    now = update.message.date  # not the clock: a replayed backlog arrives all at once
+    timestamps = user_data['flood'].get(key) or deque()
+    timestamps.append(now)
+    while (now - timestamps[0]).total_seconds() > FLOOD_WINDOW:
+        timestamps.popleft()
+    user_data['flood'].set(key, timestamps)
     
-    now = datetime.now()
-    if user_id not in user_data['flood'][chat_id]:
-        user_data['flood'][chat_id][user_id] = []
-    
-    user_data['flood'][chat_id][user_id].append(now)
-    user_data['flood'][chat_id][user_id] = [
-        ts for ts in user_data['flood'][chat_id][user_id] if (now - ts).total_seconds() <= FLOOD_WINDOW
-    ]
-    
-    if len(user_data['flood'][chat_id][user_id]) > FLOOD_LIMIT:
+    limit = RAID_FLOOD_LIMIT if raid_probation(chat_id, user_id) else FLOOD_LIMIT
+    if len(timestamps) > limit:
         try:
             await context.bot.restrict_chat_member(
                 chat_id=chat_id, user_id=user_id,
                 permissions=ChatPermissions(can_send_messages=False),
                 until_date=datetime.now() + timedelta(minutes=5)
             )
-            await context.bot.send_message(
-                chat_id=chat_id, text=f"⚠️ {update.effective_user.first_name} muted for 5 minutes (flooding)"
-            )
-            user_data['flood'][chat_id][user_id] = []
+            if not catch_up.active:
+                await context.bot.send_message(
+                    chat_id=chat_id, text=f"⚠️ {update.effective_user.first_name} muted for 5 minutes (flooding)"
+                )
+            user_data['flood'].pop(key)
         except Exception as e:
-            logger.error(f"Flood control failed: {e}")
+            logger.error("Flood control failed: %s", e)
 
 async def anti_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features']['anti_link']: return
@@ -1094,14 +1812,17 @@ async def anti_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message.text: return
     if await is_admin(update): return
     
-    url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    urls = re.findall(url_pattern, message.text)
+    urls = URL_PATTERN.findall(message.text)
     if not urls: return
     
     link_config = user_data['link_protection']
+    rules = rule_store.rules  # one snapshot for the whole message, even if a reload lands mid-way
     should_delete = False
     reason = ""
     
+    if raid_probation(update.effective_chat.id, update.effective_user.id):
+        urls, should_delete, reason = [], True, "Links from new members are blocked during a raid"
+    
     for url in urls:
         domain = clean_domain(url)
         
@@ -1109,31 +1830,41 @@ async def anti_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             should_delete = True; reason = "URL shorteners not allowed"; break
         if link_config['advanced']['block_obfuscated'] and is_obfuscated(domain):
             should_delete = True; reason = "Suspicious link"; break
+        if link_config['bulk_blocklist'].match(domain):
+            should_delete = True; reason = f"Known malicious domain: {domain}"; break
         
-        if link_config['mode'] == "strict":
+        if rules.link_mode == "strict":
             should_delete = True; reason = "All links blocked"; break
-        elif link_config['mode'] == "whitelist":
-            if not any(allowed in domain for allowed in link_config['allowed_domains']):
+        elif rules.link_mode == "whitelist":
+            if not rules.is_allowed(domain):
                 should_delete = True; reason = f"Domain not whitelisted: {domain}"; break
-        elif link_config['mode'] == "blacklist":
-            if any(blocked in domain for blocked in link_config['blocked_domains']):
+        elif rules.link_mode == "blacklist":
+            if rules.is_blocked(domain):
                 should_delete = True; reason = f"Blocked domain: {domain}"; break
     
     if should_delete:
         try:
-            await message.delete()
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=f"⚠️ Link removed from {update.effective_user.first_name}\nReason: {reason}"
-            )
+            await remove_message(context, message)
+            count = await issue_warning(context, update.effective_chat.id, update.effective_user, reason)
+            if count and not catch_up.active:
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text=f"⚠️ Link removed from {update.effective_user.first_name} ({count}/{WARN_LIMIT} warnings)\nReason: {reason}"
+                )
         except Exception as e:
-            logger.error(f"Failed to delete link: {e}")
+            logger.error("Failed to delete link: %s", e)
+        raise ApplicationHandlerStop
 
 # ========== FUN COMMANDS ========== #
 async def emoji_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_data['enabled_features'].get('random_emoji', True):
         await update.message.reply_text("❌ Emoji feature disabled!")
         return
+    if not load_governor.allows('random_emoji'):
+        await update.message.reply_text(LOAD_BUSY_REPLY)
+        return
+    if stale_reply(update):
+        return
 
     emoji_categories = {
         'faces': ['😀', '😃', '😄', '😁', '😆', '😅', '😂', '🤣', '😊', '😇'],
@@ -1150,7 +1881,7 @@ async def emoji_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(random.choice(combinations))
 
 async def greet_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not user_data['enabled_features']['greet_users']: return
+    if not feature_active('greet_users') or stale_reply(update): return
     greetings = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening"]
     message = update.message.text.lower()
     
@@ -1188,7 +1919,8 @@ async def show_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if is_admin_user:
         categories['⚙️ Admin'] = [
             'enable', 'disable', 'blockdomain', 'unblockdomain', 'setlinkmode', 
-            'domainlist', 'allowdomain', 'setwelcome', 'setgoodbye', 'addresponse'
+            'domainlist', 'allowdomain', 'setwelcome', 'setgoodbye', 'addresponse', 'renderstats',
+            'rulestats', 'importblocklist', 'profile', 'heap', 'warn'
         ]
 
     response = ["<b>📜 Available Commands</b>\n"]
@@ -1199,14 +1931,241 @@ async def show_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_html('\n'.join(response))
 
+# ========== LOAD SHEDDING ========== #
+def feature_active(feature: str) -> bool:
+    """Enabled by an admin and not shed by the load governor"""
+    return user_data['enabled_features'][feature] and load_governor.allows(feature)
+
+def log_load_change(change: tuple):
+    old, new = change
+    if new > old:
+        logger.warning("Updates lagging (%.1fs, %d queued): shed stage %d: %s", load_governor.lag,
+                       load_governor.depth, new, ", ".join(LOAD_SHED_STAGES[new - 1]))
+    else:
+        logger.info("Load back to normal (%.1fs, %d queued): restored stage %d: %s", load_governor.lag,
+                    load_governor.depth, old, ", ".join(LOAD_SHED_STAGES[old - 1]))
+
+def stale_reply(update: Update) -> bool:
+    """Backlog messages get no chit-chat, greetings or media: the reply would answer something long gone"""
+    if catch_up.active or time.time() - update.message.date.timestamp() > CATCHUP_STALE_AGE:
+        catch_up.drop()
+        return True
+    return False
+
+async def finish_catch_up(context: ContextTypes.DEFAULT_TYPE):
+    deletes, folded, run = catch_up.finish()
+    for chat_id, message_ids in deletes.items():
+        try:
+            await context.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+        except Exception as e:
+            logger.error("Bulk delete in %s failed: %s", chat_id, e)
+    for (chat_id, user_id), (messages, xp, name, username) in folded.items():
+        award_xp(chat_id, user_id, name, username, messages, xp)
+    logger.info(
+        "Caught up on %d updates (%s behind) in %.1fs: %d deletes in %d calls, %d messages folded into XP "
+        "for %d users, %d stale replies dropped", run['updates'], format_duration(run['backlog']), run['seconds'],
+        run['deletes'], run['delete_calls'], run['folded'], run['users'], run['dropped']
+    )
+
+async def measure_load(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs in group -1, before every other handler: detects a backlog and feeds
+    message age and queue depth to the governor"""
+    if update.message is None:
+        return
+    lag = time.time() - update.message.date.timestamp()
+    if catch_up.observe(lag):
+        await finish_catch_up(context)
+    elif catch_up.active:
+        return  # backlog age says nothing about current load
+    change = load_governor.observe(lag, context.application.update_queue.qsize())
+    if change:
+        log_load_change(change)
+
+async def check_load(context: ContextTypes.DEFAULT_TYPE):
+    if catch_up.stalled():
+        await finish_catch_up(context)
+    if catch_up.active:
+        return
+    change = load_governor.tick(context.application.update_queue.qsize())
+    if change:
+        log_load_change(change)
+
+async def load_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    stats = load_governor.stats
+    shed = ", ".join(sorted(load_governor.shed)) or "none"
+    skipped = ", ".join(f"{feature} {n}" for feature, n in stats['skipped'].most_common()) or "none"
+    await update.message.reply_text(
+        f"🚦 Load: stage {load_governor.level}/{len(LOAD_SHED_STAGES)}\n"
+        f"• Lag: {load_governor.lag:.1f}s avg, {stats['max_lag']:.1f}s max\n"
+        f"• Queue: {load_governor.depth} now, {stats['max_depth']} max\n"
+        f"• Shed now: {shed}\n"
+        f"• Stages shed: {stats['shed']} • restored: {stats['restored']}\n"
+        f"• Skipped: {skipped}"
+        + (f"\n• Catch-up: {'running' if catch_up.active else 'last'} ({catch_up.run['updates']} updates, "
+           f"{catch_up.run['deletes']} deletes, {catch_up.run['folded']} XP messages folded, "
+           f"{catch_up.stats['dropped_replies']} stale replies dropped)" if catch_up.run else "")
+    )
+
+# ========== MEMORY BUDGETS ========== #
+def spill_cold_rankings(fraction: float) -> str:
+    """Move the least recently active records, across every shard, to RANKING_SPILL_PATH.
+    Their sort keys stay in the leaderboards; ranking_user() reads the records back"""
+    ranking = user_data['ranking']
+    shards = {'global': ranking['global'], **ranking['chats']}
+    records = [(u['last_active'], key, uid) for key, shard in shards.items() for uid, u in shard['users'].items()]
+    spilled = {}
+    for _, key, uid in heapq.nsmallest(int(len(records) * fraction) + 1, records, key=lambda r: r[0]):
+        spilled[f"{key}:{uid}"] = shards[key]['users'].pop(uid)
+    ranking_spill.put_many(spilled)
+    return f"spilled {len(spilled)} cold ranking records to disk"
+
+def compact_message_counts(fraction: float) -> str:
+    """Switch the largest exact per-chat counters to the bounded approx mode"""
+    counts = user_data['message_counts']
+    exact = [chat_id for chat_id, c in counts.items() if isinstance(c, dict)]
+    goal = sum(len(counts[chat_id]) for chat_id in exact) * fraction
+    dropped = switched = 0
+    for chat_id in sorted(exact, key=lambda chat_id: len(counts[chat_id]), reverse=True):
+        if dropped >= goal or len(counts[chat_id]) <= HEAVY_HITTER_CAPACITY:
+            break
+        dropped += len(counts[chat_id]) - HEAVY_HITTER_CAPACITY
+        counts[chat_id] = SpaceSaving.from_counts(counts[chat_id], HEAVY_HITTER_CAPACITY)
+        switched += 1
+    return f"switched {switched} chats to approximate message counts"
+
+def reset_flood(fraction: float) -> str:
+    """Flood windows only cover FLOOD_WINDOW seconds, so starting over loses little"""
+    dropped = len(user_data['flood'])
+    user_data['flood'] = SessionStore(ttl=FLOOD_WINDOW)
+    return f"reset {dropped} flood windows"
+
+def purge_warnings(fraction: float) -> str:
+    return f"purged {user_data['warnings'].purge()} users whose warnings had all lapsed"
+
+memory_budget.register('ranking', lambda: user_data['ranking'], MEMORY_BUDGETS['ranking'], spill_cold_rankings)
+memory_budget.register('message_counts', lambda: user_data['message_counts'], MEMORY_BUDGETS['message_counts'],
+                       compact_message_counts)
+memory_budget.register('flood', lambda: user_data['flood'], MEMORY_BUDGETS['flood'], reset_flood)
+memory_budget.register('warnings', lambda: user_data['warnings'], MEMORY_BUDGETS['warnings'], purge_warnings)
+# Bounded or TTL-expired already: accounted for, never evicted
+memory_budget.register('games', lambda: (user_data['word_games']['active_games'],
+                                         user_data['truth_or_dare']['active_players']))
+memory_budget.register('punishments', lambda: user_data['punishments'])
+memory_budget.register('spam_detector', lambda: spam_detector)
+memory_budget.register('raid_detector', lambda: raid_detector)
+memory_budget.register('callbacks', lambda: (callback_coalescer, greeting_batcher))
+
+def chat_memory(top: int = 5) -> list:
+    """[(bytes, chat_id), ...] for the chats holding the most ranking and message-count state"""
+    shards, counts = user_data['ranking']['chats'], user_data['message_counts']
+    return heapq.nlargest(top, (
+        (estimate_size((shards.get(chat_id), counts.get(chat_id)), sample=50), chat_id)
+        for chat_id in shards.keys() | counts.keys()
+    ))
+
+def format_bytes(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
+def write_memory_report(report: list, chats: list):
+    data = {
+        'time': time.time(), 'rss': current_rss(), 'subsystems': report,
+        'chats': [{'chat_id': chat_id, 'bytes': size} for size, chat_id in chats],
+        'evictions': memory_budget.stats['evictions'], 'spill': {**ranking_spill.stats, 'records': len(ranking_spill)}
+    }
+    tmp_path = MEMORY_REPORT_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, MEMORY_REPORT_PATH)
+
+async def check_memory(context: ContextTypes.DEFAULT_TYPE):
+    """Enforce MEMORY_BUDGETS and publish the estimates for web_server.py's /api/memory"""
+    report = memory_budget.enforce()
+    try:
+        await ranking_spill.flush()
+    except sqlite3.Error as e:
+        logger.error(f"Writing spilled ranking records failed, keeping them staged: {e}")
+    for entry in report:
+        if 'evicted' in entry:
+            logger.warning("Memory budget for %s exceeded (%s > %s): %s, now %s", entry['name'],
+                           format_bytes(entry['before']), format_bytes(entry['budget']), entry['evicted'],
+                           format_bytes(entry['bytes']))
+    try:
+        write_memory_report(report, chat_memory())
+    except OSError as e:
+        logger.error(f"Memory report write failed: {e}")
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update):
+        await update.message.reply_text("❌ Admins only")
+        return
+    
+    rss = current_rss()
+    lines = [f"🧠 Memory (estimates){f' — RSS {format_bytes(rss)}' if rss else ''}"]
+    for entry in memory_budget.measure():
+        budget = f" / {format_bytes(entry['budget'])}" if entry['budget'] else ""
+        lines.append(f"• {entry['name']}: {format_bytes(entry['bytes'])}{budget}")
+    lines.append("\n💬 Largest chats:")
+    lines += [f"• {chat_id}: {format_bytes(size)}" for size, chat_id in chat_memory()] or ["• none"]
+    lines.append(f"\n♻️ Evictions: {memory_budget.stats['evictions']} • Spilled ranking records: {len(ranking_spill)} "
+                 f"({ranking_spill.stats['restored']} read back)")
+    await update.message.reply_text("\n".join(lines))
+
+# ========== SESSION EXPIRY ========== #
+async def expire_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """One periodic sweep for every TTL store; announces games that timed out"""
+    for chat_id, game in user_data['word_games']['active_games'].expire():
+        try:
+            await context.bot.send_message(
+                chat_id=chat_id, text=f"⌛ Word game timed out! The word was *{game['word']}*", parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.error(f"Word game timeout notice failed: {e}")
+    
+    for chat_id, _ in user_data['truth_or_dare']['active_players'].expire():
+        try:
+            await context.bot.send_message(chat_id=chat_id, text="⌛ Truth or Dare ended after inactivity. Start again with /truthordare")
+        except Exception as e:
+            logger.error(f"Truth or Dare timeout notice failed: {e}")
+    
+    user_data['flood'].expire()
+    callback_coalescer.expire()
+    greeting_batcher.expire()
+
+async def watch_rules(context: ContextTypes.DEFAULT_TYPE):
+    """Pick up edits to MODERATION_RULES_PATH; compiling happens off the event loop"""
+    if await rule_store.reload_if_changed():
+        apply_rules(rule_store.rules.raw)
+        changes = ", ".join(f"{key} +{len(a)}/-{len(r)}" for key, (a, r) in rule_store.stats['last_diff'].items())
+        logger.info(f"Moderation rules reloaded in {rule_store.stats['last_reload_ms']:.1f} ms: {changes or 'no changes'}")
+
 # ========== MAIN BOT SETUP ========== #
-def setup_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(update_leaderboard, 'interval', hours=1)
-    scheduler.start()
+async def rebuild_leaderboards(context: ContextTypes.DEFAULT_TYPE):
+    update_leaderboard()
 
-def main():
+async def export_leaderboards(context: ContextTypes.DEFAULT_TYPE):
+    await export_leaderboard()
+
+def build_application() -> Application:
+    """Load the rules file and register every handler and job; multi_bot.py calls this once per bot"""
     application = Application.builder().token(BOT_TOKEN).build()
+    try:
+        if rule_store.load():
+            apply_rules(rule_store.rules.raw)
+    except (OSError, ValueError, re.error) as e:
+        logger.error(f"Moderation rules file unusable, starting with defaults: {e}")
+    
+    application.add_handler(TypeHandler(Update, measure_load), group=-1)
+    
+    # Only the first matching handler in a group runs, so every plain-text handler gets a group of
+    # its own. Moderation comes first and stops the rest once it removes a message
+    text_handlers = (anti_spam, keyword_filter, flood_control, anti_link,
+                     count_message, handle_auto_responses, greet_users, handle_ranking, handle_word_guess)
+    for group, callback in enumerate(text_handlers, start=1):
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, callback), group=group)
     
     # Feature control
     application.add_handler(CommandHandler("enable", enable_feature))
@@ -1219,17 +2178,14 @@ def main():
     application.add_handler(CommandHandler("setlinkmode", set_link_mode))
     application.add_handler(CommandHandler("domainlist", list_domains))
     application.add_handler(CommandHandler("allowdomain", add_allowed_domain))
+    application.add_handler(CommandHandler("importblocklist", import_blocklist_command))
     
     # Message counting
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, count_message))
     application.add_handler(CommandHandler("mcount", message_count_command))
     
     # Moderation
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, anti_spam))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, keyword_filter))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, flood_control))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, anti_link))
     application.add_handler(CommandHandler("warnings", warnings_command))
+    application.add_handler(CommandHandler("warn", warn_command))
     application.add_handler(CommandHandler("report", report_user))
     
     # Welcome/Goodbye
@@ -1240,7 +2196,6 @@ def main():
     
     # Custom responses
     application.add_handler(CommandHandler("addresponse", add_custom_response))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_auto_responses))
     
     # Utility
     application.add_handler(CommandHandler("poll", poll_command))
@@ -1253,15 +2208,23 @@ def main():
     application.add_handler(CommandHandler("video", video_command))
     application.add_handler(CommandHandler("shortvideo", short_video_command))
     application.add_handler(CommandHandler("emoji", emoji_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, greet_users))
     
     # Ranking system
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_ranking))
     application.add_handler(CommandHandler("rank", rank_command))
-    application.add_handler(CallbackQueryHandler(leaderboard_callback, pattern="^show_leaderboard$"))
-    application.add_handler(CallbackQueryHandler(show_user_stats, pattern="^show_stats$"))
-    application.add_handler(CallbackQueryHandler(refresh_rank_callback, pattern="^refresh_rank$"))
-    application.add_handler(CallbackQueryHandler(rank_command, pattern="^show_my_rank$"))
+    application.add_handler(CommandHandler("renderstats", render_stats_command))
+    application.add_handler(CommandHandler("rulestats", rule_stats_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("heap", heap_command))
+    application.add_handler(CommandHandler("memory", memory_command))
+    application.add_handler(CommandHandler("loadstats", load_stats_command))
+    # Button taps run as tasks (block=False), so a repeat tap arrives while the first one's render
+    # is still running and callback_coalescer / leaderboard_card can hand it the same result
+    application.add_handler(CallbackQueryHandler(
+        leaderboard_callback, pattern="^show_leaderboard(:(chat|global):(\\d+|me))?$", block=False
+    ))
+    application.add_handler(CallbackQueryHandler(show_user_stats, pattern="^show_stats$", block=False))
+    application.add_handler(CallbackQueryHandler(refresh_rank_callback, pattern="^refresh_rank$", block=False))
+    application.add_handler(CallbackQueryHandler(refresh_rank_callback, pattern="^show_my_rank$", block=False))
     
     # Games
     application.add_handler(CommandHandler("truthordare", truth_or_dare_start))
@@ -1270,14 +2233,30 @@ def main():
     application.add_handler(CommandHandler("dare", get_dare))
     application.add_handler(CommandHandler("wordgame", start_word_game))
     application.add_handler(CommandHandler("hint", word_game_hint))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_word_guess))
     
     # Start command
     application.add_handler(CommandHandler("start", lambda u, c: u.message.reply_text(
         "🤖 Advanced Telegram Bot is running!\nUse /commands to see available commands\nUse /rank to check your level!"
     )))
     
-    setup_scheduler()
+    application.job_queue.run_repeating(expire_sessions, interval=SESSION_SWEEP_INTERVAL, first=SESSION_SWEEP_INTERVAL)
+    application.job_queue.run_repeating(watch_rules, interval=RULES_POLL_INTERVAL, first=RULES_POLL_INTERVAL)
+    # first=0: punishments that ran out while the bot was down are lifted right away
+    application.job_queue.run_repeating(lift_punishments, interval=PUNISHMENT_SWEEP_INTERVAL, first=0)
+    application.job_queue.run_repeating(check_raids, interval=RAID_CHECK_INTERVAL, first=RAID_CHECK_INTERVAL)
+    application.job_queue.run_repeating(check_load, interval=LOAD_CHECK_INTERVAL, first=LOAD_CHECK_INTERVAL)
+    application.job_queue.run_repeating(check_memory, interval=MEMORY_CHECK_INTERVAL, first=MEMORY_CHECK_INTERVAL)
+    # On the event loop like the handlers, which mutate the same shards
+    application.job_queue.run_repeating(
+        rebuild_leaderboards, interval=LEADERBOARD_REBUILD_INTERVAL, first=LEADERBOARD_REBUILD_INTERVAL
+    )
+    application.job_queue.run_repeating(
+        export_leaderboards, interval=LEADERBOARD_EXPORT_INTERVAL, first=LEADERBOARD_EXPORT_INTERVAL
+    )
+    return application
+
+def main():
+    application = build_application()
     logger.info("Bot started with ALL features!")
     application.run_polling()
 
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class MediaFetchError(Exception):
+    pass
+
+
+class MediaCache:
+    """Content-addressed disk cache for remote memes and videos.
+
+    Each URL is downloaded once, streamed to disk in chunks while it is
+    hashed, and stored as objects/<sha256>. URLs with identical content
+    share one blob. Total size is capped with least-recently-used eviction.
+    Entries older than `max_age` are still served, and are revalidated in
+    the background (ETag / Last-Modified) on their next use. The Telegram
+    file_id from the first upload is remembered so later sends skip the
+    upload entirely.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024, max_age: float = 24 * 3600,
+                 chunk_size: int = 64 * 1024, timeout: float = 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.entries = OrderedDict()  # url -> entry, least recently used first
+        self._in_flight = {}
+        self._refs = {}  # digest -> number of entries using that blob
+        self.total_bytes = 0  # size of the distinct blobs
+        self._dirty, self._saving = False, None
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._load_index()
+
+    # ----- index ----- #
+    def _index_path(self) -> str:
+        return os.path.join(self.root, 'index.json')
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logger.error(f"Media cache index unreadable, starting empty: {e}")
+            return
+        for entry in sorted(entries, key=lambda e: e['last_used']):
+            if os.path.exists(self.blob_path(entry['digest'])):
+                self._put(entry['url'], entry)
+
+    def _save_index(self):
+        """Write the index on a worker thread. Saves requested while one runs are folded into one more"""
+        self._dirty = True
+        if self._saving is None:
+            self._saving = asyncio.ensure_future(self._save_loop())
+
+    async def _save_loop(self):
+        try:
+            while self._dirty:
+                self._dirty = False
+                # Copies: entries change on the loop while the thread serializes them
+                await asyncio.to_thread(self._write_index, [dict(e) for e in self.entries.values()])
+        except OSError as e:
+            logger.error(f"Media cache index save failed: {e}")
+        finally:
+            self._saving = None
+
+    def _write_index(self, entries: list):
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self._index_path())
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def _put(self, url: str, entry: dict):
+        """Add or replace `url`'s entry as the most recently used one, keeping blob counts and total_bytes"""
+        old = self.entries.get(url)
+        self.entries[url] = entry
+        self.entries.move_to_end(url)
+        if self._refs.get(entry['digest'], 0) == 0:
+            self.total_bytes += entry['size']
+        self._refs[entry['digest']] = self._refs.get(entry['digest'], 0) + 1
+        if old is not None:
+            self._release(old)
+
+    def _pop(self, url: str = None):
+        """Remove `url`'s entry, or the least recently used one; its blob goes when nothing else uses it"""
+        entry = self.entries.pop(url) if url is not None else self.entries.popitem(last=False)[1]
+        self._release(entry)
+        return entry
+
+    def _release(self, entry: dict):
+        digest = entry['digest']
+        self._refs[digest] -= 1
+        if self._refs[digest]:
+            return
+        del self._refs[digest]
+        self.total_bytes -= entry['size']
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    # ----- public API ----- #
+    def file_id(self, url: str):
+        entry = self.entries.get(url)
+        return entry.get('file_id') if entry else None
+
+    def remember_file_id(self, url: str, file_id: str):
+        entry = self.entries.get(url)
+        if entry is not None and entry.get('file_id') != file_id:
+            entry['file_id'] = file_id
+            self._save_index()
+
+    async def get(self, url: str) -> str:
+        """Local path for `url`, downloading it on first use"""
+        entry = self.entries.get(url)
+        if entry is not None:
+            entry['last_used'] = time.time()
+            self.entries.move_to_end(url)
+            if time.time() - entry['fetched_at'] > self.max_age and url not in self._in_flight:
+                self._in_flight[url] = asyncio.ensure_future(self._fetch(url))
+            return self.blob_path(entry['digest'])
+
+        if url not in self._in_flight:
+            self._in_flight[url] = asyncio.ensure_future(self._fetch(url))
+        await self._in_flight[url]
+        entry = self.entries.get(url)
+        if entry is None:
+            raise MediaFetchError(f"Could not cache {url}")
+        return self.blob_path(entry['digest'])
+
+    async def open(self, url: str):
+        """Binary file object for `url`. A blob evicted, or removed by hand, after get()
+        found it is downloaded again instead of failing"""
+        path = await self.get(url)
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            logger.warning(f"Media cache blob for {url} vanished, downloading it again")
+            if url in self.entries:
+                self._pop(url)
+            return open(await self.get(url), 'rb')
+
+    # ----- fetching ----- #
+    async def _fetch(self, url: str):
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(None, self._download, url, self.entries.get(url))
+            self._store(url, result)
+        except (OSError, urllib.error.URLError, ValueError) as e:
+            logger.warning(f"Media cache fetch failed for {url}: {e}")
+        finally:
+            self._in_flight.pop(url, None)
+
+    def _download(self, url: str, entry: dict):
+        """Stream `url` into a temp file; returns None when the server says 304"""
+        request = urllib.request.Request(url, headers={'User-Agent': 'RoboBot media cache'})
+        if entry is not None:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with response, os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"{url} is larger than the whole cache")
+
+            blob = self.blob_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            if os.path.exists(blob):
+                os.remove(tmp_path)
+            else:
+                shutil.move(tmp_path, blob)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {
+            'digest': digest.hexdigest(), 'size': size,
+            'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')
+        }
+
+    def _store(self, url: str, result: dict):
+        now = time.time()
+        entry = self.entries.get(url)
+        if result is None:
+            if entry is None:
+                return  # 304 for an entry evicted while it was revalidated: nothing left to refresh
+            entry['fetched_at'] = now
+        else:
+            old = entry
+            entry = {'url': url, 'fetched_at': now, 'last_used': now, 'file_id': None, **result}
+            if old is not None and old['digest'] == result['digest']:
+                entry['file_id'] = old.get('file_id')
+            self._put(url, entry)
+            self._evict()
+        self._save_index()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._pop()
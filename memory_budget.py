@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import types
+from collections import deque
+from itertools import islice
+
+_LEAVES = (str, bytes, bytearray, int, float, complex, bool, type(None))
+# Code and modules are shared by everything, not state owned by a subsystem
+_SKIP = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+SQL_BATCH = 500  # keys per IN (...) query; SQLite caps the number of bound parameters
+
+
+def estimate_size(obj, sample: int = 200) -> int:
+    """Approximate deep size of `obj` in bytes.
+
+    Containers with more than `sample` items are measured on their first
+    `sample` items and the result is scaled up. Sizing a million-user dict
+    then costs about as much as sizing a few hundred users. Objects reached
+    twice are counted once. Instances are followed through __dict__ and
+    __slots__. mmap-backed data only counts its small handle, because its
+    pages belong to the page cache and not the heap.
+    """
+    seen = set()
+
+    def size(o) -> int:
+        if id(o) in seen or isinstance(o, _SKIP):
+            return 0
+        seen.add(id(o))
+        total = sys.getsizeof(o)
+        if isinstance(o, _LEAVES):
+            return total
+
+        if isinstance(o, dict):
+            children, n = o.items(), len(o)
+            measure = lambda kv: size(kv[0]) + size(kv[1])
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            children, n, measure = o, len(o), size
+        else:
+            attrs = list(getattr(o, '__dict__', {}).values())
+            for cls in type(o).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(o, name):
+                        attrs.append(getattr(o, name))
+            children, n, measure = attrs, len(attrs), size
+
+        measured = sum(measure(child) for child in islice(children, sample))
+        return total + (measured * n // sample if n > sample else measured)
+
+    return size(obj)
+
+
+def current_rss():
+    """Resident set size in bytes, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class SpillStore:
+    """Cold JSON records moved out of memory into an SQLite file.
+
+    `take` removes a record as it is read back, so a record is either in
+    memory or on disk, never in both. `put_many` serializes and stages records; the
+    writes, and the deletes of records taken back, go to disk in one
+    transaction on a worker thread when `flush()` runs. Reads of single
+    records stay on the caller's thread: with WAL they never wait for a
+    flush in progress.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # The rest of the bot's state is in memory only, so a crash losing the last flush costs nothing extra
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")  # free pages go back to the OS on flush
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._writer.execute("PRAGMA synchronous = OFF")
+        self._writer.execute("CREATE TABLE IF NOT EXISTS spill (key TEXT PRIMARY KEY, record TEXT NOT NULL)")
+        self._writer.commit()
+        self._reader = sqlite3.connect(path, isolation_level=None)
+        self._rows = self._reader.execute("SELECT count(*) FROM spill").fetchone()[0]
+        self._pending, self._writing = {}, {}  # staged records, and those the running flush is writing
+        self._dropped, self._deleting = set(), set()  # taken keys whose rows are still on disk, same split
+        self._flush_lock = asyncio.Lock()
+        self.stats = {'spilled': 0, 'restored': 0, 'flushes': 0}
+
+    def put_many(self, records: dict):
+        self._pending.update((key, json.dumps(record, default=str)) for key, record in records.items())
+        self.stats['spilled'] += len(records)
+
+    def take(self, key: str):
+        raw, staged = self._find(key)
+        if raw is None:
+            return None
+        if staged is None or staged is self._writing:
+            self._dropped.add(key)  # its row is on disk, or being written right now
+        if staged is not None:
+            del staged[key]
+        self.stats['restored'] += 1
+        return json.loads(raw)
+
+    def read_many(self, keys) -> dict:
+        """{key: record} for the `keys` that are spilled, left where they are. Safe on a worker
+        thread: staged records are single dict reads, and disk rows come through a connection
+        of its own, SQL_BATCH keys per query"""
+        found, on_disk = {}, []
+        for key in keys:
+            raw = self._pending.get(key) or self._writing.get(key)
+            if raw is not None:
+                found[key] = json.loads(raw)
+            elif key not in self._dropped and key not in self._deleting:
+                on_disk.append(key)
+        if not on_disk:
+            return found
+        connection = sqlite3.connect(self.path)
+        try:
+            for start in range(0, len(on_disk), SQL_BATCH):
+                batch = on_disk[start:start + SQL_BATCH]
+                rows = connection.execute(
+                    f"SELECT key, record FROM spill WHERE key IN ({', '.join('?' * len(batch))})", batch
+                )
+                found.update((key, json.loads(raw)) for key, raw in rows)
+        finally:
+            connection.close()
+        return found
+
+    def _find(self, key: str):
+        """(serialized record or None, the staging dict holding it or None for disk)"""
+        for staged in (self._pending, self._writing):
+            if key in staged:
+                return staged[key], staged
+        if key in self._dropped or key in self._deleting:
+            return None, None
+        row = self._reader.execute("SELECT record FROM spill WHERE key = ?", (key,)).fetchone()
+        return (row[0] if row else None), None
+
+    async def flush(self):
+        """Write staged records and delete taken ones, off the event loop"""
+        async with self._flush_lock:
+            if not self._pending and not self._dropped:
+                return
+            self._writing, self._pending = self._pending, {}
+            self._deleting, self._dropped = self._dropped, set()
+            try:
+                self._rows = await asyncio.to_thread(self._write, self._writing, self._deleting)
+            except BaseException:
+                # Nothing was committed: stage it all again
+                self._pending = {**self._writing, **self._pending}
+                self._dropped |= self._deleting
+                raise
+            finally:
+                self._writing, self._deleting = {}, set()
+            self.stats['flushes'] += 1
+
+    def _write(self, records: dict, dropped: set) -> int:
+        with self._writer:
+            # Deletes first: a key taken and spilled again since the last flush is in both
+            self._writer.executemany("DELETE FROM spill WHERE key = ?", ((key,) for key in dropped))
+            self._writer.executemany("INSERT OR REPLACE INTO spill VALUES (?, ?)",
+                                     records.items())
+        self._writer.execute("PRAGMA incremental_vacuum")
+        return self._writer.execute("SELECT count(*) FROM spill").fetchone()[0]
+
+    def __len__(self):
+        """Records on disk or staged, not counting ones taken back"""
+        return max(0, self._rows + len(self._pending) + len(self._writing) - len(self._dropped) - len(self._deleting))
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+
+class MemoryBudget:
+    """Per-subsystem size estimates, byte budgets and eviction policies.
+
+    Each subsystem has a `measure()` that returns the object tree it owns,
+    an optional budget in bytes, and an optional `evict(fraction)` policy.
+    When a subsystem is over budget, `enforce()` asks its policy to drop
+    roughly `fraction` of its entries. The target is `headroom` below the
+    budget, so one eviction is not followed right away by another.
+    """
+
+    def __init__(self, headroom: float = 0.1, sample: int = 200):
+        self.headroom = headroom
+        self.sample = sample
+        self.subsystems = {}  # name -> (measure, budget, evict)
+        self.last_report = None
+        self.stats = {'checks': 0, 'evictions': 0}
+
+    def register(self, name: str, measure, budget: int = None, evict=None):
+        self.subsystems[name] = (measure, budget, evict)
+
+    def measure(self) -> list:
+        """[{'name', 'bytes', 'budget'}, ...] in registration order"""
+        return [
+            {'name': name, 'bytes': estimate_size(measure(), self.sample), 'budget': budget}
+            for name, (measure, budget, _) in self.subsystems.items()
+        ]
+
+    def enforce(self) -> list:
+        """Measure everything and evict from subsystems over budget.
+        Returns the report; entries that were evicted from carry 'evicted' and 'before'"""
+        report = self.measure()
+        for entry in report:
+            measure, budget, evict = self.subsystems[entry['name']]
+            if budget is None or evict is None or entry['bytes'] <= budget:
+                continue
+            target = budget * (1 - self.headroom)
+            entry['evicted'] = evict((entry['bytes'] - target) / entry['bytes'])
+            entry['before'] = entry['bytes']
+            entry['bytes'] = estimate_size(measure(), self.sample)
+            self.stats['evictions'] += 1
+        self.stats['checks'] += 1
+        self.last_report = report
+        return report
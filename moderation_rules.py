@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from safe_patterns import UnsafePattern, compile_safe
+
+logger = logging.getLogger(__name__)
+
+LINK_MODES = ("strict", "whitelist", "blacklist")
+RULE_KEYS = ('banned_words', 'allowed_domains', 'blocked_domains', 'link_mode', 'auto_responses')
+
+
+def _alternation(items, flags=0):
+    """One compiled regex matching any of `items` as a literal substring"""
+    if not items:
+        return None
+    # Longest first so the alternation never stops at a shorter prefix
+    escaped = sorted((re.escape(i) for i in items if i), key=len, reverse=True)
+    return re.compile("|".join(escaped), flags) if escaped else None
+
+
+class CompiledRules:
+    """Immutable, ready-to-match snapshot of the moderation rules.
+
+    Handlers read `RuleStore.rules` once and use that object for the whole
+    message, so a reload that swaps in a new snapshot never shows them a mix
+    of old and new rules. Auto-response patterns that fail check_pattern are
+    left out and listed in `rejected`.
+    """
+
+    __slots__ = ('raw', 'link_mode', '_banned', '_allowed', '_blocked', '_responses', 'rejected')
+
+    def __init__(self, raw: dict):
+        if raw['link_mode'] not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {raw['link_mode']}")
+        self.raw = raw
+        self.link_mode = raw['link_mode']
+        self._banned = _alternation([w.lower() for w in raw['banned_words']], re.IGNORECASE)
+        self._allowed = _alternation(raw['allowed_domains'])
+        self._blocked = _alternation(raw['blocked_domains'])
+        self._responses = []
+        self.rejected = {}  # pattern -> why it is unsafe
+        for pattern, responses in raw['auto_responses'].items():
+            try:
+                self._responses.append((pattern, compile_safe(pattern, re.IGNORECASE), tuple(responses)))
+            except UnsafePattern as e:
+                self.rejected[pattern] = str(e)
+                logger.warning(f"Auto-response pattern {pattern!r} skipped: {e}")
+
+    def banned_word(self, text: str):
+        """First banned word found in `text`, or None"""
+        match = self._banned.search(text) if self._banned else None
+        return match.group(0) if match else None
+
+    def is_allowed(self, domain: str) -> bool:
+        return bool(self._allowed and self._allowed.search(domain))
+
+    def is_blocked(self, domain: str) -> bool:
+        return bool(self._blocked and self._blocked.search(domain))
+
+    def responses_for(self, text: str, budget=None):
+        """Responses of the first auto-response pattern matching `text`, or None.
+        With a PatternBudget, matching is timed and patterns it disabled are skipped"""
+        if budget is not None:
+            return budget.first_match(self._responses, text)
+        for _, compiled, responses in self._responses:
+            if compiled.search(text):
+                return responses
+        return None
+
+    def counts(self) -> dict:
+        return {key: len(self.raw[key]) for key in RULE_KEYS if key != 'link_mode'}
+
+
+def diff_rules(old: dict, new: dict) -> dict:
+    """{key: (added, removed)} for every rule list that changed"""
+    changes = {}
+    for key in RULE_KEYS:
+        if key == 'link_mode':
+            if old[key] != new[key]:
+                changes[key] = ([new[key]], [old[key]])
+            continue
+        before, after = old[key], new[key]
+        if key == 'auto_responses':
+            added = [p for p in after if before.get(p) != after[p]]
+            removed = [p for p in before if p not in after]
+        else:
+            added = sorted(set(after) - set(before))
+            removed = sorted(set(before) - set(after))
+        if added or removed:
+            changes[key] = (added, removed)
+    return changes
+
+
+class RuleStore:
+    """Moderation rules backed by a JSON file that is watched for changes.
+
+    `rules` always points at a complete CompiledRules. A changed file is read
+    and compiled off the event loop and only then swapped in with a single
+    assignment; a file that fails to parse or compile leaves the old rules
+    live and is reported in `stats`.
+    """
+
+    def __init__(self, path: str, defaults: dict):
+        self.path = path
+        self.rules = CompiledRules(self._normalize(defaults, defaults))
+        self._signature = None
+        self.stats = {
+            'reloads': 0, 'errors': 0, 'last_error': None, 'last_reload': None,
+            'last_reload_ms': 0.0, 'last_diff': {}
+        }
+
+    @staticmethod
+    def _normalize(data: dict, fallback: dict) -> dict:
+        raw = {key: data.get(key, fallback[key]) for key in RULE_KEYS}
+        raw['banned_words'] = list(dict.fromkeys(raw['banned_words']))
+        raw['allowed_domains'] = list(dict.fromkeys(d.lower() for d in raw['allowed_domains']))
+        raw['blocked_domains'] = list(dict.fromkeys(d.lower() for d in raw['blocked_domains']))
+        raw['link_mode'] = raw['link_mode'].lower()
+        raw['auto_responses'] = {p: list(r) for p, r in raw['auto_responses'].items()}
+        return raw
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def changed(self) -> bool:
+        return self._file_signature() != self._signature
+
+    def _build(self):
+        signature = self._file_signature()
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        return signature, CompiledRules(self._normalize(data, self.rules.raw))
+
+    def _swap(self, signature, compiled: CompiledRules, started: float):
+        self.stats['last_diff'] = diff_rules(self.rules.raw, compiled.raw)
+        self.rules = compiled
+        self._signature = signature
+        self.stats['reloads'] += 1
+        self.stats['last_reload'] = time.time()
+        self.stats['last_reload_ms'] = (time.perf_counter() - started) * 1000
+
+    def load(self) -> bool:
+        """Synchronous load, for startup. Returns True when the file was applied"""
+        if self._file_signature() is None:
+            return False
+        started = time.perf_counter()
+        signature, compiled = self._build()
+        self._swap(signature, compiled, started)
+        return True
+
+    async def reload_if_changed(self) -> bool:
+        signature = self._file_signature()
+        if signature == self._signature or signature is None:
+            return False
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            signature, compiled = await loop.run_in_executor(None, self._build)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+            # Remember the bad file so it is not re-parsed every poll
+            self._signature = signature
+            self.stats['errors'] += 1
+            self.stats['last_error'] = str(e)
+            logger.error(f"Moderation rules reload failed, keeping previous rules: {e}")
+            return False
+        self._swap(signature, compiled, started)
+        return True
+
+    def save(self, raw: dict):
+        """Swap in admin edits immediately, then persist them to the rules file"""
+        started = time.perf_counter()
+        compiled = CompiledRules(self._normalize(raw, self.rules.raw))
+        self._swap(self._signature, compiled, started)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(compiled.raw, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        # Our own write must not come back as an external edit
+        self._signature = self._file_signature()
@@ -0,0 +1,181 @@
+"""Host several bot tokens in one process and one event loop.
+
+    python multi_bot.py bots.json
+
+bots.json:
+
+    {
+      "state_dir": "bots",
+      "bots": [
+        {"name": "main", "token_env": "MAIN_BOT_TOKEN"},
+        {"name": "gaming", "token": "123456:ABC...", "env": {"MESSAGE_COUNT_MODE": "approx"}}
+      ]
+    }
+
+Every bot runs its own copy of `main (2).py`'s module globals, so user_data,
+rules, warnings, Telegram file_ids and everything else that changes at
+runtime stay separate, and its files live under state_dir/<name>/. The
+source is compiled once and all copies run the same code objects. The
+read-only assets in SHARED_ASSETS are the first bot's objects: the meme
+and video tables, rank titles, the compiled URL pattern and the render
+worker pool. The built-in word bank is shared the same way, and
+rank_cards.py keeps one generator with its loaded fonts per card setting. Resident memory is logged after each bot
+is loaded, which is what one more bot costs.
+"""
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import logging
+import os
+import re
+import signal
+import sys
+
+from memory_budget import current_rss
+
+logger = logging.getLogger(__name__)
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main (2).py")
+# Environment settings each bot gets its own file or directory for, under state_dir/<name>/
+STATE_FILES = {
+    'PUNISHMENTS_PATH': "punishments.json",
+    'MODERATION_RULES_PATH': "moderation_rules.json",
+    'BLOCKLIST_PATH': "blocklist.rbl",
+    'MEDIA_CACHE_DIR': "media_cache",  # its index holds file_ids, which belong to one bot token
+    'LEADERBOARD_SNAPSHOT_DIR': "leaderboards",
+    'RANKING_SPILL_PATH': "ranking_spill.db",
+    'MEMORY_REPORT_PATH': "memory_report.json",
+}
+# Module globals taken from the first bot -> settings that must match for the object to be reusable
+SHARED_ASSETS = {
+    'MEME_DATABASE': (), 'SHORT_VIDEOS': (), 'VIDEO_DATABASE': (), 'MEME_URLS': (), 'GIF_MEMES': (),
+    'RANK_TITLES': (), 'DEFAULT_WORD_BANK': (), 'URL_PATTERN': (),
+    'render_pool': ('RENDER_WORKERS', 'RENDER_QUEUE_LIMIT'),
+}
+BOT_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def load_config(path: str) -> dict:
+    """Read and validate bots.json; every bot gets a resolved 'token', 'state_dir' and 'env'"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    config.setdefault('state_dir', "bots")
+    if not config.get('bots'):
+        raise ValueError(f"{path} lists no bots")
+    seen = set()
+    for bot in config['bots']:
+        name = bot.get('name', "")
+        if not BOT_NAME.match(name) or name in seen:
+            raise ValueError(f"Bot names must be unique and use letters, digits, - and _: {name!r}")
+        seen.add(name)
+        token = bot.get('token') or os.environ.get(bot.get('token_env', ""))
+        if not token:
+            raise ValueError(f"No token for bot {name!r}: set 'token' or 'token_env'")
+        state = bot['state_dir'] = os.path.join(config['state_dir'], name)
+        bot['token'] = token
+        bot['env'] = {
+            'BOT_TOKEN': token, **{key: os.path.join(state, filename) for key, filename in STATE_FILES.items()},
+            **bot.get('env', {})
+        }
+    return config
+
+
+def load_bot_module(name: str, env: dict, code=None):
+    """Execute the bot source as module robo_<name> with `env` applied while its settings are read.
+    `code` is the compiled source to share; without it the file is loaded the usual way"""
+    spec = importlib.util.spec_from_file_location(f"robo_{name}", BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Registered like an import, so module lookups by name find it
+    sys.modules[spec.name] = module
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        if code is None:
+            spec.loader.exec_module(module)
+        else:
+            exec(code, module.__dict__)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return module
+
+
+def share_assets(source, module) -> list:
+    """Point `module` at `source`'s read-only assets; returns the names that were shared"""
+    shared = []
+    for name, settings in SHARED_ASSETS.items():
+        if all(getattr(module, s) == getattr(source, s) for s in settings):
+            setattr(module, name, getattr(source, name))
+            shared.append(name)
+    if module.WORD_BANK_PATH == source.WORD_BANK_PATH:
+        module.user_data['word_games']['word_bank'] = source.load_word_bank()
+        shared.append('word_bank')
+    return shared
+
+
+def load_bots(config: dict, share: bool = True) -> list:
+    """Load every configured bot; returns [(bot config, module, RSS growth in bytes)]"""
+    code = None
+    if share:
+        with open(BOT_PATH, encoding='utf-8') as f:
+            code = compile(f.read(), BOT_PATH, 'exec')
+    loaded = []
+    for bot in config['bots']:
+        os.makedirs(bot['state_dir'], exist_ok=True)
+        gc.collect()
+        before = current_rss()
+        module = load_bot_module(bot['name'], bot['env'], code)
+        if share and loaded:
+            share_assets(loaded[0][1], module)
+        gc.collect()
+        after = current_rss()
+        growth = after - before if before is not None and after is not None else None
+        loaded.append((bot, module, growth))
+        logger.info(f"Loaded bot {bot['name']}: "
+                    f"{module.format_bytes(growth) if growth is not None else 'RSS unavailable'}")
+    return loaded
+
+
+async def run_bots(loaded: list):
+    applications = []
+    try:
+        for bot, module, _ in loaded:
+            application = module.build_application()
+            await application.initialize()
+            await application.start()
+            await application.updater.start_polling()
+            applications.append(application)
+            logger.info(f"Bot {bot['name']} polling")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        for application in reversed(applications):
+            await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", nargs="?", default="bots.json")
+    parser.add_argument("--no-share", action="store_true", help="give every bot its own copy of everything")
+    args = parser.parse_args()
+
+    loaded = load_bots(load_config(args.config), share=not args.no_share)
+    rss = current_rss()
+    if rss is not None:
+        logger.info(f"{len(loaded)} bots loaded, {loaded[0][1].format_bytes(rss)} resident")
+    asyncio.run(run_bots(loaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+IDLE_FUNCTIONS = {('selectors.py', 'select'), ('threading.py', 'wait'), ('queue.py', 'get')}
+
+
+def _label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def function_ranges(path: str) -> list:
+    """[(first line, last line, name), ...] for every function defined in `path`"""
+    with open(path, encoding='utf-8') as f:
+        pending = [compile(f.read(), path, 'exec')]
+    ranges = []
+    while pending:
+        for const in pending.pop().co_consts:
+            if hasattr(const, 'co_lines'):
+                last = max((line for _, _, line in const.co_lines() if line), default=const.co_firstlineno)
+                ranges.append((const.co_firstlineno, last, const.co_name))
+                pending.append(const)
+    return ranges
+
+
+class SamplingProfiler:
+    """Statistical CPU profiler for one thread (normally the event loop).
+
+    A helper thread reads the target thread's current stack every `interval`
+    seconds for a fixed duration, so there is no tracing hook and nothing
+    runs at all while no profile is being taken. Samples are attributed to
+    the innermost frame from `attribute_file` (the bot's handlers).
+    """
+
+    def __init__(self, attribute_file: str, interval: float = 0.005):
+        self.attribute_file = os.path.abspath(attribute_file)
+        self.interval = interval
+        self.stacks = Counter()  # (labels outermost first, handler) -> samples
+        self.samples = 0
+        self.idle = 0
+        self.started = None
+        self.duration = 0.0
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, target_thread_id: int, seconds: float):
+        if self.running:
+            raise RuntimeError("A profile is already running")
+        self.stacks.clear()
+        self.samples = self.idle = 0
+        self.started = time.time()
+        self.duration = seconds
+        self._thread = threading.Thread(
+            target=self._run, args=(target_thread_id, time.monotonic() + seconds), name="profiler", daemon=True
+        )
+        self._thread.start()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, target_thread_id: int, deadline: float):
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(target_thread_id)
+            if frame is None:
+                break
+            self._record(frame)
+            del frame
+            time.sleep(self.interval)
+
+    def _record(self, frame):
+        self.samples += 1
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS:
+            self.idle += 1
+            return
+        labels = []
+        handler = None
+        while frame is not None:
+            code = frame.f_code
+            labels.append(_label(code))
+            if handler is None and code.co_filename == self.attribute_file:
+                handler = code.co_name
+            frame = frame.f_back
+        labels.reverse()
+        self.stacks[(tuple(labels), handler)] += 1
+
+    def summary(self, top: int = 10) -> dict:
+        own, total, handlers = Counter(), Counter(), Counter()
+        for (labels, handler), count in self.stacks.items():
+            own[labels[-1]] += count
+            for label in set(labels):
+                total[label] += count
+            handlers[handler or "(outside handlers)"] += count
+        return {
+            'samples': self.samples, 'idle': self.idle, 'seconds': self.duration,
+            'own': own.most_common(top), 'total': total.most_common(top), 'handlers': handlers.most_common(top)
+        }
+
+    def folded(self) -> str:
+        """Collapsed stacks ("a;b;c count"), the input format of flamegraph.pl and speedscope"""
+        return "".join(f"{';'.join(labels)} {count}\n" for (labels, _), count in self.stacks.most_common())
+
+
+class HeapTracker:
+    """tracemalloc snapshots diffed against a baseline.
+
+    tracemalloc slows every allocation down, so it only runs between
+    `start()` and `stop()`.
+    """
+
+    def __init__(self, attribute_file: str, frames: int = 16):
+        self.attribute_file = os.path.abspath(attribute_file)
+        self.frames = frames
+        self.baseline = None
+        self._ranges = None
+
+    @property
+    def running(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.baseline = None
+        tracemalloc.stop()
+
+    def _handler(self, traceback):
+        """Innermost function of `attribute_file` on the allocating stack, or None"""
+        if self._ranges is None:
+            self._ranges = function_ranges(self.attribute_file)
+        # tracemalloc tracebacks run oldest frame first
+        for frame in reversed(traceback):
+            if frame.filename == self.attribute_file:
+                enclosing = [r for r in self._ranges if r[0] <= frame.lineno <= r[1]]
+                return max(enclosing)[2] if enclosing else "<module>"
+        return None
+
+    def diff(self, top: int = 10) -> list:
+        """[(site, handler or None, size diff, count diff), ...] largest growth first"""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+        ])
+        grouped = {}
+        for stat in snapshot.compare_to(self.baseline, 'traceback'):
+            frame = stat.traceback[-1]
+            key = (f"{os.path.basename(frame.filename)}:{frame.lineno}", self._handler(stat.traceback))
+            size, count = grouped.get(key, (0, 0))
+            grouped[key] = (size + stat.size_diff, count + stat.count_diff)
+        ranked = sorted(grouped.items(), key=lambda item: -item[1][0])[:top]
+        return [(site, handler, size, count) for (site, handler), (size, count) in ranked]
+
+    def current(self):
+        """(traced bytes now, peak traced bytes)"""
+        return tracemalloc.get_traced_memory()
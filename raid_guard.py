@@ -0,0 +1,105 @@
+import time
+
+from session_store import SessionStore
+
+
+class SlidingWindowCounter:
+    """Event count over the last `window` seconds in `buckets` fixed slots.
+
+    Memory is constant, and `add` and `count` are O(1) amortised: expired
+    slots are zeroed as the clock passes them and the running total is
+    adjusted. Events are only as precise as one slot (window / buckets).
+    """
+
+    __slots__ = ('slot_width', 'counts', 'total', 'slot')
+
+    def __init__(self, window: float = 60, buckets: int = 12, now: float = 0.0):
+        self.slot_width = window / buckets
+        self.counts = [0] * buckets
+        self.total = 0
+        self.slot = int(now / self.slot_width)
+
+    def _advance(self, now: float):
+        slot = int(now / self.slot_width)
+        if slot - self.slot >= len(self.counts):
+            self.counts = [0] * len(self.counts)
+            self.total = 0
+        else:
+            for s in range(self.slot + 1, slot + 1):
+                i = s % len(self.counts)
+                self.total -= self.counts[i]
+                self.counts[i] = 0
+        self.slot = max(self.slot, slot)
+
+    def add(self, now: float, n: int = 1):
+        self._advance(now)
+        self.counts[self.slot % len(self.counts)] += n
+        self.total += n
+
+    def count(self, now: float) -> int:
+        self._advance(now)
+        return self.total
+
+
+class RaidDetector:
+    """Per-chat join-rate watch with hysteresis.
+
+    A raid starts when more than `threshold` members join within `window`
+    seconds. It ends once the rate has stayed under half the threshold for
+    `cooldown` seconds. Members who joined in the last `probation` seconds
+    count as new accounts, and callers treat them more strictly while a raid
+    is on.
+    """
+
+    def __init__(self, threshold: int = 15, window: float = 60, cooldown: float = 300,
+                 probation: float = 600, clock=time.monotonic):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rates = {}  # chat_id -> SlidingWindowCounter
+        self.raids = {}  # chat_id -> {'started', 'calm_since', 'joins', 'locked', 'saved_permissions'}
+        self.newcomers = SessionStore(ttl=probation, clock=clock)  # (chat_id, user_id) -> join time
+
+    def record_joins(self, chat_id: int, user_ids) -> bool:
+        """Count new members; True when this pushes the chat into a raid"""
+        now = self.clock()
+        for user_id in user_ids:
+            self.newcomers.set((chat_id, user_id), now)
+        counter = self.rates.get(chat_id)
+        if counter is None:
+            counter = self.rates[chat_id] = SlidingWindowCounter(self.window, now=now)
+        counter.add(now, len(user_ids))
+
+        raid = self.raids.get(chat_id)
+        if raid is not None:
+            raid['joins'] += len(user_ids)
+            return False
+        if counter.count(now) > self.threshold:
+            self.raids[chat_id] = {'started': now, 'calm_since': None, 'joins': counter.count(now),
+                                   'locked': False, 'saved_permissions': None}
+            return True
+        return False
+
+    def in_raid(self, chat_id: int) -> bool:
+        return chat_id in self.raids
+
+    def is_newcomer(self, chat_id: int, user_id: int) -> bool:
+        return (chat_id, user_id) in self.newcomers
+
+    def ended(self) -> list:
+        """Pop raids that have calmed down for `cooldown`: [(chat_id, raid), ...]"""
+        now = self.clock()
+        over = []
+        for chat_id, raid in list(self.raids.items()):
+            if self.rates[chat_id].count(now) * 2 > self.threshold:
+                raid['calm_since'] = None
+            elif raid['calm_since'] is None:
+                raid['calm_since'] = now
+            elif now - raid['calm_since'] >= self.cooldown:
+                over.append((chat_id, self.raids.pop(chat_id)))
+        for chat_id, counter in list(self.rates.items()):
+            if chat_id not in self.raids and counter.count(now) == 0:
+                del self.rates[chat_id]
+        self.newcomers.expire()
+        return over
@@ -0,0 +1,154 @@
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_encoding import encode_image, encode_within_budget
+
+
+class RankCardGenerator:
+    def __init__(self, image_format: str = "png", quality: int = 85, optimize: bool = False, size_budget: int = None):
+        self.image_format = image_format
+        self.quality = quality
+        self.optimize = optimize
+        self.size_budget = size_budget
+        self._fonts = None
+
+    def create_rank_card(self, user_data: dict) -> io.BytesIO:
+        """Create rank card image"""
+        return io.BytesIO(self.encode(self.draw_rank_card(user_data)))
+
+    def create_leaderboard_card(self, entries: list, title: str) -> io.BytesIO:
+        return io.BytesIO(self.encode(self.draw_leaderboard_card(entries, title)))
+
+    def encode(self, image: Image.Image) -> bytes:
+        if self.size_budget:
+            _, _, data = encode_within_budget(image, self.size_budget, self.optimize)
+            return data
+        return encode_image(image, self.image_format, self.quality, self.optimize)
+
+    def load_fonts(self) -> tuple:
+        """(title, normal, small), loaded once per process"""
+        if self._fonts is None:
+            try:
+                self._fonts = tuple(ImageFont.truetype(path, size) for path, size in (
+                    ("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 24),
+                    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 18),
+                    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
+                ))
+            except OSError:
+                self._fonts = (ImageFont.load_default(),) * 3
+        return self._fonts
+
+    def draw_leaderboard_card(self, entries: list, title: str) -> Image.Image:
+        """entries: [{'rank', 'name', 'username', 'level'}, ...], best first"""
+        width, row_height, top = 600, 44, 70
+        height = top + row_height * max(1, len(entries)) + 20
+        image = Image.new('RGB', (width, height), color='#2C2F33')
+        draw = ImageDraw.Draw(image)
+        title_font, normal_font, small_font = self.load_fonts()
+        
+        draw.text((30, 22), title, fill='#FFFFFF', font=title_font)
+        medal_colors = {1: '#FAA61A', 2: '#B9BBBE', 3: '#CD7F32'}
+        for i, entry in enumerate(entries):
+            y = top + i * row_height
+            if i % 2 == 0:
+                draw.rectangle([20, y, width - 20, y + row_height - 4], fill='#36393F')
+            draw.ellipse([30, y + 5, 60, y + 35], fill=medal_colors.get(entry['rank'], '#40444B'))
+            rank_text = str(entry['rank'])
+            bbox = draw.textbbox((0, 0), rank_text, font=small_font)
+            draw.text((45 - (bbox[2] - bbox[0]) // 2, y + 11), rank_text, fill='#FFFFFF', font=small_font)
+            draw.text((75, y + 8), entry['name'][:24], fill='#FFFFFF', font=normal_font)
+            if entry['username']:
+                name_width = draw.textbbox((0, 0), entry['name'][:24], font=normal_font)[2]
+                draw.text((85 + name_width, y + 12), f"@{entry['username']}"[:20], fill='#99AAB5', font=small_font)
+            draw.text((width - 110, y + 10), f"LVL {entry['level']}", fill='#43B581', font=normal_font)
+        if not entries:
+            draw.text((30, top + 10), "No one has earned XP yet", fill='#99AAB5', font=normal_font)
+        return image
+
+    def draw_rank_card(self, user_data: dict) -> Image.Image:
+        width, height = 600, 300
+        image = Image.new('RGB', (width, height), color='#2C2F33')
+        draw = ImageDraw.Draw(image)
+        title_font, normal_font, small_font = self.load_fonts()
+        
+        level = user_data['level']
+        rank = user_data['rank']
+        username = user_data['username']
+        display_name = user_data['name']
+        current_xp = user_data['xp']
+        xp_needed = level * user_data['settings']['xp_per_level']
+        
+        # Draw background
+        draw.rectangle([0, 0, width, height], fill='#2C2F33')
+        
+        # Progress bar
+        progress_bg = [50, 180, width - 50, 200]
+        draw.rectangle(progress_bg, fill='#40444B')
+        
+        progress_width = int((current_xp / xp_needed) * (width - 100))
+        if progress_width > 0:
+            progress_fill = [50, 180, 50 + progress_width, 200]
+            draw.rectangle(progress_fill, fill='#43B581')
+        
+        # Level circle
+        level_circle_pos = (width - 80, 60)
+        level_circle_radius = 30
+        draw.ellipse([
+            level_circle_pos[0] - level_circle_radius,
+            level_circle_pos[1] - level_circle_radius,
+            level_circle_pos[0] + level_circle_radius,
+            level_circle_pos[1] + level_circle_radius
+        ], fill='#7289DA')
+        
+        # User avatar
+        avatar_size = 80
+        avatar_pos = (50, 50)
+        draw.ellipse([
+            avatar_pos[0], avatar_pos[1],
+            avatar_pos[0] + avatar_size, avatar_pos[1] + avatar_size
+        ], fill='#7289DA')
+        
+        # User initial
+        initial = display_name[0].upper() if display_name else "U"
+        try:
+            bbox = draw.textbbox((0, 0), initial, font=title_font)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            x = avatar_pos[0] + (avatar_size - text_width) // 2
+            y = avatar_pos[1] + (avatar_size - text_height) // 2
+            draw.text((x, y), initial, fill='#FFFFFF', font=title_font)
+        except:
+            pass
+        
+        # Text elements
+        draw.text((150, 40), display_name, fill='#FFFFFF', font=title_font)
+        draw.text((150, 75), f"@{username}", fill='#99AAB5', font=small_font)
+        draw.text((level_circle_pos[0] - 25, level_circle_pos[1] - 45), "LEVEL", fill='#99AAB5', font=small_font)
+        draw.text((level_circle_pos[0] - 10, level_circle_pos[1] - 15), str(level), fill='#FFFFFF', font=title_font)
+        draw.text((50, 150), f"RANK #{rank}", fill='#99AAB5', font=small_font)
+        draw.text((width - 200, 150), f"{current_xp} / {xp_needed} XP", fill='#FFFFFF', font=normal_font)
+        
+        progress_percent = int((current_xp / xp_needed) * 100)
+        draw.text((width - 80, 210), f"{progress_percent}%", fill='#99AAB5', font=small_font)
+        return image
+
+
+_generators = {}
+
+
+def generator_for(settings: tuple) -> RankCardGenerator:
+    """The generator for (format, quality, optimize, size_budget). One per settings per process,
+    so fonts load once however many bots or renders use it"""
+    if settings not in _generators:
+        _generators[settings] = RankCardGenerator(*settings)
+    return _generators[settings]
+
+
+def render_rank_card(settings: tuple, user: dict) -> bytes:
+    """Entry points for render_pool's worker processes, which import this module by name"""
+    return generator_for(settings).create_rank_card(user).getvalue()
+
+
+def render_leaderboard_card(settings: tuple, entries: list, title: str) -> bytes:
+    return generator_for(settings).create_leaderboard_card(entries, title).getvalue()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Raised instead of queueing when the pool already has too much work"""
+
+
+def _timed_call(fn, args):
+    # Wall-clock stamps: monotonic clocks are not comparable across processes
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class RenderPool:
+    """Runs CPU-bound rendering off the event loop with a bounded backlog.
+
+    Uses worker processes for real parallelism and falls back to threads when
+    processes cannot be started (or the process pool breaks). Workers start
+    lazily, when the bot already runs threads, so they come from a forkserver
+    (or spawn) rather than a fork of the bot: a fork copies locks other
+    threads hold, and the child can deadlock on them. Functions sent to the
+    pool must therefore live in a module the workers can import by name, and
+    `preload` modules are imported once in the forkserver. At most
+    `max_workers + max_queue` jobs are in flight; beyond that `submit` raises
+    RenderQueueFull so callers can answer with something cheaper.
+    """
+
+    def __init__(self, fn, max_workers: int = 2, max_queue: int = 8, use_processes: bool = True, preload=()):
+        self.fn = fn
+        self.preload = list(preload)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.executor = None
+        self.kind = None
+        self.metrics = {
+            'renders': 0, 'errors': 0, 'fallbacks': 0,
+            'render_time_total': 0.0, 'render_time_max': 0.0,
+            'queue_wait_total': 0.0, 'queue_wait_max': 0.0
+        }
+        self._use_processes = use_processes
+
+    def _ensure_executor(self):
+        if self.executor is not None:
+            return
+        if self._use_processes:
+            try:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._process_context())
+                self.kind = "process"
+                return
+            except (OSError, NotImplementedError, ImportError, ValueError) as e:
+                logger.warning(f"Process pool unavailable, rendering in threads: {e}")
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        self.kind = "thread"
+
+    def _process_context(self):
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('spawn')
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(self.preload)
+        return context
+
+    async def submit(self, *args):
+        return await self.submit_call(self.fn, *args)
+
+    async def submit_call(self, fn, *args):
+        """Like submit() for another module-level function; shares the workers and the backlog limit"""
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.metrics['fallbacks'] += 1
+            raise RenderQueueFull()
+
+        self._ensure_executor()
+        self.in_flight += 1
+        enqueued = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                result, started, finished = await loop.run_in_executor(self.executor, _timed_call, fn, args)
+            except BrokenProcessPool:
+                logger.error("Render process pool broke, switching to threads")
+                self.executor, self._use_processes = None, False
+                self._ensure_executor()
+                result, started, finished = await loop.run_in_executor(self.executor, _timed_call, fn, args)
+        except Exception:
+            self.metrics['errors'] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        self._record(max(0.0, started - enqueued), finished - started)
+        return result
+
+    def _record(self, queue_wait: float, render_time: float):
+        m = self.metrics
+        m['renders'] += 1
+        m['render_time_total'] += render_time
+        m['render_time_max'] = max(m['render_time_max'], render_time)
+        m['queue_wait_total'] += queue_wait
+        m['queue_wait_max'] = max(m['queue_wait_max'], queue_wait)
+
+    def stats(self) -> dict:
+        m = self.metrics
+        renders = max(1, m['renders'])
+        return {
+            'kind': self.kind or "idle", 'in_flight': self.in_flight,
+            'renders': m['renders'], 'errors': m['errors'], 'fallbacks': m['fallbacks'],
+            'render_ms_avg': m['render_time_total'] / renders * 1000, 'render_ms_max': m['render_time_max'] * 1000,
+            'queue_wait_ms_avg': m['queue_wait_total'] / renders * 1000, 'queue_wait_ms_max': m['queue_wait_max'] * 1000
+        }
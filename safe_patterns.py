@@ -0,0 +1,288 @@
+import logging
+import math
+import re
+import time
+from collections import Counter
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+MAX_PATTERN_LENGTH = 256
+REPEAT_LIMIT = 100  # counted repeats above this are treated like * and +
+SPLIT_LIMIT = 16  # most ways overlapping counted repeats may split a message at one position
+# Characters that quantified pieces are compared on: all of ASCII plus a
+# sample of non-ASCII letters, digits, spaces and case-folding oddities
+PROBE = frozenset(chr(c) for c in range(128)) | frozenset("éßñüЖжяαΩ中١٣  😀ſK")
+EMPTY = frozenset()
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+_NOT_REGULAR = {
+    sre_parse.GROUPREF: "backreferences", sre_parse.GROUPREF_EXISTS: "conditional groups",
+    sre_parse.ASSERT: "lookarounds", sre_parse.ASSERT_NOT: "lookarounds",
+}
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: str.isdecimal,
+    sre_parse.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdecimal(),
+    sre_parse.CATEGORY_SPACE: str.isspace,
+    sre_parse.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    sre_parse.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == '_',
+    sre_parse.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == '_'),
+}
+
+
+class UnsafePattern(ValueError):
+    """A pattern outside the subset that matches in linear time"""
+
+
+class _Shape:
+    """What one parsed piece of a pattern can match, as far as the checks need.
+
+    `first` holds the probe characters a match can start with, `chars` every
+    probe character it can consume. `open_start` holds the characters of an
+    unbounded repeat that can begin a match, with only optional pieces
+    before it. `star_chars` is every character some unbounded repeat inside
+    can consume, and `guarded` the part of it whose repeat has something
+    after it that can fail, which is what makes the repeat backtrack.
+    `tail` holds the characters of an optional or variable-length ending,
+    bounded or not. `starred` is set when an unbounded repeat is inside.
+    `live` lists the variable-length repeats, from this piece or before it,
+    that could still be consuming characters where it ends, as (characters,
+    number of lengths) with math.inf for unbounded ones.
+    """
+
+    __slots__ = ('nullable', 'first', 'chars', 'open_start', 'star_chars', 'guarded', 'tail', 'starred',
+                 'ambiguous', 'live')
+
+    def __init__(self, nullable=True, first=EMPTY, chars=EMPTY, open_start=EMPTY, star_chars=EMPTY, guarded=EMPTY,
+                 tail=EMPTY, starred=False, ambiguous=False, live=()):
+        self.nullable = nullable
+        self.first = first
+        self.chars = chars
+        self.open_start = open_start
+        self.star_chars = star_chars
+        self.guarded = guarded
+        self.tail = tail
+        self.starred = starred
+        self.ambiguous = ambiguous
+        self.live = live
+
+
+def _char_set(op, av, ignorecase: bool) -> frozenset:
+    if op is sre_parse.ANY:
+        return PROBE
+    negate = op is sre_parse.NOT_LITERAL or op is sre_parse.IN and bool(av) and av[0][0] is sre_parse.NEGATE
+    if op is not sre_parse.IN:
+        test = lambda ch: ch == chr(av)
+    else:
+        def test(ch):
+            for item_op, item_av in av:
+                if item_op is sre_parse.LITERAL and ch == chr(item_av):
+                    return True
+                if item_op is sre_parse.RANGE and item_av[0] <= ord(ch) <= item_av[1]:
+                    return True
+                if item_op is sre_parse.CATEGORY and _CATEGORIES.get(item_av, bool)(ch):
+                    return True
+            return False
+    if ignorecase:
+        # Case is folded before negating, so [^i] excludes 'I' too. 'ß'.upper() is 'SS': only
+        # single-character case mappings can be matched by one class item
+        matches = lambda ch: any(len(c) == 1 and test(c) for c in (ch, ch.lower(), ch.upper()))
+    else:
+        matches = test
+    return frozenset(ch for ch in PROBE if matches(ch) != negate)
+
+
+def _check_overlap(chars: frozenset, lengths, live):
+    """A repeat over `chars` with `lengths` possible lengths starts while the `live` repeats may
+    still be consuming. Each one that can also take `chars` multiplies the ways to split a
+    failing message: n characters cost n^k steps for k overlapping unbounded repeats"""
+    overlapping = [lengths] + [n for live_chars, n in live if live_chars & chars]
+    if len(overlapping) == 1:
+        return
+    if overlapping.count(math.inf) > 1:
+        raise UnsafePattern("two quantifiers can match the same characters; make one of them specific")
+    if math.prod(n for n in overlapping if n != math.inf) > SPLIT_LIMIT:
+        raise UnsafePattern("counted quantifiers over the same characters split a message too many ways; "
+                            "narrow their ranges")
+
+
+def _sequence(items, ignorecase: bool, live=()) -> _Shape:
+    shape = _Shape()
+    star_chars = EMPTY  # characters the unbounded repeats so far can consume
+    pending = guarded = EMPTY  # repeats with nothing that can fail after them yet, and those with something
+    tail = EMPTY
+    first, chars, open_start = set(), set(), set()
+    for op, av in items:
+        # Overlap counts while the earlier repeat can still reach this piece: a.*b.*c is
+        # polynomial because .* can consume the b, hello\s+world\s+again is not
+        piece = _node(op, av, ignorecase, live)
+        live = piece.live
+        star_chars |= piece.star_chars
+        guarded |= piece.guarded | (pending if not piece.nullable else EMPTY)
+        pending = piece.star_chars | (pending if piece.nullable else EMPTY)
+        tail = piece.tail | (tail if piece.nullable else EMPTY)
+        if shape.nullable:
+            first |= piece.first
+            open_start |= piece.open_start
+        shape.nullable = shape.nullable and piece.nullable
+        chars |= piece.chars
+        shape.starred = shape.starred or piece.starred
+        shape.ambiguous = shape.ambiguous or piece.ambiguous
+    shape.first, shape.chars, shape.open_start = frozenset(first), frozenset(chars), frozenset(open_start)
+    shape.star_chars, shape.guarded, shape.tail, shape.live = star_chars, guarded, tail, live
+    return shape
+
+
+def _node(op, av, ignorecase: bool, live=()) -> _Shape:
+    if op in _NOT_REGULAR:
+        raise UnsafePattern(f"{_NOT_REGULAR[op]} are not supported")
+    if op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN):
+        charset = _char_set(op, av, ignorecase)
+        # Repeats that cannot consume this character end before it
+        return _Shape(nullable=False, first=charset, chars=charset,
+                      live=tuple(entry for entry in live if entry[0] & charset))
+    if op is sre_parse.AT:
+        return _Shape(live=live)
+    if op is sre_parse.SUBPATTERN:
+        _, add_flags, del_flags, body = av
+        if add_flags & re.IGNORECASE:
+            ignorecase = True
+        elif del_flags & re.IGNORECASE:
+            ignorecase = False
+        return _sequence(body, ignorecase, live)
+    if op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+        return _sequence(av, ignorecase, live)
+    if op is sre_parse.BRANCH:
+        branches = [_sequence(branch, ignorecase, live) for branch in av[1]]
+        seen, ambiguous = set(), False
+        for branch in branches:
+            ambiguous = ambiguous or bool(seen & branch.first) or branch.ambiguous
+            seen |= branch.first
+        chars = frozenset().union(*(b.chars for b in branches))
+        nullable = any(b.nullable for b in branches)
+        return _Shape(
+            nullable=nullable, first=frozenset(seen), chars=chars,
+            open_start=frozenset().union(*(b.open_start for b in branches)),
+            star_chars=frozenset().union(*(b.star_chars for b in branches)),
+            guarded=frozenset().union(*(b.guarded for b in branches)),
+            # (?:a|) is a variable-length ending just like a?
+            tail=chars if nullable else frozenset().union(*(b.tail for b in branches)),
+            starred=any(b.starred for b in branches), ambiguous=ambiguous,
+            live=tuple(dict.fromkeys(entry for b in branches for entry in b.live))
+        )
+    if op in _REPEATS:
+        low, high, body = av
+        inner = _sequence(body, ignorecase, live)
+        unbounded = high == sre_parse.MAXREPEAT or high > REPEAT_LIMIT
+        after = inner.live + live if low == 0 or inner.nullable else inner.live
+        if high > low:
+            # Counted repeats split a message too: a{0,100}a{0,100}a{0,100}x tries 100^3 ways
+            lengths = math.inf if unbounded else high - low + 1
+            _check_overlap(inner.chars, lengths, live)
+            after += ((inner.chars, lengths),)
+        if high > 1:
+            # Where one pass may end early and the next pass starts, the same text splits many ways
+            if inner.starred or inner.tail & inner.first:
+                raise UnsafePattern("nested quantifiers like (a+)+ can backtrack exponentially")
+            if inner.ambiguous:
+                raise UnsafePattern("a repeated group has alternatives that start the same way")
+        shape = _Shape(
+            nullable=low == 0 or inner.nullable, first=inner.first, chars=inner.chars,
+            tail=inner.chars if high > low else inner.tail, starred=unbounded or inner.starred,
+            star_chars=inner.star_chars | inner.chars if unbounded else inner.star_chars, guarded=inner.guarded,
+            live=tuple(dict.fromkeys(after))
+        )
+        if unbounded:
+            shape.open_start = inner.chars
+        return shape
+    raise UnsafePattern(f"unsupported construct {op}")
+
+
+def check_pattern(pattern: str, flags: int = 0):
+    """Raise UnsafePattern (or re.error) unless `pattern` is in the linear-time subset.
+
+    The subset is regular expressions without backreferences, conditionals
+    and lookarounds, and without the shapes that make a backtracking engine
+    blow up: nested quantifiers, repeated groups whose alternatives overlap,
+    and two unbounded quantifiers that can consume the same characters with
+    nothing between them that the first one cannot consume too. Counted
+    quantifiers like {1,100} over the same characters may not multiply to
+    more than SPLIT_LIMIT ways to split a message.
+    A search also retries an unanchored pattern at every position, which
+    counts as one more quantifier: such a pattern may not start with one,
+    nor repeat the characters it starts with ahead of something that can
+    fail, as a\w*z does.
+    """
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise UnsafePattern(f"longer than {MAX_PATTERN_LENGTH} characters")
+    parsed = sre_parse.parse(pattern, flags)
+    items = list(parsed)
+    shape = _sequence(items, bool(parsed.state.flags & re.IGNORECASE))
+    anchored = (items and items[0] == (sre_parse.AT, sre_parse.AT_BEGINNING_STRING)
+                or items[:1] == [(sre_parse.AT, sre_parse.AT_BEGINNING)] and not parsed.state.flags & re.MULTILINE)
+    if shape.open_start and not anchored:
+        raise UnsafePattern("starts with a quantifier, which is retried at every position; anchor it with ^")
+    if shape.first & shape.guarded and not anchored:
+        raise UnsafePattern("a quantifier repeats the characters the pattern starts with, so every position "
+                            "retries it; exclude them from the quantifier or anchor with ^")
+
+
+def compile_safe(pattern: str, flags: int = 0) -> re.Pattern:
+    check_pattern(pattern, flags)
+    return re.compile(pattern, flags)
+
+
+class PatternBudget:
+    """Time budget for matching a list of patterns against one message.
+
+    Each search is timed. A search that takes longer than `budget` seconds
+    on its own is a strike against that pattern, and after `strikes` strikes
+    the pattern is disabled. Once the whole message has used up the budget,
+    the remaining patterns are skipped. Python's re cannot be interrupted,
+    so the budget bounds repeat offenders rather than a single search;
+    check_pattern is what keeps a single search linear.
+    """
+
+    def __init__(self, budget: float = 0.005, strikes: int = 3, clock=time.perf_counter):
+        self.budget = budget
+        self.max_strikes = strikes
+        self.clock = clock
+        self.strikes = Counter()
+        self.disabled = {}  # pattern -> seconds its slowest search took
+        self.stats = {'messages': 0, 'cut_short': 0, 'slowest_ms': 0.0, 'slowest': None}
+
+    def first_match(self, patterns, text: str):
+        """`patterns` holds (source, compiled, payload); payload of the first live one matching `text`"""
+        self.stats['messages'] += 1
+        started = self.clock()
+        for source, compiled, payload in patterns:
+            if source in self.disabled:
+                continue
+            before = self.clock()
+            match = compiled.search(text)
+            now = self.clock()
+            if now - before > self.budget:
+                self._strike(source, now - before)
+            if (now - before) * 1000 > self.stats['slowest_ms']:
+                self.stats['slowest_ms'], self.stats['slowest'] = (now - before) * 1000, source
+            if match:
+                return payload
+            if now - started > self.budget:
+                self.stats['cut_short'] += 1
+                return None
+        return None
+
+    def _strike(self, source: str, elapsed: float):
+        self.strikes[source] += 1
+        if self.strikes[source] >= self.max_strikes:
+            self.disabled[source] = elapsed
+            logger.warning(f"Pattern {source!r} disabled after {self.strikes[source]} searches over "
+                           f"{self.budget * 1000:.0f} ms (last {elapsed * 1000:.1f} ms)")
+
+    def enable(self, source: str):
+        self.disabled.pop(source, None)
+        self.strikes.pop(source, None)
@@ -0,0 +1,127 @@
+import time
+
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_LEVELS = 4  # 64**4 ticks: about 194 days at one-second ticks
+
+_MISSING = object()
+
+
+class TimingWheel:
+    """Hierarchical timing wheel keyed by integer ticks.
+
+    Scheduling and cancelling are O(1); each entry is cascaded down at most
+    WHEEL_LEVELS - 1 times before it fires, so expiry is O(1) amortised.
+    Cancelled or rescheduled entries are left in their old slot and skipped
+    when that slot is reached.
+    """
+
+    def __init__(self, start_tick: int = 0):
+        self.tick = start_tick
+        self.deadlines = {}
+        self.slots = [[[] for _ in range(WHEEL_SIZE)] for _ in range(WHEEL_LEVELS)]
+
+    def schedule(self, key, deadline: int):
+        deadline = max(deadline, self.tick + 1)
+        self.deadlines[key] = deadline
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def _place(self, key, deadline: int):
+        delta = deadline - self.tick
+        for level in range(WHEEL_LEVELS):
+            if delta < WHEEL_SIZE ** (level + 1):
+                slot = (deadline >> (WHEEL_BITS * level)) & (WHEEL_SIZE - 1)
+                break
+        else:
+            # Beyond the wheel's span: park in the top slot that cascades last
+            level = WHEEL_LEVELS - 1
+            last = self.tick + WHEEL_SIZE ** WHEEL_LEVELS - 1
+            slot = (last >> (WHEEL_BITS * level)) & (WHEEL_SIZE - 1)
+        self.slots[level][slot].append((key, deadline))
+
+    def advance(self, tick: int) -> list:
+        """Move the wheel to `tick` and return the keys that expired"""
+        expired = []
+        while self.tick < tick:
+            self.tick += 1
+            for level in range(WHEEL_LEVELS - 1, 0, -1):
+                if self.tick % (WHEEL_SIZE ** level) == 0:
+                    slot = (self.tick >> (WHEEL_BITS * level)) & (WHEEL_SIZE - 1)
+                    entries, self.slots[level][slot] = self.slots[level][slot], []
+                    for key, deadline in entries:
+                        if self.deadlines.get(key) == deadline:
+                            self._place(key, deadline)
+
+            slot = self.tick & (WHEEL_SIZE - 1)
+            entries, self.slots[0][slot] = self.slots[0][slot], []
+            for key, deadline in entries:
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    expired.append(key)
+        return expired
+
+
+class SessionStore:
+    """Dict-like store whose entries expire `ttl` seconds after they are set.
+
+    Reads treat overdue entries as missing straight away; `expire()` (called
+    from one periodic job) advances the wheel, drops them and returns the
+    expired (key, value) pairs so the owner can announce timeouts.
+    """
+
+    def __init__(self, ttl: float, resolution: float = 1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.resolution = resolution
+        self.clock = clock
+        self._data = {}
+        self._wheel = TimingWheel(self._tick())
+
+    def _tick(self, now: float = None) -> int:
+        return int((self.clock() if now is None else now) / self.resolution)
+
+    def _alive(self, key) -> bool:
+        deadline = self._wheel.deadlines.get(key)
+        return deadline is not None and deadline > self._tick()
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = value
+        self.touch(key, ttl)
+
+    def touch(self, key, ttl: float = None):
+        """Push the entry's expiry back to `ttl` seconds from now"""
+        ttl = self.ttl if ttl is None else ttl
+        self._wheel.schedule(key, self._tick() + max(1, round(ttl / self.resolution)))
+
+    def get(self, key, default=None):
+        return self._data[key] if self._alive(key) else default
+
+    def pop(self, key, default=None):
+        self._wheel.cancel(key)
+        return self._data.pop(key, default)
+
+    def expire(self, now: float = None) -> list:
+        return [(key, self._data.pop(key)) for key in self._wheel.advance(self._tick(now))]
+
+    def items(self):
+        return [(key, value) for key, value in self._data.items() if self._alive(key)]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        if not self._alive(key):
+            raise KeyError(key)
+        return self._data[key]
+
+    def __delitem__(self, key):
+        if self.pop(key, _MISSING) is _MISSING:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._alive(key)
+
+    def __len__(self):
+        return len(self._data)
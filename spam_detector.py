@@ -0,0 +1,132 @@
+import re
+import time
+from operator import eq
+from collections import OrderedDict, deque
+
+SIGNATURE_SIZE = 32
+BAND_ROWS = 2
+BANDS = SIGNATURE_SIZE // BAND_ROWS
+SHINGLE_SIZE = 4
+MASK = (1 << 64) - 1
+
+_NORMALIZE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    return _NORMALIZE.sub(' ', text.lower()).strip()
+
+
+def minhash(text: str) -> tuple:
+    """One-permutation MinHash of the character shingles of `text`.
+
+    Each shingle is hashed once and only lowers the minimum of its own bin,
+    so a signature costs O(len(text)) rather than O(len(text) * bins).
+    Empty bins borrow from the next filled bin so short messages still
+    compare position by position.
+    """
+    signature = [MASK] * SIGNATURE_SIZE
+    for i in range(max(1, len(text) - SHINGLE_SIZE + 1)):
+        h = hash(text[i:i + SHINGLE_SIZE]) & MASK
+        b = h % SIGNATURE_SIZE
+        if h < signature[b]:
+            signature[b] = h
+
+    if MASK in signature:
+        # Walk right-to-left twice around the ring carrying the last filled bin
+        borrowed = MASK
+        for i in range(2 * SIGNATURE_SIZE - 1, -1, -1):
+            value = signature[i % SIGNATURE_SIZE]
+            if value != MASK:
+                borrowed = value
+            elif i < SIGNATURE_SIZE:
+                signature[i] = borrowed
+    return tuple(signature)
+
+
+def similarity(a: tuple, b: tuple) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(map(eq, a, b)) / SIGNATURE_SIZE
+
+
+class ChatWindow:
+    """Ring buffer of recent signatures with an LSH band index for candidates"""
+
+    def __init__(self, size: int):
+        self.entries = deque()
+        self.size = size
+        self.buckets = {}
+
+    @staticmethod
+    def _bands(signature: tuple):
+        return [(b, signature[b * BAND_ROWS:(b + 1) * BAND_ROWS]) for b in range(BANDS)]
+
+    def evict(self, cutoff: float):
+        while self.entries and (len(self.entries) >= self.size or self.entries[0][2] < cutoff):
+            entry = self.entries.popleft()
+            for band in self._bands(entry[0]):
+                bucket = self.buckets[band]
+                bucket.remove(entry)
+                if not bucket:
+                    del self.buckets[band]
+
+    def candidates(self, signature: tuple):
+        seen = set()
+        for band in self._bands(signature):
+            for entry in self.buckets.get(band, ()):
+                if id(entry) not in seen:
+                    seen.add(id(entry))
+                    yield entry
+
+    def add(self, entry: tuple):
+        self.entries.append(entry)
+        for band in self._bands(entry[0]):
+            self.buckets.setdefault(band, []).append(entry)
+
+
+class NearDuplicateDetector:
+    """Flags messages that near-duplicate recent messages from several users.
+
+    Memory is bounded by `window_size` signatures per chat and `max_chats`
+    chats (the least recently active chat is dropped first).
+    """
+
+    def __init__(self, window_size: int = 256, window_seconds: int = 600, min_similarity: float = 0.45,
+                 min_users: int = 3, min_length: int = 20, max_chats: int = 10000):
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.min_similarity = min_similarity
+        self.min_users = min_users
+        self.min_length = min_length
+        self.max_chats = max_chats
+        self.chats = OrderedDict()
+
+    def _window(self, chat_id: int) -> ChatWindow:
+        window = self.chats.get(chat_id)
+        if window is None:
+            window = self.chats[chat_id] = ChatWindow(self.window_size)
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        return window
+
+    def check(self, chat_id: int, user_id: int, text: str, now: float = None) -> bool:
+        """Record a message and return True when it belongs to a spam wave"""
+        text = normalize(text)
+        if len(text) < self.min_length:
+            return False
+
+        now = time.time() if now is None else now
+        signature = minhash(text)
+        window = self._window(chat_id)
+        window.evict(now - self.window_seconds)
+
+        senders = {user_id}
+        for other, sender, _ in window.candidates(signature):
+            if sender not in senders and similarity(signature, other) >= self.min_similarity:
+                senders.add(sender)
+                if len(senders) >= self.min_users:
+                    break
+
+        window.add((signature, user_id, now))
+        return len(senders) >= self.min_users
@@ -0,0 +1,134 @@
+import heapq
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarningLedger:
+    """Warnings per (chat_id, user_id) that expire `decay` seconds after they
+    were issued.
+
+    Only issue times are stored. Expired ones are dropped when the key is
+    next read, so decay needs no timers or per-user jobs.
+    """
+
+    def __init__(self, decay: float, clock=time.time):
+        self.decay = decay
+        self.clock = clock
+        self.issued = {}  # (chat_id, user_id) -> issue times, oldest first
+
+    def _active(self, key: tuple, now: float) -> list:
+        times = self.issued.get(key)
+        if not times:
+            return []
+        cutoff = now - self.decay
+        if times[0] <= cutoff:
+            times = [t for t in times if t > cutoff]
+            if times:
+                self.issued[key] = times
+            else:
+                del self.issued[key]
+        return times
+
+    def count(self, key: tuple) -> int:
+        return len(self._active(key, self.clock()))
+
+    def add(self, key: tuple) -> int:
+        """Issue a warning; returns the number of active warnings"""
+        now = self.clock()
+        times = self._active(key, now)
+        times.append(now)
+        self.issued[key] = times
+        return len(times)
+
+    def clear(self, key: tuple):
+        self.issued.pop(key, None)
+
+    def purge(self) -> int:
+        """Drop keys whose warnings have all lapsed but were never read again"""
+        cutoff = self.clock() - self.decay
+        stale = [key for key, times in self.issued.items() if times[-1] <= cutoff]
+        for key in stale:
+            del self.issued[key]
+        return len(stale)
+
+    def next_expiry(self, key: tuple):
+        """Seconds until the oldest active warning lapses, or None"""
+        now = self.clock()
+        times = self._active(key, now)
+        return times[0] + self.decay - now if times else None
+
+
+class PunishmentQueue:
+    """Timed mutes and bans ordered by expiry, persisted to a JSON file.
+
+    The file is rewritten atomically on every change. Punishments are rare,
+    so this is cheap. After a restart, pending lifts and each user's strike
+    count are loaded back, and so are raid lockdowns with the chat
+    permissions to restore, which would otherwise leave a chat muted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.heap = []  # (until, chat_id, user_id, action)
+        self.strikes = {}  # (chat_id, user_id) -> punishments so far
+        self.lockdowns = {}  # chat_id -> permissions to restore, as ChatPermissions.to_dict()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            heap = [tuple(entry) for entry in data['pending']]
+            strikes = {(chat_id, user_id): n for chat_id, user_id, n in data['strikes']}
+            lockdowns = {chat_id: permissions for chat_id, permissions in data.get('lockdowns', [])}
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            # A half-written or hand-edited file must not stop the bot from starting
+            logger.error(f"Ignoring unreadable punishments file {self.path}: {e}")
+            return
+        heapq.heapify(heap)
+        self.heap, self.strikes, self.lockdowns = heap, strikes, lockdowns
+
+    def _save(self):
+        data = {
+            'pending': self.heap,
+            'strikes': [[chat_id, user_id, n] for (chat_id, user_id), n in self.strikes.items()],
+            'lockdowns': [[chat_id, permissions] for chat_id, permissions in self.lockdowns.items()]
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, chat_id: int, user_id: int, action: str, until: float):
+        key = (chat_id, user_id)
+        self.strikes[key] = self.strikes.get(key, 0) + 1
+        heapq.heappush(self.heap, (until, chat_id, user_id, action))
+        self._save()
+
+    def lock(self, chat_id: int, permissions: dict):
+        self.lockdowns[chat_id] = permissions
+        self._save()
+
+    def unlock(self, chat_id: int):
+        if self.lockdowns.pop(chat_id, None) is not None:
+            self._save()
+
+    def due(self, now: float = None) -> list:
+        """Pop every punishment whose time is up: [(chat_id, user_id, action), ...]"""
+        now = time.time() if now is None else now
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            _, chat_id, user_id, action = heapq.heappop(self.heap)
+            expired.append((chat_id, user_id, action))
+        if expired:
+            self._save()
+        return expired
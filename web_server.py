@@ -1,15 +1,107 @@
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, Response, render_template, request, abort, jsonify
+from jinja2 import TemplateNotFound
+import logging
 import os
+from asset_pipeline import AssetPipeline, StaticAsset
+from leaderboard import read_snapshot
+from log_setup import setup_logging
 
-app = Flask(__name__)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.environ.get("STATIC_DIR", os.path.join(BASE_DIR, "Static"))
+TEMPLATE_DIR = os.environ.get("TEMPLATE_DIR", os.path.join(BASE_DIR, "templates"))
+LEADERBOARD_SNAPSHOT_DIR = os.environ.get("LEADERBOARD_SNAPSHOT_DIR", "leaderboards")
+LEADERBOARD_MAX_LIMIT = 100
+MEMORY_REPORT_PATH = os.environ.get("MEMORY_REPORT_PATH", "memory_report.json")
+
+# Flask's own static route would shadow ours and read from disk on every hit
+app = Flask(__name__, static_folder=None, template_folder=TEMPLATE_DIR)
+assets = AssetPipeline(STATIC_DIR)
+logger = logging.getLogger(__name__)
+
+def build_landing_page():
+    """Render index.html once, pointing it at content-hashed asset URLs"""
+    try:
+        with app.app_context():
+            html = render_template('index.html')
+    except TemplateNotFound:
+        logger.warning(f"index.html not found in {TEMPLATE_DIR}, landing page disabled")
+        return None
+    return StaticAsset('index.html', assets.rewrite_urls(html).encode('utf-8'), 'text/html')
+
+landing_page = build_landing_page()
+
+def serve_asset(asset, immutable: bool) -> Response:
+    status, body, headers = assets.response_parts(
+        asset, request.headers.get('Accept-Encoding', ''),
+        request.headers.get('If-None-Match', ''), immutable
+    )
+    return Response(body, status=status, headers=headers)
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    if landing_page is None:
+        abort(404)
+    return serve_asset(landing_page, immutable=False)
 
 @app.route('/static/<path:path>')
 def send_static(path):
-    return send_from_directory('static', path)
+    asset, hashed = assets.lookup(path)
+    if asset is None:
+        abort(404)
+    return serve_asset(asset, immutable=hashed)
+
+# Written by the bot process every 30s (one file per chat plus global.json);
+# each is loaded on first request and reloaded when the file changes
+leaderboard_states = {}
+
+def current_leaderboard(name: str):
+    path = os.path.join(LEADERBOARD_SNAPSHOT_DIR, f"{name}.json")
+    state = leaderboard_states.get(name)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return state
+    if state is None or mtime != state['mtime']:
+        index, users = read_snapshot(path)
+        state = leaderboard_states[name] = {'mtime': mtime, 'index': index, 'users': users}
+    return state
+
+@app.route('/api/leaderboard')
+@app.route('/api/leaderboard/<int(signed=True):chat_id>')
+def leaderboard_api(chat_id=None):
+    state = current_leaderboard('global' if chat_id is None else str(chat_id))
+    if state is None:
+        abort(404)
+    index = state['index']
+    limit = min(max(request.args.get('limit', 10, type=int), 1), LEADERBOARD_MAX_LIMIT)
+    around = request.args.get('around', type=int)
+    if around is not None:
+        if around not in index:
+            abort(404)
+        offset = index.offset_around(around, limit)
+    else:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+    def build():
+        return {
+            'version': index.version, 'total': len(index), 'offset': offset, 'limit': limit,
+            'users': [
+                {'rank': rank, **{k: state['users'][uid][k] for k in ('user_id', 'name', 'username', 'level', 'xp')}}
+                for rank, uid in index.page(offset, limit)
+            ]
+        }
+
+    return jsonify(index.cached(('page', offset, limit), build))
+
+# Written by the bot's check_memory job every MEMORY_CHECK_INTERVAL
+@app.route('/api/memory')
+def memory_api():
+    try:
+        with open(MEMORY_REPORT_PATH, encoding='utf-8') as f:
+            return Response(f.read(), mimetype='application/json', headers={'Cache-Control': 'no-cache'})
+    except FileNotFoundError:
+        abort(404)
 
 if __name__ == '__main__':
+    setup_logging(logging.INFO, json_format=os.environ.get("LOG_FORMAT", "text") == "json")
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,167 @@
+"""Compact on-disk word bank for /wordgame.
+
+Layout (little-endian):
+
+    b'RWB1' | u32 entries | u32 categories | u32 categories_offset | u32 index_offset
+    index:      u32 record offset per entry, grouped by category
+    categories: per category u8 name length, name, u32 first entry, u32 end entry
+    records:    u8 field count, then per field u16 length + UTF-8 bytes
+                (word, hint, then the precomputed /hint lines)
+
+Entries are grouped by category so each category is one contiguous range of
+the index, and a random pick is one random integer plus one record read.
+
+Build a bank from JSON lines ({"word", "hint", "category"}) or TSV
+(word<TAB>hint<TAB>category):
+
+    python word_bank.py build words.jsonl word_bank.wbk
+"""
+import json
+import mmap
+import random
+import struct
+import sys
+from bisect import bisect_right
+
+MAGIC = b'RWB1'
+HEADER = struct.Struct('<4sIIII')
+U32 = struct.Struct('<I')
+U16 = struct.Struct('<H')
+RANGE = struct.Struct('<II')
+
+
+def precompute_hints(word: str, category: str) -> list:
+    return [
+        f"📏 Word has {len(word)} letters", f"🔤 Starts with '{word[0]}'",
+        f"🏷️ Category: {category}", f"🎯 Letters: {', '.join(sorted(set(word)))}",
+        f"🔍 Try: {word[0]}{'_' * (len(word) - 2)}{word[-1]}"
+    ]
+
+
+def build_bytes(entries) -> bytes:
+    by_category = {}
+    for entry in entries:
+        word = entry['word'].strip().lower()
+        if word:
+            by_category.setdefault(entry['category'].strip().lower(), []).append((word, entry['hint'].strip()))
+
+    records = bytearray()
+    offsets = []
+    ranges = []
+    for category, words in by_category.items():
+        start = len(offsets)
+        for word, hint in words:
+            offsets.append(len(records))
+            fields = [word, hint] + precompute_hints(word, category)
+            records.append(len(fields))
+            for field in fields:
+                encoded = field.encode('utf-8')
+                records += U16.pack(len(encoded)) + encoded
+        ranges.append((category, start, len(offsets)))
+
+    categories = bytearray()
+    for category, start, end in ranges:
+        name = category.encode('utf-8')
+        categories += bytes([len(name)]) + name + RANGE.pack(start, end)
+
+    index_offset = HEADER.size
+    categories_offset = index_offset + U32.size * len(offsets)
+    records_offset = categories_offset + len(categories)
+    index = b''.join(U32.pack(records_offset + off) for off in offsets)
+    header = HEADER.pack(MAGIC, len(offsets), len(ranges), categories_offset, index_offset)
+    return header + index + bytes(categories) + bytes(records)
+
+
+def read_entries(path: str):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if path.endswith('.jsonl'):
+                yield json.loads(line)
+            else:
+                word, hint, category = line.split('\t')
+                yield {'word': word, 'hint': hint, 'category': category}
+
+
+class WordBank:
+    """Read-only word bank backed by a memory map (or bytes for small banks).
+
+    Nothing is read until the first lookup, and lookups only touch the pages
+    they need, so startup time and RSS do not grow with the bank size.
+    """
+
+    def __init__(self, path: str = None, data: bytes = None):
+        self.path = path
+        self._buf = data
+        self._categories = None
+
+    @classmethod
+    def from_entries(cls, entries):
+        return cls(data=build_bytes(entries))
+
+    def _load(self):
+        if self._categories is not None:
+            return
+        if self._buf is None:
+            with open(self.path, 'rb') as f:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count, category_count, pos, self._index_offset = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a word bank file")
+
+        categories = {}
+        for _ in range(category_count):
+            size = self._buf[pos]
+            name = bytes(self._buf[pos + 1:pos + 1 + size]).decode('utf-8')
+            categories[name] = RANGE.unpack_from(self._buf, pos + 1 + size)
+            pos += 1 + size + RANGE.size
+        self._categories = categories
+        ordered = sorted((start, name) for name, (start, _) in categories.items())
+        self._starts = [start for start, _ in ordered]
+        self._start_names = [name for _, name in ordered]
+
+    @property
+    def categories(self) -> list:
+        self._load()
+        return list(self._categories)
+
+    def __len__(self):
+        self._load()
+        return self._count
+
+    def entry(self, i: int) -> dict:
+        self._load()
+        pos = U32.unpack_from(self._buf, self._index_offset + U32.size * i)[0]
+        fields = []
+        for _ in range(self._buf[pos]):
+            size = U16.unpack_from(self._buf, pos + 1)[0]
+            fields.append(bytes(self._buf[pos + 3:pos + 3 + size]).decode('utf-8'))
+            pos += U16.size + size
+        category = self._start_names[bisect_right(self._starts, i) - 1]
+        return {'word': fields[0], 'hint': fields[1], 'category': category, 'hints': fields[2:]}
+
+    def random_entry(self, category: str = None):
+        """O(1) random pick, optionally within one category; None if empty"""
+        self._load()
+        if category is None:
+            start, end = 0, self._count
+        elif category in self._categories:
+            start, end = self._categories[category]
+        else:
+            return None
+        if start == end:
+            return None
+        return self.entry(random.randrange(start, end))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        sys.exit("Usage: python word_bank.py build <words.jsonl|words.tsv> <output.wbk>")
+    data = build_bytes(read_entries(sys.argv[2]))
+    with open(sys.argv[3], 'wb') as f:
+        f.write(data)
+    bank = WordBank(data=data)
+    print(f"Wrote {len(bank)} words in {len(bank.categories)} categories to {sys.argv[3]}")